@@ -8,25 +8,38 @@ from platformdirs import PlatformDirs
 from sentry_sdk import capture_exception
 
 from card_automation_server.config import Config
+from card_automation_server.metrics import Metrics
 from ioc import Resolver
 from card_automation_server.plugin_loader import PluginLoader
 from card_automation_server.windsx.db.engine_factory import EngineFactory
+from card_automation_server.windsx.db.mirror import AcsMirror
+from card_automation_server.windsx.db.scheduler import DbScheduler
 from card_automation_server.windsx.engines import AcsEngine, LogEngine
 from card_automation_server.windsx.lookup.access_card import AccessCardLookup
+from card_automation_server.windsx.lookup.access_sync import AccessSync
 from card_automation_server.windsx.lookup.acl_group_combo import AclGroupComboLookup
+from card_automation_server.windsx.lookup.download_staging import DownloadStager
 from card_automation_server.windsx.lookup.holiday import HolidayLookup
 from card_automation_server.windsx.lookup.person import PersonLookup
 from card_automation_server.windsx.lookup.timezone import TimezoneLookup
 from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.access_auditor import AccessAuditWorker
+from card_automation_server.workers.access_recomputer import AccessRecomputer
+from card_automation_server.workers.acs_change_detector import AcsChangeDetector
+from card_automation_server.workers.acs_mirror_worker import AcsMirrorWorker
 from card_automation_server.workers.card_pushed_watcher import CardPushedWatcher
 from card_automation_server.workers.card_scan_watcher import CardScanWatcher
 from card_automation_server.workers.comm_server_restarter import CommServerRestarter
 from card_automation_server.workers.comm_server_socket_listener import CommServerSocketListener
 from card_automation_server.workers.database_file_watcher import DatabaseFileWatcher
 from card_automation_server.workers.door_override_controller import DoorOverrideController
+from card_automation_server.workers.download_staging_worker import DownloadStagingWorker
 from card_automation_server.workers.dsx_hardware_reset_worker import DSXHardwareResetWorker
 from card_automation_server.workers.expired_holiday_cleaner import ExpiredHolidayCleaner
 from card_automation_server.workers.github_watcher import GitHubWatcher
+from card_automation_server.workers.metrics_reporter import MetricsReporter
+from card_automation_server.workers.orphaned_access_cleaner import OrphanedAccessCleaner
+from card_automation_server.workers.reference_data_invalidator import ReferenceDataInvalidator
 from card_automation_server.workers.restart_file_watcher import RestartFileWatcher
 from card_automation_server.workers.update_callback_watcher import UpdateCallbackWatcher
 from card_automation_server.workers.worker_event_loop import WorkerEventLoop
@@ -44,26 +57,56 @@ class CardAutomationServer:
 
         self._logger.info("Application Starting")
 
+        metrics = self._resolver.singleton(Metrics)
+
         self._worker_event_loop = self._resolver.singleton(WorkerEventLoop)
         self._worker_event_loop.start()
 
         # Create our type hinted engines
-        acs_engine = EngineFactory.microsoft_access(self._config.windsx.acs_data_db_path)
+        acs_engine = EngineFactory.microsoft_access(self._config.windsx.acs_data_db_path,
+                                                    pooled=self._config.windsx.connection_pooling,
+                                                    max_connection_lifetime=self._config.windsx.connection_max_lifetime,
+                                                    metrics=metrics,
+                                                    logger=self._logger,
+                                                    slow_query_seconds=self._config.windsx.slow_query_seconds)
         self._resolver.singleton(AcsEngine, acs_engine)
-        log_engine = EngineFactory.microsoft_access(self._config.windsx.log_db_path)
+        log_engine = EngineFactory.microsoft_access(self._config.windsx.log_db_path,
+                                                    pooled=self._config.windsx.connection_pooling,
+                                                    max_connection_lifetime=self._config.windsx.connection_max_lifetime,
+                                                    metrics=metrics,
+                                                    logger=self._logger,
+                                                    slow_query_seconds=self._config.windsx.slow_query_seconds)
         self._resolver.singleton(LogEngine, log_engine)
 
         # Needed to create LookupInfo object
         update_callback_watcher = self._resolver.singleton(UpdateCallbackWatcher)
+        scheduler = self._resolver.singleton(DbScheduler, DbScheduler(
+            max_concurrent=self._config.windsx.max_concurrent_db_transactions or None,
+            metrics=metrics,
+            wait_timeout_seconds=self._config.windsx.db_transaction_wait_timeout,
+            logger=self._logger,
+        ))
+
+        mirror: Optional[AcsMirror] = None
+        if self._config.windsx.read_mirror_path is not None:
+            mirror_engine = EngineFactory.sqlite_mirror(self._config.windsx.read_mirror_path)
+            mirror = self._resolver.singleton(AcsMirror, AcsMirror(acs_engine, mirror_engine, metrics=metrics))
 
         lookup_info: LookupInfo = self._resolver(LookupInfo,
                                                  location_group_id=self._config.windsx.location_group,
                                                  updated_callback=update_callback_watcher.acs_updated_callback,
+                                                 scheduler=scheduler,
+                                                 mirror=mirror,
                                                  )
         self._resolver.singleton(lookup_info)
 
         # These get carried over to the plugins directly, might as well make them now
         self._resolver.singleton(AccessCardLookup)
+        stager = self._resolver.singleton(DownloadStager, DownloadStager(lookup_info, metrics=metrics))
+        self._resolver.singleton(
+            AccessSync,
+            AccessSync(lookup_info, stager if self._config.windsx.stage_bulk_downloads else None),
+        )
         self._resolver.singleton(AclGroupComboLookup)
         self._resolver.singleton(HolidayLookup)
         self._resolver.singleton(PersonLookup)
@@ -78,10 +121,16 @@ class CardAutomationServer:
             self._resolver.singleton(DSXHardwareResetWorker),
             # When our databases on disk updates
             self._resolver.singleton(DatabaseFileWatcher),
+            # Work out which ACS tables changed when the database updates
+            self._resolver.singleton(AcsChangeDetector),
+            # Drop cached reference data when the ACS database changes under us
+            self._resolver.singleton(ReferenceDataInvalidator),
             # When someone badges in
             self._resolver.singleton(CardScanWatcher),
             # We want to provide updates for when we see a card is pushed out
             self._resolver.singleton(CardPushedWatcher),
+            # Release staged bulk card writes to the controllers as fast as they download them
+            self._resolver.singleton(DownloadStagingWorker),
             # Allow plugins to override their doors
             self._resolver.singleton(DoorOverrideController),
             # Check for updates to the app/plugins
@@ -92,7 +141,20 @@ class CardAutomationServer:
             self._resolver.singleton(RestartFileWatcher),
             # Periodically delete holiday rows whose date has passed
             self._resolver.singleton(ExpiredHolidayCleaner),
+            # Nightly check that every card's Status and LocCards match its access levels
+            self._resolver.singleton(AccessAuditWorker),
+            # Periodically write our metrics out to the log
+            self._resolver.singleton(MetricsReporter),
         )
+        if self._config.windsx.recompute_changed_access:
+            # Update cards' ACLs when the doors an access level covers are changed in WinDSX
+            self._worker_event_loop.add(self._resolver.singleton(AccessRecomputer))
+        if self._config.windsx.compact_orphaned_access:
+            # Periodically delete combos, ACLs and device groups that no card uses anymore
+            self._worker_event_loop.add(self._resolver.singleton(OrphanedAccessCleaner))
+        if mirror is not None:
+            # Keep the local read mirror in step with the ACS database
+            self._worker_event_loop.add(self._resolver.singleton(AcsMirrorWorker))
 
         self._logger.info("Main application loaded")
         plural = "" if len(self._config.plugins) == 1 else ""
@@ -57,6 +57,31 @@ class _WinDSXConfig(ConfigHolder):
 
     common_doors: ConfigProperty[list[int]]
 
+    # How many LocCards can be waiting on a download to one location before we raise DownloadBacklogExceeded
+    download_backlog_threshold: ConfigProperty[int] = 500
+    # Stage the cards an AccessSync changes and release them to the controllers in waves, see DownloadStager. Staged
+    # cards are only kept in memory, so a crash loses any that haven't gone out yet.
+    stage_bulk_downloads: ConfigProperty[bool] = False
+
+    # Keep connections to each MDB open and reuse them, instead of reconnecting for every session
+    connection_pooling: ConfigProperty[bool] = False
+    # Pooled connections older than this many seconds get replaced
+    connection_max_lifetime: ConfigProperty[int] = 300
+    # How many transactions can run against the ACS database at once, see DbScheduler. 0 means there's no limit.
+    max_concurrent_db_transactions: ConfigProperty[int] = 0
+    # With a limit, anything that waits this many seconds for a transaction slot logs a warning and goes ahead anyway
+    db_transaction_wait_timeout: ConfigProperty[float] = 30.0
+    # Queries to the MDB files that take at least this many seconds are logged with their parameters
+    slow_query_seconds: ConfigProperty[float] = 1.0
+    # If set, lookups read from a local SQLite copy of the ACS database kept at this path, see AcsMirror
+    read_mirror_path: ConfigProperty[Path]
+    # Rewrite the LocCards of every card with an access level whose doors are changed in WinDSX, see AccessRecomputer
+    recompute_changed_access: ConfigProperty[bool] = False
+    # Delete combos, ACLs and device groups nothing uses anymore once a day, see AccessCompactor
+    compact_orphaned_access: ConfigProperty[bool] = False
+    # Have the nightly access audit rewrite the cards it finds out of step, instead of only logging them
+    repair_access_discrepancies: ConfigProperty[bool] = False
+
 
 class _SentryConfig(ConfigHolder):
     dsn: ConfigProperty[str]
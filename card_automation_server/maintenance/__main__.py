@@ -0,0 +1,124 @@
+"""
+One-off maintenance tasks against the WinDSX databases. Run these while the server is stopped.
+
+    python -m card_automation_server.maintenance indexes [--create] [--benchmark]
+    python -m card_automation_server.maintenance bulk-keys [--access]
+    python -m card_automation_server.maintenance device-groups
+"""
+import argparse
+import sys
+from typing import Optional
+
+from platformdirs import PlatformDirs
+from sqlalchemy import Engine
+
+from card_automation_server.config import Config
+from card_automation_server.maintenance.bulk_keys import benchmark_bulk_keys, scratch_engine
+from card_automation_server.maintenance.device_groups import benchmark_device_groups
+from card_automation_server.maintenance.indexes import ACS_HOT_PREDICATES, LOG_HOT_PREDICATES, HotPredicate, \
+    inspect_indexes, create_missing_indexes, benchmark
+from card_automation_server.windsx.db.engine_factory import EngineFactory
+
+
+def _print_benchmark(before: dict[HotPredicate, float], after: Optional[dict[HotPredicate, float]]):
+    for predicate, seconds in before.items():
+        line = f"  {str(predicate):<40} {seconds * 1000:9.2f} ms"
+        if after is not None and predicate in after:
+            line += f" -> {after[predicate] * 1000:9.2f} ms"
+        print(line)
+
+
+def _indexes(engine: Engine, name: str, predicates: tuple[HotPredicate, ...], args: argparse.Namespace) -> int:
+    reports = inspect_indexes(engine, predicates)
+
+    print(f"{name}:")
+    for report in reports:
+        status = f"indexed by {report.covered_by}" if report.is_covered else "NOT INDEXED"
+        print(f"  {str(report.predicate):<40} {status}")
+
+    missing = [report for report in reports if not report.is_covered]
+
+    before = benchmark(engine, predicates, args.iterations) if args.benchmark else None
+
+    if args.create and len(missing) > 0:
+        created = create_missing_indexes(engine, missing)
+        for predicate in created:
+            print(f"  Created {predicate.index_name} on {predicate}")
+
+    if before is not None:
+        after = benchmark(engine, predicates, args.iterations) if args.create and len(missing) > 0 else None
+        print(f"{name} benchmark (median of {args.iterations}):")
+        _print_benchmark(before, after)
+
+    # Non-zero when something is still unindexed, so this can be used as a check
+    return 0 if args.create or len(missing) == 0 else 1
+
+
+def _bulk_keys(args: argparse.Namespace, config: Config) -> int:
+    if args.access:
+        name, engine = "ACS database", EngineFactory.microsoft_access(config.windsx.acs_data_db_path)
+    else:
+        name, engine = "SQLite scratch database", scratch_engine()
+
+    print(f"{name}:")
+    for result in benchmark_bulk_keys(engine):
+        print(f"  {result.keys:>6} keys  {result.strategy:<24} {result.seconds * 1000:10.1f} ms  ({result.rows} rows)")
+
+    return 0
+
+
+def _device_groups() -> int:
+    print("SQLite scratch database:")
+    for result in benchmark_device_groups():
+        print(f"  {result.groups:>6} groups  {result.strategy:<20} {result.seconds * 1000:10.1f} ms  "
+              f"({result.matched} matched)")
+
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m card_automation_server.maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    indexes_parser = subparsers.add_parser(
+        "indexes",
+        help="Report which columns our hot queries filter on are missing an index",
+    )
+    indexes_parser.add_argument("--create", action="store_true", help="Create the missing indexes")
+    indexes_parser.add_argument("--benchmark", action="store_true", help="Time the affected lookups")
+    indexes_parser.add_argument("--iterations", type=int, default=20, help="How many times to run each lookup")
+
+    bulk_keys_parser = subparsers.add_parser(
+        "bulk-keys",
+        help="Time looking up 1k/10k/50k cards by ID with each way of sending the keys",
+    )
+    bulk_keys_parser.add_argument("--access", action="store_true",
+                                  help="Run against the ACS database instead of a scratch SQLite database")
+
+    subparsers.add_parser(
+        "device-groups",
+        help="Time matching device sets against thousands of DGRP rows, scanning columns vs the device mask index",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "device-groups":
+        return _device_groups()
+
+    config = Config(PlatformDirs("card-server", "card-automation"))
+
+    if args.command == "indexes":
+        acs_engine = EngineFactory.microsoft_access(config.windsx.acs_data_db_path)
+        log_engine = EngineFactory.microsoft_access(config.windsx.log_db_path)
+
+        result = _indexes(acs_engine, "ACS database", ACS_HOT_PREDICATES, args)
+        return _indexes(log_engine, "Log database", LOG_HOT_PREDICATES, args) or result
+
+    if args.command == "bulk-keys":
+        return _bulk_keys(args, config)
+
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import Engine, select, insert, text
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.bulk_keys import scalars_in
+from card_automation_server.windsx.db.engine_factory import EngineFactory
+from card_automation_server.windsx.db.models import CARDS
+from card_automation_server.windsx.lookup.utils import chunked
+
+BENCHMARK_SIZES: tuple[int, ...] = (1_000, 10_000, 50_000)
+
+
+@dataclass(frozen=True)
+class BulkKeysResult:
+    keys: int
+    strategy: str
+    seconds: float
+    rows: int
+
+
+def scratch_engine(rows: int = max(BENCHMARK_SIZES)) -> Engine:
+    """
+    An in-memory SQLite database with `rows` cards in it, the same shape as the read mirror.
+    """
+    engine = EngineFactory.in_memory_sqlite()
+    CARDS.__table__.create(engine)
+    with engine.begin() as connection:
+        for chunk in chunked(list(range(1, rows + 1)), 5000):
+            connection.execute(insert(CARDS), [
+                {"ID": card_id, "LocGrp": 1, "Code": card_id, "CardNum": str(card_id), "NameID": card_id}
+                for card_id in chunk
+            ])
+    return engine
+
+
+def _fixed_chunks(session: Session, keys: list[int]) -> list:
+    # How every bulk lookup used to work
+    rows = []
+    for chunk in chunked(keys):
+        rows.extend(session.scalars(select(CARDS.ID).where(CARDS.ID.in_(chunk))).all())
+    return rows
+
+
+def _temp_table(session: Session, keys: list[int]) -> list:
+    # Only here for comparison, Access doesn't have temporary tables
+    connection = session.connection()
+    connection.exec_driver_sql("CREATE TEMPORARY TABLE _benchmark_keys (key INTEGER PRIMARY KEY)")
+    try:
+        connection.exec_driver_sql("INSERT INTO _benchmark_keys VALUES (?)", [(key,) for key in keys])
+        return list(session.scalars(
+            select(CARDS.ID).where(CARDS.ID.in_(select(text("key")).select_from(text("_benchmark_keys"))))
+        ).all())
+    finally:
+        connection.exec_driver_sql("DROP TABLE _benchmark_keys")
+        session.commit()
+
+
+def benchmark_bulk_keys(engine: Engine, sizes: Iterable[int] = BENCHMARK_SIZES) -> list[BulkKeysResult]:
+    """
+    Looks up CARDS by ID for each number of keys, with each way of sending the keys. The first lookup of each size warms
+    up the adaptive chunk size, so run this a couple of times on a fresh process for stable numbers.
+    """
+    strategies = {
+        "fixed IN chunks of 100": _fixed_chunks,
+        "adaptive IN chunks": lambda session, keys: scalars_in(session, select(CARDS.ID), CARDS.ID, keys),
+    }
+    if engine.dialect.name == "sqlite":
+        strategies["temp table"] = _temp_table
+
+    results = []
+    for size in sizes:
+        keys = list(range(1, size + 1))
+        for strategy, run in strategies.items():
+            with Session(engine) as session:
+                started = time.perf_counter()
+                rows = run(session, keys)
+                results.append(BulkKeysResult(size, strategy, time.perf_counter() - started, len(rows)))
+
+    return results
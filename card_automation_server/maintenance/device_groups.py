@@ -0,0 +1,97 @@
+import random
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from sqlalchemy import Engine, select, insert
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.engine_factory import EngineFactory
+from card_automation_server.windsx.db.models import DGRP
+from card_automation_server.windsx.lookup.access_card import DEVICES_PER_GROUP, device_group_index, device_mask
+from card_automation_server.windsx.lookup.utils import chunked
+
+BENCHMARK_SIZES: tuple[int, ...] = (1_000, 2_000, 5_000)
+# How many device sets get matched against each location's groups. The scan takes a quarter of a second per set at
+# 5000 groups, so this is kept small.
+_LOOKUPS = 20
+_LOCATION_ID = 1
+
+
+@dataclass(frozen=True)
+class DeviceGroupsResult:
+    groups: int
+    strategy: str
+    seconds: float
+    matched: int
+
+
+def _random_devices(rng: random.Random) -> frozenset[int]:
+    return frozenset(rng.sample(range(DEVICES_PER_GROUP), rng.randint(1, 16)))
+
+
+def scratch_engine(groups: int = max(BENCHMARK_SIZES), seed: int = 0) -> tuple[Engine, list[frozenset[int]]]:
+    """
+    An in-memory SQLite database with `groups` random device groups at one location.
+
+    :return: The engine and the device set of every group, in DGrp order
+    """
+    rng = random.Random(seed)
+    device_sets = [_random_devices(rng) for _ in range(groups)]
+
+    engine = EngineFactory.in_memory_sqlite()
+    DGRP.__table__.create(engine)
+    with engine.begin() as connection:
+        for chunk in chunked(list(enumerate(device_sets, start=1)), 1000):
+            connection.execute(insert(DGRP), [
+                {"Loc": _LOCATION_ID, "DGrp": dgrp, **{f"D{i}": i in devices for i in range(DEVICES_PER_GROUP)}}
+                for dgrp, devices in chunk
+            ])
+    return engine, device_sets
+
+
+def _scan(session: Session, wanted: list[frozenset[int]]) -> int:
+    # How device groups used to be matched, every column of every row for each device set
+    matched = 0
+    for devices in wanted:
+        groups = session.scalars(select(DGRP).where(DGRP.Loc == _LOCATION_ID)).all()
+        found: Optional[DGRP] = None
+        for group in groups:
+            if all(getattr(group, f"D{i}") == (i in devices) for i in range(DEVICES_PER_GROUP)):
+                found = group
+                break
+        matched += found is not None
+    return matched
+
+
+def _mask_index(session: Session, wanted: list[frozenset[int]]) -> int:
+    index = device_group_index(session, _LOCATION_ID)
+    return sum(device_mask(devices) in index for devices in wanted)
+
+
+def benchmark_device_groups(sizes: Iterable[int] = BENCHMARK_SIZES, lookups: int = _LOOKUPS) -> list[DeviceGroupsResult]:
+    """
+    Matches `lookups` device sets against each number of device groups, half of them existing groups and half new. The
+    scan loads the location's groups again for every device set, like it did once per timezone per card write.
+    """
+    strategies = {
+        "scan every column": _scan,
+        "device mask index": _mask_index,
+    }
+
+    results = []
+    for size in sizes:
+        engine, device_sets = scratch_engine(size)
+        rng = random.Random(size)
+        wanted = [
+            rng.choice(device_sets) if i % 2 == 0 else _random_devices(rng)
+            for i in range(lookups)
+        ]
+
+        for strategy, run in strategies.items():
+            with Session(engine) as session:
+                started = time.perf_counter()
+                matched = run(session, wanted)
+                results.append(DeviceGroupsResult(size, strategy, time.perf_counter() - started, matched))
+
+    return results
@@ -0,0 +1,130 @@
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Optional, Iterable
+
+from sqlalchemy import Engine, inspect, select, func, and_, Index, MetaData
+
+from card_automation_server.windsx.db.models import CARDS, LocCards, UDF, AclGrpCombo, EvnLog
+
+
+@dataclass(frozen=True)
+class HotPredicate:
+    """
+    A set of columns our lookups and workers filter on often enough that they should be indexed.
+    """
+    table: type
+    columns: tuple[str, ...]
+
+    @property
+    def table_name(self) -> str:
+        return self.table.__tablename__
+
+    @property
+    def index_name(self) -> str:
+        return f"IX_CAS_{self.table_name}_{'_'.join(self.columns)}"
+
+    def __str__(self):
+        return f"{self.table_name}({', '.join(self.columns)})"
+
+
+ACS_HOT_PREDICATES: tuple[HotPredicate, ...] = (
+    HotPredicate(CARDS, ("Code",)),
+    HotPredicate(CARDS, ("NameID",)),
+    HotPredicate(LocCards, ("CardID", "Loc")),
+    HotPredicate(LocCards, ("DlFlag",)),
+    HotPredicate(UDF, ("NameID", "UdfNum")),
+    HotPredicate(AclGrpCombo, ("ComboID",)),
+)
+
+LOG_HOT_PREDICATES: tuple[HotPredicate, ...] = (
+    HotPredicate(EvnLog, ("TimeDate",)),
+)
+
+
+@dataclass(frozen=True)
+class IndexReport:
+    predicate: HotPredicate
+    # The existing index that can serve this predicate, None if there isn't one
+    covered_by: Optional[str]
+
+    @property
+    def is_covered(self) -> bool:
+        return self.covered_by is not None
+
+
+def _covers(index_columns: list[str], predicate_columns: tuple[str, ...]) -> bool:
+    # An index can serve the predicate if the predicate's columns are its leading columns, in any order
+    leading = [column.lower() for column in index_columns[:len(predicate_columns)]]
+    return sorted(leading) == sorted(column.lower() for column in predicate_columns)
+
+
+def inspect_indexes(engine: Engine, predicates: Iterable[HotPredicate]) -> list[IndexReport]:
+    inspector = inspect(engine)
+    reports = []
+
+    for predicate in predicates:
+        indexes: list[tuple[str, list[str]]] = [
+            (index["name"], index["column_names"]) for index in inspector.get_indexes(predicate.table_name)
+        ]
+        primary_key = inspector.get_pk_constraint(predicate.table_name)
+        if primary_key and primary_key.get("constrained_columns"):
+            indexes.append((primary_key.get("name") or "PrimaryKey", primary_key["constrained_columns"]))
+
+        covered_by = next((name for name, columns in indexes if _covers(columns, predicate.columns)), None)
+        reports.append(IndexReport(predicate, covered_by))
+
+    return reports
+
+
+def create_missing_indexes(engine: Engine, reports: Iterable[IndexReport]) -> list[HotPredicate]:
+    """
+    Creates a secondary index for every predicate that doesn't have one.
+
+    :return: The predicates we created indexes for
+    """
+    created = []
+
+    for report in reports:
+        if report.is_covered:
+            continue
+
+        predicate = report.predicate
+        # Work on a copy of the table so the index doesn't end up on our models, where create_all would pick it up
+        table = predicate.table.__table__.to_metadata(MetaData())
+        Index(predicate.index_name, *[table.c[column] for column in predicate.columns]).create(engine)
+        created.append(predicate)
+
+    return created
+
+
+def benchmark(engine: Engine, predicates: Iterable[HotPredicate], iterations: int = 20) -> dict[HotPredicate, float]:
+    """
+    Times a lookup on each predicate using values from an existing row.
+
+    :return: {predicate -> median seconds}, predicates on empty tables are left out
+    """
+    results: dict[HotPredicate, float] = {}
+
+    with engine.connect() as connection:
+        for predicate in predicates:
+            columns = [getattr(predicate.table, column) for column in predicate.columns]
+            sample = connection.execute(select(*columns).limit(1)).first()
+            if sample is None:
+                continue
+
+            statement = (
+                select(func.count())
+                .select_from(predicate.table)
+                .where(and_(*[column == value for column, value in zip(columns, sample)]))
+            )
+
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                connection.execute(statement).scalar()
+                timings.append(time.perf_counter() - started)
+
+            results[predicate] = statistics.median(timings)
+
+    return results
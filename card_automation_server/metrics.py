@@ -0,0 +1,142 @@
+import bisect
+import threading
+from typing import Any, Optional, Sequence
+
+# Upper bounds, in seconds. Covers a fast query all the way up to a slow hardware download.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800,
+)
+
+Labels = tuple[tuple[str, Any], ...]
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"value": self._value}
+
+
+class Gauge:
+    def __init__(self):
+        self._value: Optional[float] = None
+
+    def set(self, value: Optional[float]) -> None:
+        self._value = value
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"value": self._value}
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self._buckets: tuple[float, ...] = tuple(sorted(buckets))
+        # One extra bucket at the end for everything above the largest bound
+        self._counts: list[int] = [0] * (len(self._buckets) + 1)
+        self._count: int = 0
+        self._sum: float = 0
+        self._max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self._buckets, value)] += 1
+            self._count += 1
+            self._sum += value
+            self._max = value if self._max is None else max(self._max, value)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    @property
+    def max(self) -> Optional[float]:
+        return self._max
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            buckets = {}
+            cumulative = 0
+            for bound, count in zip(self._buckets, self._counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            buckets["+Inf"] = self._count
+
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "max": self._max,
+                "buckets": buckets,
+            }
+
+
+class Metrics:
+    """
+    A small in-process registry of counters, gauges and histograms. Metrics are identified by a name plus a set of
+    labels, e.g. `metrics.histogram("card_push_latency_seconds", location=3)`. Asking for the same name and labels
+    again returns the same metric, so callers don't need to hold on to them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict[tuple[str, Labels], Any] = {}
+
+    @staticmethod
+    def _labels(labels: dict[str, Any]) -> Labels:
+        return tuple(sorted(labels.items()))
+
+    def _get_or_create(self, name: str, labels: dict[str, Any], factory, expected_type: type):
+        key = (name, self._labels(labels))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = factory()
+                self._metrics[key] = metric
+
+        if not isinstance(metric, expected_type):
+            raise Exception(f"Metric {name} is a {type(metric).__name__}, not a {expected_type.__name__}")
+
+        return metric
+
+    def counter(self, name: str, **labels: Any) -> Counter:
+        return self._get_or_create(name, labels, Counter, Counter)
+
+    def gauge(self, name: str, **labels: Any) -> Gauge:
+        return self._get_or_create(name, labels, Gauge, Gauge)
+
+    def histogram(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: Any) -> Histogram:
+        return self._get_or_create(name, labels, lambda: Histogram(buckets), Histogram)
+
+    def snapshot(self) -> dict[str, list[dict[str, Any]]]:
+        """
+        :return: {metric name -> [{"labels": {...}, ...metric values}]}, safe to serialize as JSON.
+        """
+        with self._lock:
+            items = list(self._metrics.items())
+
+        result: dict[str, list[dict[str, Any]]] = {}
+        for (name, labels), metric in sorted(items, key=lambda x: (x[0][0], str(x[0][1]))):
+            result.setdefault(name, []).append({
+                "labels": dict(labels),
+                **metric.snapshot(),
+            })
+
+        return result
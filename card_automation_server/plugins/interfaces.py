@@ -1,4 +1,6 @@
 import abc
+from datetime import timedelta
+from typing import Optional
 
 from card_automation_server.plugins.types import CardScan
 from card_automation_server.windsx.lookup.access_card import AccessCard
@@ -53,6 +55,20 @@ class PluginCardDataPushed(Plugin):
         pass
 
 
+class PluginDownloadBacklogExceeded(Plugin):
+    @abc.abstractmethod
+    def download_backlog_exceeded(self, location_id: int, pending: int, eta: Optional[timedelta]) -> None:
+        """
+        Whenever the number of LocCards waiting to be downloaded to a location goes over the configured threshold, this
+        method is called. It won't be called again for that location until the backlog drops back under the threshold.
+
+        :param location_id: int The location that's behind.
+        :param pending: int How many LocCards are waiting to be downloaded to it.
+        :param eta: Optional[timedelta] How long the backlog should take to clear, if we know how fast it's going.
+        """
+        pass
+
+
 class PluginLoop(Plugin):
     @abc.abstractmethod
     def loop(self) -> int:
@@ -66,6 +66,11 @@ DoorOverrideEvent = Literal[
     CommServerEventType.OPR_SET_OUTPUT_ALL_TIME_ZONE,
 ]
 
+DownloadCompleteEvent = Literal[
+    CommServerEventType.BROADCAST_DOWNLOAD_COMPLETE,
+    CommServerEventType.SLAVE_DOWNLOAD_COMPLETE,
+]
+
 
 @dataclass(frozen=True)
 class CardScan:
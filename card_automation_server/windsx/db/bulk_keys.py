@@ -0,0 +1,126 @@
+import threading
+from typing import Iterable, Any, Optional
+
+from sqlalchemy import Select, ColumnElement, Row
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+# Where every chunk size starts, this was the fixed size that we know Access copes with
+_INITIAL_CHUNK_SIZE = 100
+_MIN_CHUNK_SIZE = 10
+_MAX_CHUNK_SIZE = 1000
+# {dialect name -> largest chunk}. Past about 2000 keys SQLite spends longer compiling the statement than it saves.
+# Long IN lists also beat loading the keys into a temporary table there, see maintenance bulk-keys.
+_DIALECT_MAX_CHUNK_SIZES: dict[str, int] = {
+    "sqlite": 2000,
+}
+# What the databases say when a statement has too many keys: Access finds the query too complex, SQLite has too many
+# variables. Anything else, like a lock or a dropped connection, has nothing to do with the size.
+_TOO_LONG_MESSAGES = ("too complex", "too many")
+
+
+class _ChunkSize:
+    """
+    How many keys go into one IN list. Grows while queries succeed, up to a limit that's lowered whenever the database
+    rejects a list as too long, e.g. Access saying the query is too complex.
+    """
+
+    def __init__(self, maximum: int = _MAX_CHUNK_SIZE):
+        self._lock = threading.Lock()
+        self._size = min(_INITIAL_CHUNK_SIZE, maximum)
+        self._maximum = maximum
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def succeeded(self, size: int):
+        with self._lock:
+            if size >= self._size:
+                self._size = min(self._maximum, size * 2)
+
+    def limit_to(self, size: int):
+        with self._lock:
+            self._maximum = min(self._maximum, size)
+            self._size = min(self._size, self._maximum)
+
+
+# {dialect name -> chunk size}, learned per database type since that's what the limits depend on
+_chunk_sizes: dict[str, _ChunkSize] = {}
+_chunk_sizes_lock = threading.Lock()
+
+
+def _chunk_size(dialect_name: str) -> _ChunkSize:
+    with _chunk_sizes_lock:
+        if dialect_name not in _chunk_sizes:
+            _chunk_sizes[dialect_name] = _ChunkSize(_DIALECT_MAX_CHUNK_SIZES.get(dialect_name, _MAX_CHUNK_SIZE))
+        return _chunk_sizes[dialect_name]
+
+
+def _is_too_long(ex: DBAPIError) -> bool:
+    message = str(ex.orig).lower()
+    return any(too_long in message for too_long in _TOO_LONG_MESSAGES)
+
+
+def _execute_chunked(session: Session,
+                     statement: Select,
+                     column: ColumnElement,
+                     keys: list[Any],
+                     scalars: bool,
+                     dialect_name: str) -> list:
+    chunk_size = _chunk_size(dialect_name)
+    results = []
+
+    size = chunk_size.size
+    # The size the database last rejected. We only learn from it once a smaller size works, otherwise the query was
+    # probably just broken and the size had nothing to do with it.
+    rejected_size: Optional[int] = None
+
+    position = 0
+    while position < len(keys):
+        chunk = keys[position:position + size]
+        keyed = statement.where(column.in_(chunk))
+
+        try:
+            result = session.scalars(keyed) if scalars else session.execute(keyed)
+            results.extend(result.all())
+        except DBAPIError as ex:
+            if len(chunk) <= _MIN_CHUNK_SIZE or not _is_too_long(ex):
+                raise
+            rejected_size = len(chunk)
+            size = max(_MIN_CHUNK_SIZE, len(chunk) // 2)
+            continue  # Try this chunk again at the smaller size
+
+        if rejected_size is not None:
+            chunk_size.limit_to(rejected_size // 2)
+            rejected_size = None
+        else:
+            chunk_size.succeeded(len(chunk))
+
+        size = chunk_size.size
+        position += len(chunk)
+
+    return results
+
+
+def _execute_in(session: Session, statement: Select, column: ColumnElement, keys: Iterable[Any], scalars: bool) -> list:
+    keys = list(dict.fromkeys(keys))  # Drop duplicates, keep the order
+    if len(keys) == 0:
+        return []
+
+    return _execute_chunked(session, statement, column, keys, scalars, session.get_bind().dialect.name)
+
+
+def execute_in(session: Session, statement: Select, column: ColumnElement, keys: Iterable[Any]) -> list[Row]:
+    """
+    Runs statement for every row where column is one of keys, however many keys there are. The keys are sent in IN
+    lists as large as the database will take, so a big lookup is a handful of round trips instead of hundreds.
+    """
+    return _execute_in(session, statement, column, keys, scalars=False)
+
+
+def scalars_in(session: Session, statement: Select, column: ColumnElement, keys: Iterable[Any]) -> list:
+    """
+    Same as execute_in, for statements selecting a single column or entity.
+    """
+    return _execute_in(session, statement, column, keys, scalars=True)
@@ -1,6 +1,15 @@
+import logging
 from pathlib import Path
+from typing import Optional, Any
 
-from sqlalchemy import Engine, create_engine, URL, StaticPool, NullPool
+from sqlalchemy import Engine, create_engine, URL, StaticPool, NullPool, QueuePool, event
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.query_stats import instrument_queries
+
+# How many idle connections the pool keeps open. It opens more when they're all in use, since a thread can hold more than
+# one at a time (sessions nest), and waiting for one could deadlock.
+_POOL_SIZE = 8
 
 
 class EngineFactory:
@@ -19,8 +28,39 @@ class EngineFactory:
             poolclass=StaticPool
         )
 
-    @staticmethod
-    def microsoft_access(db_path: Path) -> Engine:
+    @classmethod
+    def sqlite_mirror(cls, db_path: Path) -> Engine:
+        """
+        A SQLite file that's read from many threads at once while one thread refreshes it. WAL lets the readers keep
+        going while a refresh is being written.
+        """
+        engine = create_engine(
+            f"sqlite:///{db_path}",
+            connect_args={'check_same_thread': False},
+        )
+
+        @event.listens_for(engine, "connect")
+        def _connect(dbapi_connection, _connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.close()
+
+        return engine
+
+    @classmethod
+    def microsoft_access(cls,
+                         db_path: Path,
+                         pooled: bool = False,
+                         max_connection_lifetime: int = 300,
+                         metrics: Optional[Metrics] = None,
+                         logger: Optional[logging.Logger] = None,
+                         slow_query_seconds: Optional[float] = None) -> Engine:
+        """
+        :param pooled: Reuse ODBC connections instead of opening a new one for every session, see pool_options.
+        :param metrics: If given, counts how many connections were opened vs reused, and times every query. See
+                        instrument_queries.
+        :param slow_query_seconds: Queries taking at least this long are logged to logger.
+        """
         connection_string = (
                 r'DRIVER={Microsoft Access Driver (*.mdb)};'
                 r"ExtendedAnsiSQL=1;"
@@ -30,4 +70,48 @@ class EngineFactory:
             "access+pyodbc",
             query={"odbc_connect": connection_string}
         )
-        return create_engine(connection_url, poolclass=NullPool)
+
+        if pooled:
+            engine = create_engine(connection_url, **cls.pool_options(max_connection_lifetime))
+        else:
+            engine = create_engine(connection_url, poolclass=NullPool)
+
+        if metrics is not None:
+            cls.count_connections(engine, metrics, db_path.stem)
+            instrument_queries(engine, metrics, db_path.stem, logger, slow_query_seconds)
+
+        return engine
+
+    @staticmethod
+    def pool_options(max_connection_lifetime: int) -> dict[str, Any]:
+        """
+        create_engine arguments for a pool of connections that are pinged before they're handed out and replaced once
+        they're older than max_connection_lifetime seconds. Every checkout gets a connection of its own, even on a thread
+        that already has one, so a nested session committing or rolling back never touches the outer one's work.
+        """
+        return dict(
+            poolclass=QueuePool,
+            pool_size=_POOL_SIZE,
+            max_overflow=-1,
+            pool_pre_ping=True,
+            pool_recycle=max_connection_lifetime,
+        )
+
+    @staticmethod
+    def count_connections(engine: Engine, metrics: Metrics, database: str) -> None:
+        """
+        Counts every new DBAPI connection (db_connects) and every time an already open one is handed out again
+        (db_connection_reuses).
+        """
+        connects = metrics.counter("db_connects", database=database)
+        reuses = metrics.counter("db_connection_reuses", database=database)
+
+        @event.listens_for(engine, "connect")
+        def _connect(_dbapi_connection, connection_record):
+            connects.inc()
+            connection_record.info["_fresh"] = True
+
+        @event.listens_for(engine, "checkout")
+        def _checkout(_dbapi_connection, connection_record, _connection_proxy):
+            if not connection_record.info.pop("_fresh", False):
+                reuses.inc()
@@ -0,0 +1,155 @@
+import threading
+import time
+import weakref
+from itertools import chain
+from typing import Optional, Iterable
+
+from sqlalchemy import Engine, event, select, delete, Connection
+from sqlalchemy.orm import Session, ORMExecuteState
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.models import CARDS, NAMES, UDF, UdfName, UdfSel, LocCards, LOC, DEV, \
+    AclGrpName, AclGrpCombo, AclGrp, ACL, DGRP, TZ, HOL, AcsDataBase
+
+# Every table card_automation_server.windsx.lookup reads from
+MIRRORED_TABLES: tuple[type, ...] = (
+    CARDS, NAMES, UDF, UdfName, UdfSel, LocCards, LOC, DEV, AclGrpName, AclGrpCombo, AclGrp, ACL, DGRP, TZ, HOL,
+)
+
+_INSERT_CHUNK_SIZE = 500
+
+
+class AcsMirror:
+    """
+    A local SQLite copy of the ACS tables our lookups read from. Reads from SQLite are a lot cheaper than going through
+    ODBC, and they don't get in WinDSX's way. Writes always go to Access.
+
+    Tables are re-copied whole when AcsChangeDetector says they changed, when we wrote to them ourselves, and all of
+    them every so often in case a change wasn't detected, see AcsMirrorWorker. Any write we make marks its tables dirty
+    when it's flushed and again when its transaction commits, and until every dirty table has been copied again
+    `is_current` is False and LookupInfo reads from Access instead, so nobody can read something older than what they
+    just wrote. Marking them again at commit means a copy taken while the transaction was still open can't clear them.
+    """
+
+    def __init__(self,
+                 source_engine: Engine,
+                 mirror_engine: Engine,
+                 metrics: Optional[Metrics] = None,
+                 tables: Iterable[type] = MIRRORED_TABLES):
+        self._source_engine = source_engine
+        self._mirror_engine = mirror_engine
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._tables: tuple[type, ...] = tuple(tables)
+
+        self._lock = threading.Lock()
+        # {connection -> the tables written in its open transaction}
+        self._uncommitted: weakref.WeakKeyDictionary[Connection, set[type]] = weakref.WeakKeyDictionary()
+        self._synced: bool = False
+        self._write_generation: int = 0
+        # {table -> write generation it was last dirtied at}
+        self._dirty: dict[type, int] = {}
+        self._last_write: float = 0
+
+        AcsDataBase.metadata.create_all(mirror_engine, tables=[t.__table__ for t in self._tables])
+        event.listen(source_engine, "commit", self._on_commit)
+        event.listen(source_engine, "rollback", self._on_rollback)
+
+    @property
+    def tables(self) -> tuple[type, ...]:
+        return self._tables
+
+    def is_current(self) -> bool:
+        with self._lock:
+            return self._synced and len(self._dirty) == 0
+
+    def dirty_tables(self) -> frozenset[type]:
+        with self._lock:
+            return frozenset(self._dirty.keys())
+
+    def seconds_since_last_write(self) -> float:
+        return time.monotonic() - self._last_write
+
+    def new_session(self) -> Session:
+        return Session(self._mirror_engine)
+
+    def track_writes(self, session: Session) -> None:
+        """
+        Marks tables dirty whenever this session writes to them.
+        """
+        event.listen(session, "after_flush", self._after_flush)
+        event.listen(session, "do_orm_execute", self._on_execute)
+
+    def _after_flush(self, session: Session, _flush_context) -> None:
+        self._written(session, [type(obj) for obj in chain(session.new, session.dirty, session.deleted)])
+
+    def _on_execute(self, orm_execute_state: ORMExecuteState) -> None:
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+            return
+
+        mapper = orm_execute_state.bind_mapper
+        self._written(orm_execute_state.session, [mapper.class_] if mapper is not None else self._tables)
+
+    def _written(self, session: Session, tables: list[type]) -> None:
+        tables = [table for table in tables if table in self._tables]
+        if len(tables) == 0:
+            return
+
+        self.mark_dirty(tables)
+        # Marked again when the transaction commits, which for a batch is after this session is long gone
+        connection = session.connection()
+        with self._lock:
+            self._uncommitted.setdefault(connection, set()).update(tables)
+
+    def _on_commit(self, connection: Connection) -> None:
+        with self._lock:
+            tables = self._uncommitted.pop(connection, ())
+        self.mark_dirty(tables)
+
+    def _on_rollback(self, connection: Connection) -> None:
+        # Still dirty from when they were flushed, which is harmless
+        with self._lock:
+            self._uncommitted.pop(connection, None)
+
+    def mark_dirty(self, tables: Iterable[type]) -> None:
+        tables = [table for table in tables if table in self._tables]
+        if len(tables) == 0:
+            return
+
+        with self._lock:
+            self._write_generation += 1
+            self._last_write = time.monotonic()
+            for table in tables:
+                self._dirty[table] = self._write_generation
+
+    def refresh(self, tables: Optional[Iterable[type]] = None) -> None:
+        """
+        Copies the given tables (or every table) from Access. They're replaced in one transaction, so readers see
+        either all the old rows or all the new ones.
+        """
+        tables = self._tables if tables is None else tuple(t for t in self._tables if t in set(tables))
+        if len(tables) == 0:
+            return
+
+        started = time.monotonic()
+
+        with self._lock:
+            # Anything written after this point may not be in what we copy, so it stays dirty
+            dirty_at_start = {table: self._dirty[table] for table in tables if table in self._dirty}
+
+        with self._source_engine.connect() as source, self._mirror_engine.begin() as mirror:
+            for table in tables:
+                rows = [dict(row._mapping) for row in source.execute(select(table.__table__))]
+
+                mirror.execute(delete(table.__table__))
+                for i in range(0, len(rows), _INSERT_CHUNK_SIZE):
+                    mirror.execute(table.__table__.insert(), rows[i:i + _INSERT_CHUNK_SIZE])
+
+        with self._lock:
+            for table, generation in dirty_at_start.items():
+                if self._dirty.get(table) == generation:
+                    del self._dirty[table]
+
+            if len(tables) == len(self._tables):
+                self._synced = True
+
+        self._metrics.histogram("mirror_refresh_seconds").observe(time.monotonic() - started)
@@ -0,0 +1,91 @@
+import logging
+import re
+import sys
+import time
+from types import FrameType
+from typing import Optional
+
+from sqlalchemy import Engine, event
+
+from card_automation_server.metrics import Metrics
+
+# Frames from these modules are plumbing, the caller is whoever called into them
+_PLUMBING_MODULES = (
+    "sqlalchemy.",
+    "card_automation_server.windsx.db.",
+    "contextlib",
+    "threading",
+)
+# IN lists are rendered with one placeholder per value, which would make every list length its own statement
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_MAX_STATEMENT_LENGTH = 300
+_MAX_PARAMETERS_LENGTH = 1000
+
+
+def _caller(frame: Optional[FrameType]) -> str:
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith(_PLUMBING_MODULES):
+            code = frame.f_code
+            return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+        frame = frame.f_back
+
+    return "unknown"
+
+
+def normalize_statement(statement: str) -> str:
+    """
+    Collapses a SQL statement down to something we can use as a metric label.
+    """
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _IN_LIST.sub("(?, ...)", statement)
+    if len(statement) > _MAX_STATEMENT_LENGTH:
+        statement = statement[:_MAX_STATEMENT_LENGTH] + "..."
+    return statement
+
+
+def instrument_queries(engine: Engine,
+                       metrics: Metrics,
+                       database: str,
+                       logger: Optional[logging.Logger] = None,
+                       slow_query_seconds: Optional[float] = None) -> None:
+    """
+    Records every statement run on this engine:
+
+    - db_queries / db_query_seconds, labelled with the lookup, worker or plugin function that ran it
+    - db_statement_seconds, labelled with the statement itself
+
+    Statements that take longer than slow_query_seconds are logged along with their parameters.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, _cursor, _statement, _parameters, _context, _executemany):
+        conn.info.setdefault("_query_stats", []).append((_caller(sys._getframe(1)), time.perf_counter()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, _cursor, statement, parameters, _context, _executemany):
+        caller, started = conn.info["_query_stats"].pop()
+        elapsed = time.perf_counter() - started
+
+        metrics.counter("db_queries", database=database, caller=caller).inc()
+        metrics.histogram("db_query_seconds", database=database, caller=caller).observe(elapsed)
+        metrics.histogram(
+            "db_statement_seconds", database=database, statement=normalize_statement(statement)
+        ).observe(elapsed)
+
+        if logger is not None and slow_query_seconds is not None and elapsed >= slow_query_seconds:
+            logged_parameters = repr(parameters)
+            if len(logged_parameters) > _MAX_PARAMETERS_LENGTH:
+                logged_parameters = logged_parameters[:_MAX_PARAMETERS_LENGTH] + "..."
+
+            logger.warning(
+                f"Slow query on {database} ({elapsed:.3f}s) from {caller}: {statement} {logged_parameters}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # after_cursor_execute doesn't run for a statement that failed
+        stack = context.connection.info.get("_query_stats") if context.connection is not None else None
+        if stack:
+            stack.pop()
@@ -0,0 +1,181 @@
+import contextlib
+import enum
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Optional, Generator
+
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session, SessionTransaction
+
+from card_automation_server.metrics import Metrics
+
+
+class Priority(enum.IntEnum):
+    # Someone is waiting on the answer, like a card being scanned at a door
+    INTERACTIVE = 0
+    NORMAL = 1
+    # Large syncs that can wait their turn
+    BULK = 2
+
+
+class _Slot:
+    def __init__(self):
+        # How many times the thread that took it has acquired it, it's given back when this gets to 0
+        self.depth = 1
+        self.acquired_at = time.monotonic()
+        self.thread_name = threading.current_thread().name
+
+
+class DbScheduler:
+    """
+    Access takes a lock on the MDB file for every connection that's doing work, so having every worker and plugin hit it
+    at once mostly just makes them wait on each other. This lets a limited number of transactions run at a time, and
+    when a slot frees up it goes to the highest priority transaction that's waiting, oldest first. With max_concurrent
+    set to None there's no limit and nothing waits.
+
+    A transaction holds its slot from when it starts until it's committed, rolled back or its session is closed, so a
+    session left open holds up everyone else. Bulk work that commits as it goes lets interactive lookups in between
+    each commit. A thread that already holds a slot can always start another transaction, so nested sessions can't
+    deadlock on each other. Anything that waits longer than wait_timeout_seconds logs a warning saying who has the
+    slots and goes ahead anyway, over the limit, so a forgotten session slows things down instead of stopping them.
+    """
+
+    def __init__(self,
+                 max_concurrent: Optional[int] = 1,
+                 metrics: Optional[Metrics] = None,
+                 database: str = "acs",
+                 wait_timeout_seconds: Optional[float] = 30,
+                 logger: Optional[logging.Logger] = None):
+        if max_concurrent is not None and max_concurrent < 1:
+            raise Exception("max_concurrent must be at least 1")
+
+        self._max_concurrent = max_concurrent
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._database = database
+        self._wait_timeout_seconds = wait_timeout_seconds
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._active: set[_Slot] = set()
+        self._waiting: list[tuple[Priority, int]] = []
+        self._tickets = itertools.count()
+        self._local = threading.local()
+
+    @property
+    def current_priority(self) -> Priority:
+        return getattr(self._local, "priority", Priority.NORMAL)
+
+    @contextlib.contextmanager
+    def priority(self, priority: Priority) -> Generator[None, None, None]:
+        """
+        Every transaction started on this thread inside this block is scheduled with the given priority.
+        """
+        previous = self.current_priority
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def acquire(self) -> _Slot:
+        """
+        Waits for a slot, unless this thread already holds one.
+
+        :return: The slot, pass it to release() if that might happen on another thread
+        """
+        with self._condition:
+            slot: Optional[_Slot] = getattr(self._local, "slot", None)
+            if slot is not None and slot in self._active:
+                slot.depth += 1
+                return slot
+
+        priority = self.current_priority
+        started = time.monotonic()
+
+        with self._condition:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+
+            while self._is_full() or self._waiting[0] != ticket:
+                if not self._wait(started):
+                    self._log_timeout(priority, started)
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    break
+            else:
+                heapq.heappop(self._waiting)
+
+            slot = self._local.slot = _Slot()
+            self._active.add(slot)
+            # There may be more than one free slot, let whoever is next in line check
+            self._condition.notify_all()
+
+        self._metrics.histogram(
+            "db_wait_seconds", database=self._database, priority=priority.name.lower()
+        ).observe(time.monotonic() - started)
+        return slot
+
+    def release(self, slot: Optional[_Slot] = None) -> None:
+        """
+        Gives back a slot from acquire(), or the one this thread holds. It's only freed once it's been released as many
+        times as it was acquired.
+        """
+        with self._condition:
+            if slot is None:
+                slot = getattr(self._local, "slot", None)
+            if slot is None or slot not in self._active:
+                raise Exception("Released a database slot that isn't held")
+
+            slot.depth -= 1
+            if slot.depth > 0:
+                return
+
+            self._active.discard(slot)
+            self._condition.notify_all()
+
+    def _is_full(self) -> bool:
+        return self._max_concurrent is not None and len(self._active) >= self._max_concurrent
+
+    def _wait(self, started: float) -> bool:
+        if self._wait_timeout_seconds is None:
+            self._condition.wait()
+            return True
+
+        remaining = self._wait_timeout_seconds - (time.monotonic() - started)
+        return remaining > 0 and self._condition.wait(remaining)
+
+    def _log_timeout(self, priority: Priority, started: float) -> None:
+        now = time.monotonic()
+        holders = ", ".join(f"{slot.thread_name} for {now - slot.acquired_at:.0f}s" for slot in self._active)
+        self._logger.warning(
+            f"Waited {now - started:.0f}s for a {self._database} database slot at {priority.name} priority, going "
+            f"ahead anyway. Held by: {holders}. A session that's kept open holds its slot until it's committed, "
+            f"rolled back or closed."
+        )
+        self._metrics.counter("db_wait_timeouts", database=self._database).inc()
+
+
+class ScheduledSession(Session):
+    """
+    A Session whose transactions each wait for a slot from the scheduler before they touch the database.
+    """
+
+    def __init__(self, bind: Engine, scheduler: DbScheduler):
+        self.scheduler = scheduler
+        super().__init__(bind)
+
+
+@event.listens_for(ScheduledSession, "after_transaction_create")
+def _acquire_slot(session: ScheduledSession, transaction: SessionTransaction):
+    # Only the outermost transaction, savepoints and subtransactions ride along with it
+    if transaction.parent is None:
+        session.slot = session.scheduler.acquire()
+
+
+@event.listens_for(ScheduledSession, "after_transaction_end")
+def _release_slot(session: ScheduledSession, transaction: SessionTransaction):
+    # The session may be closed on a different thread than it was used on, so give back the slot it took
+    if transaction.parent is None and "slot" in session.__dict__:
+        session.scheduler.release(session.__dict__.pop("slot"))
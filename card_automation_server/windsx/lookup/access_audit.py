@@ -0,0 +1,236 @@
+import enum
+from dataclasses import dataclass
+from datetime import datetime, date
+from typing import Optional, AbstractSet
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.models import CARDS, LocCards, AclGrp, ACL
+from card_automation_server.windsx.db.scheduler import Priority
+from card_automation_server.windsx.lookup.access_card import AccessCardLookup, ACTIVE_STOP_DATE, device_mask, \
+    device_group_indexes
+from card_automation_server.windsx.lookup.acl_group_combo import acl_group_names, combo_name_ids
+from card_automation_server.windsx.lookup.utils import LookupInfo, chunked
+
+# {location_id -> the ACLs a card should have there}. None means an ACL or device group it needs doesn't exist yet.
+_ExpectedAccess = dict[int, Optional[frozenset[int]]]
+
+_MASTER_ACL = 0
+_NO_ACL = -1
+
+
+class DiscrepancyKind(enum.Enum):
+    # CARDS.Status doesn't match whether the card's combo gives it any access
+    STATUS = "status"
+    # The LocCards row at a location has different ACLs than the card's combo works out to
+    LOC_CARDS = "loc_cards"
+    # The card's combo needs an ACL or device group at a location that was never created
+    MISSING_ACL = "missing_acl"
+
+
+@dataclass(frozen=True)
+class AccessDiscrepancy:
+    card_id: int
+    card_number: int
+    kind: DiscrepancyKind
+    location_id: Optional[int] = None
+    expected: Optional[frozenset[int]] = None
+    actual: Optional[frozenset[int]] = None
+
+
+@dataclass(frozen=True)
+class AccessAuditReport:
+    cards: int
+    discrepancies: tuple[AccessDiscrepancy, ...]
+
+    def card_ids(self, *kinds: DiscrepancyKind) -> set[int]:
+        return {d.card_id for d in self.discrepancies if not kinds or d.kind in kinds}
+
+
+class AccessAuditor:
+    """
+    Checks that every card's Status and LocCards match what its combo says it should have. Each table is read once as
+    plain rows, what each combo works out to is computed once, and then every card is compared against its combo's
+    answer, so this is quick enough to run over tens of thousands of cards every night.
+
+    Nothing is written while auditing. repair() rewrites the cards a report found.
+    """
+
+    def __init__(self, lookup_info: LookupInfo):
+        self._lookup_info = lookup_info
+        self._location_group_id = lookup_info.location_group_id
+
+    def audit(self) -> AccessAuditReport:
+        location_ids = list(self._lookup_info.location_ids())
+        known_names = {name.id: name.is_master for name in acl_group_names(self._lookup_info).values()}
+        combos = combo_name_ids(self._lookup_info)
+
+        with self._lookup_info.priority(Priority.BULK), self._lookup_info.new_read_session() as session:
+            expected_by_combo = _ComboExpectations(session, location_ids, known_names, combos)
+
+            cards = session.execute(
+                select(CARDS.ID, CARDS.Code, CARDS.AclGrpComboID, CARDS.TempAclGrpComboID, CARDS.Status)
+                .where(CARDS.LocGrp == self._location_group_id)
+            ).all()
+
+            # {card_id -> {location_id -> ACLs}}
+            actual: dict[int, dict[int, frozenset[int]]] = {}
+            for row in session.execute(
+                select(LocCards.CardID, LocCards.Loc, LocCards.Acl, LocCards.Acl1, LocCards.Acl2, LocCards.Acl3,
+                       LocCards.Acl4)
+                .where(LocCards.Loc.in_(location_ids))
+            ).all():
+                actual.setdefault(row[0], {})[row[1]] = frozenset(
+                    acl for acl in row[2:] if acl is not None and acl != _NO_ACL
+                )
+
+        discrepancies: list[AccessDiscrepancy] = []
+        for card_id, code, combo_id, temp_combo_id, status in cards:
+            card_number = int(code)
+            has_access = _gives_access(combos, known_names.keys(), combo_id, temp_combo_id)
+            if bool(status) != has_access:
+                discrepancies.append(AccessDiscrepancy(card_id, card_number, DiscrepancyKind.STATUS))
+
+            if temp_combo_id:
+                # Its LocCards follow the temporary access while it lasts, which we don't work out, so repairing them
+                # from its own combo would take that access away
+                continue
+
+            card_actual = actual.get(card_id, {})
+            for location_id, expected in expected_by_combo.get(combo_id).items():
+                found = card_actual.get(location_id, frozenset())
+                if expected is None:
+                    discrepancies.append(AccessDiscrepancy(
+                        card_id, card_number, DiscrepancyKind.MISSING_ACL, location_id, None, found,
+                    ))
+                elif found != expected:
+                    discrepancies.append(AccessDiscrepancy(
+                        card_id, card_number, DiscrepancyKind.LOC_CARDS, location_id, expected, found,
+                    ))
+
+        return AccessAuditReport(cards=len(cards), discrepancies=tuple(discrepancies))
+
+    def repair(self, report: AccessAuditReport) -> int:
+        """
+        Recomputes LocCards for every card with a LocCards or missing ACL discrepancy, and sets Status (and StopDate) on
+        the ones whose status was wrong.
+
+        :return: How many cards were repaired
+        """
+        status_card_ids = report.card_ids(DiscrepancyKind.STATUS)
+        loc_cards_card_ids = report.card_ids(DiscrepancyKind.LOC_CARDS, DiscrepancyKind.MISSING_ACL)
+
+        with self._lookup_info.priority(Priority.BULK):
+            if status_card_ids:
+                with self._lookup_info.batch(), self._lookup_info.new_session() as session:
+                    self._repair_status(session, status_card_ids)
+                    session.commit()
+                self._lookup_info.invalidate(CARDS)
+
+            if loc_cards_card_ids:
+                AccessCardLookup(self._lookup_info).recompute_cards(loc_cards_card_ids)
+
+        return len(status_card_ids | loc_cards_card_ids)
+
+    def _repair_status(self, session: Session, card_ids: set[int]):
+        known_names = {name.id for name in acl_group_names(self._lookup_info).values()}
+        combos = combo_name_ids(self._lookup_info)
+        today = datetime.combine(date.today(), datetime.min.time())
+
+        for chunk in chunked(sorted(card_ids)):
+            for card_id, combo_id, temp_combo_id in session.execute(
+                select(CARDS.ID, CARDS.AclGrpComboID, CARDS.TempAclGrpComboID)
+                .where(CARDS.LocGrp == self._location_group_id)
+                .where(CARDS.ID.in_(chunk))
+            ).all():
+                is_active = _gives_access(combos, known_names, combo_id, temp_combo_id)
+                session.execute(
+                    update(CARDS)
+                    .where(CARDS.ID == card_id)
+                    .values(Status=is_active, StopDate=ACTIVE_STOP_DATE if is_active else today)
+                )
+
+
+def _gives_access(combos: dict[int, frozenset[int]],
+                  known_names: AbstractSet[int],
+                  combo_id: Optional[int],
+                  temp_combo_id: Optional[int]) -> bool:
+    # A card running on temporary access is active even if its own combo is empty
+    return any(
+        len(combos.get(combo, frozenset()) & known_names) > 0
+        for combo in (combo_id, temp_combo_id)
+        if combo
+    )
+
+
+class _ComboExpectations:
+    """
+    Works out what LocCards each combo should have from AclGrp, DGRP and ACL, the same way a card write does, except
+    nothing is created when a device group or ACL is missing.
+    """
+
+    def __init__(self,
+                 session: Session,
+                 location_ids: list[int],
+                 known_names: dict[int, bool],
+                 combos: dict[int, frozenset[int]]):
+        self._location_ids = location_ids
+        self._known_names = known_names
+        self._combos = combos
+        self._expected: dict[Optional[int], _ExpectedAccess] = {}
+
+        # {name_id -> {location_id -> {timezone -> devices}}}
+        self._acl_groups: dict[int, dict[int, dict[int, set[int]]]] = {}
+        for name_id, location_id, dev, *timezones in session.execute(
+            select(AclGrp.AclGrpNameID, AclGrp.Loc, AclGrp.Dev, AclGrp.Tz1, AclGrp.Tz2, AclGrp.Tz3, AclGrp.Tz4)
+            .where(AclGrp.Loc.in_(location_ids))
+        ).all():
+            for tz in set(timezones):
+                if tz is None or tz == 0:
+                    continue
+                self._acl_groups.setdefault(name_id, {}).setdefault(location_id, {}).setdefault(tz, set()).add(dev)
+
+        self._device_groups = device_group_indexes(session, location_ids)
+
+        # {(location_id, timezone, DGrp) -> Acl}
+        self._acls: dict[tuple[int, int, int], int] = {}
+        for location_id, tz, dgrp, acl in session.execute(
+            select(ACL.Loc, ACL.Tz, ACL.DGrp, ACL.Acl)
+            .where(ACL.Loc.in_(location_ids))
+        ).all():
+            self._acls.setdefault((location_id, tz, dgrp), acl)
+
+    def get(self, combo_id: Optional[int]) -> _ExpectedAccess:
+        if combo_id not in self._expected:
+            self._expected[combo_id] = self._work_out(combo_id)
+        return self._expected[combo_id]
+
+    def _work_out(self, combo_id: Optional[int]) -> _ExpectedAccess:
+        name_ids = [name_id for name_id in self._combos.get(combo_id, frozenset()) if name_id in self._known_names]
+
+        if any(self._known_names[name_id] for name_id in name_ids):
+            return {location_id: frozenset({_MASTER_ACL}) for location_id in self._location_ids}
+
+        # {location_id -> {timezone -> devices}}, every name in the combo merged together
+        devices: dict[int, dict[int, set[int]]] = {}
+        for name_id in name_ids:
+            for location_id, timezones in self._acl_groups.get(name_id, {}).items():
+                for tz, tz_devices in timezones.items():
+                    devices.setdefault(location_id, {}).setdefault(tz, set()).update(tz_devices)
+
+        expected: _ExpectedAccess = {location_id: frozenset() for location_id in self._location_ids}
+        for location_id, timezones in devices.items():
+            acls: set[int] = set()
+            missing = False
+            for tz, tz_devices in timezones.items():
+                dgrp = self._device_groups.get(location_id, {}).get(device_mask(tz_devices))
+                acl = self._acls.get((location_id, tz, dgrp)) if dgrp is not None else None
+                if acl is None:
+                    missing = True
+                    break
+                acls.add(acl)
+
+            expected[location_id] = None if missing else frozenset(acls)
+
+        return expected
@@ -1,14 +1,18 @@
 from dataclasses import dataclass
 from datetime import datetime, date
-from typing import Optional, Union, Callable, Any
+from typing import Optional, Union, Iterable, Iterator
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, ColumnElement, Select
 from sqlalchemy.orm import Session
 
-from card_automation_server.windsx.db.models import CARDS, LOC, AclGrpName, AclGrpCombo, AclGrp, DGRP, ACL, LocCards
-from card_automation_server.windsx.lookup.acl_group_combo import AclGroupComboSet, AclGroupComboLookup
+from card_automation_server.windsx.db.bulk_keys import scalars_in, execute_in
+from card_automation_server.windsx.db.models import CARDS, AclGrp, DGRP, ACL, LocCards, AclGrpName, AclGrpCombo, LOC, \
+    NAMES
+from card_automation_server.windsx.lookup.acl_group_combo import AclGroupComboSet, AclGroupComboLookup, \
+    acl_group_names, combo_name_ids, AclGroupNameNotInDatabase
+from card_automation_server.windsx.lookup.cache import invalidates
 from card_automation_server.windsx.lookup.person import Person, PersonLookup
-from card_automation_server.windsx.lookup.utils import LookupInfo, chunked
+from card_automation_server.windsx.lookup.utils import LookupInfo
 from card_automation_server.workers.events import LocCardUpdated
 
 
@@ -44,13 +48,38 @@ class AccessCardLookup:
             card_number = card_number.lstrip('0')
         return _AccessCard(self._lookup_info, card_number=card_number)
 
+    def write_many(self, cards: list['AccessCard']) -> None:
+        """
+        Writes every card in one transaction. The ACLs for each distinct set of access are only worked out once, and each
+        location is flagged for download once, however many cards there are.
+        """
+        if len(cards) == 0:
+            return
+
+        _write_access_cards(self._lookup_info, cards)
+
+    def recompute_access(self, acl_group_name_ids: Iterable[int]) -> int:
+        """
+        Brings LocCards up to date for every card whose combo includes one of these ACL group names, for when their
+        AclGrp rows (the doors and timezones they cover) were changed. Only rows whose ACLs change are written.
+
+        :return: How many cards had their LocCards changed
+        """
+        return _recompute_access(self._lookup_info, set(acl_group_name_ids))
+
+    def recompute_cards(self, card_ids: Iterable[int]) -> int:
+        """
+        Same as recompute_access, for these cards, e.g. ones an AccessAuditor found out of step.
+        """
+        return _recompute_loc_cards(self._lookup_info, CARDS.ID, list(card_ids))
+
     def by_card_number(self, card_number: Union[int, str]) -> Optional['AccessCard']:
         # The DB engine might do this for us, but just to be on the safe side, we convert it to an integer with leading
         # 0's removed.
         if isinstance(card_number, str):
             card_number = card_number.lstrip('0')
 
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.new_read_session() as session:
             card: Optional[CARDS] = session.scalar(
                 self._base_statement.where(CARDS.Code == card_number)
             )
@@ -67,20 +96,16 @@ class AccessCardLookup:
             for n in card_numbers
         ]
 
-        rows = []
-        with self._lookup_info.new_session() as session:
-            for chunk in chunked(normalized):
-                rows.extend(
-                    _CardRow(row.ID, int(row.Code), row.NameID, row.Status, row.AclGrpComboID)
-                    for row in session.scalars(
-                        self._base_statement.where(CARDS.Code.in_(chunk))
-                    ).all()
-                )
+        with self._lookup_info.new_read_session() as session:
+            rows = [
+                _CardRow(row.ID, int(row.Code), row.NameID, row.Status, row.AclGrpComboID)
+                for row in scalars_in(session, self._base_statement, CARDS.Code, normalized)
+            ]
 
         return self._build_access_cards(*rows)
 
     def all(self) -> list['AccessCard']:
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.new_read_session() as session:
             rows = [
                 _CardRow(row.ID, int(row.Code), row.NameID, row.Status, row.AclGrpComboID)
                 for row in session.scalars(self._base_statement).all()
@@ -88,8 +113,22 @@ class AccessCardLookup:
 
         return self._build_access_cards(*rows)
 
+    def iter_all(self, page_size: int = 500) -> Iterator['AccessCard']:
+        """
+        Same as all(), a page of cards at a time, so walking every card doesn't need them all in memory at once. Combos
+        (and people, with with_people()) are loaded once per page.
+        """
+        return self._iter_pages(self._base_statement, page_size)
+
+    def _iter_pages(self, statement: Select, page_size: int) -> Iterator['AccessCard']:
+        for page in self._lookup_info.read_pages(statement, CARDS.ID, page_size):
+            yield from self._build_access_cards(*(
+                _CardRow(row.ID, int(row.Code), row.NameID, row.Status, row.AclGrpComboID)
+                for row in page
+            ))
+
     def by_id(self, card_id: int) -> Optional['AccessCard']:
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.new_read_session() as session:
             card: Optional[CARDS] = session.scalar(
                 self._base_statement.where(CARDS.ID == card_id)
             )
@@ -100,6 +139,25 @@ class AccessCardLookup:
         row = _CardRow(card.ID, int(card.Code), card.NameID, card.Status, card.AclGrpComboID)
         return self._build_access_cards(row)[0]
 
+    def by_ids(self, *card_ids: int) -> list['AccessCard']:
+        with self._lookup_info.new_read_session() as session:
+            rows = [
+                _CardRow(row.ID, int(row.Code), row.NameID, row.Status, row.AclGrpComboID)
+                for row in scalars_in(session, self._base_statement, CARDS.ID, card_ids)
+            ]
+
+        return self._build_access_cards(*rows)
+
+    def search(self) -> '_AccessCardSearch':
+        """
+        Finds cards by what they are rather than their number, e.g. every active card with an access level:
+
+            access_card_lookup.search().active().having_access("Tenant 2").find()
+
+        The criteria become one query, so only the cards that match are loaded.
+        """
+        return _AccessCardSearch(self)
+
     def _build_access_cards(self, *rows: _CardRow) -> list['AccessCard']:
         combo_lookup = AclGroupComboLookup(self._lookup_info)
         combo_ids = {row.acl_grp_combo_id for row in rows}
@@ -120,9 +178,107 @@ class AccessCardLookup:
         return cards
 
 
+class _AccessCardSearch:
+    def __init__(self, access_card_lookup: AccessCardLookup):
+        self._access_card_lookup = access_card_lookup
+        self._lookup_info = access_card_lookup._lookup_info
+        self._location_group_id = self._lookup_info.location_group_id
+        self._statement = access_card_lookup._base_statement
+        self._joined_names = False
+        self._matches_nothing = False
+
+    def active(self, is_active: bool = True) -> '_AccessCardSearch':
+        self._statement = self._statement.where(CARDS.Status == is_active)
+        return self
+
+    def inactive(self) -> '_AccessCardSearch':
+        return self.active(False)
+
+    def having_access(self, *names: str) -> '_AccessCardSearch':
+        """
+        Cards with every one of these access levels, and maybe others
+
+        :raises AclGroupNameNotInDatabase: One of the names doesn't exist
+        """
+        known_names = acl_group_names(self._lookup_info)
+        for name in names:
+            if name not in known_names:
+                raise AclGroupNameNotInDatabase(name)
+
+            self._statement = self._statement.where(CARDS.AclGrpComboID.in_(
+                select(AclGrpCombo.ComboID)
+                .where(AclGrpCombo.LocGrp == self._location_group_id)
+                .where(AclGrpCombo.AclGrpNameID == known_names[name].id)
+            ))
+        return self
+
+    def with_combo_ids(self, *combo_ids: int) -> '_AccessCardSearch':
+        if len(combo_ids) == 0:
+            # Access hates having an empty in_ statement
+            self._matches_nothing = True
+        else:
+            self._statement = self._statement.where(CARDS.AclGrpComboID.in_(combo_ids))
+        return self
+
+    def for_person(self, first_name: Optional[str] = None, last_name: Optional[str] = None) -> '_AccessCardSearch':
+        self._join_names()
+        if first_name is not None:
+            self._statement = self._statement.where(NAMES.FName == first_name)
+        if last_name is not None:
+            self._statement = self._statement.where(NAMES.LName == last_name)
+        return self
+
+    def for_company(self, company_id: int) -> '_AccessCardSearch':
+        self._join_names()
+        self._statement = self._statement.where(NAMES.Company == company_id)
+        return self
+
+    def find(self) -> list['AccessCard']:
+        if self._matches_nothing:
+            return []
+
+        with self._lookup_info.new_read_session() as session:
+            rows = [
+                _CardRow(row.ID, int(row.Code), row.NameID, row.Status, row.AclGrpComboID)
+                for row in session.scalars(self._statement).all()
+            ]
+
+        return self._access_card_lookup._build_access_cards(*rows)
+
+    def iter_find(self, page_size: int = 500) -> Iterator['AccessCard']:
+        """
+        Same as find(), a page of cards at a time
+        """
+        if self._matches_nothing:
+            return iter(())
+
+        return self._access_card_lookup._iter_pages(self._statement, page_size)
+
+    def count(self) -> int:
+        if self._matches_nothing:
+            return 0
+
+        with self._lookup_info.new_read_session() as session:
+            return session.scalar(select(func.count()).select_from(self._statement.subquery()))
+
+    def _join_names(self) -> None:
+        if self._joined_names:
+            return
+
+        self._joined_names = True
+        self._statement = (
+            self._statement
+            .join(NAMES, NAMES.ID == CARDS.NameID)
+            .where(NAMES.LocGrp == self._location_group_id)
+        )
+
+
 ACTIVE_STOP_DATE = datetime(year=9999, month=12, day=31)  # If we're setting a card to active, this is the stop date
 
 
+# LOC is only flagged for download, nothing we cache about it changes. ACL and DGRP rows are only sometimes added, so
+# _ComboAccessResolver invalidates those itself when it does.
+@invalidates(CARDS, LocCards)
 class _AccessCard:
     def __init__(self,
                  lookup_info: LookupInfo,
@@ -140,6 +296,8 @@ class _AccessCard:
         self._person: Optional[Person] = None
         self._active: bool = active
         self._acl_group_combo: AclGroupComboSet = acl_group_combo if acl_group_combo is not None else AclGroupComboLookup(lookup_info).empty()
+        # The combo this card has in the database, which can't be deleted as an orphan while the card has it
+        self._stored_combo_id: Optional[int] = self._acl_group_combo.id if card_id is not None else None
 
     @property
     def in_db(self) -> bool:
@@ -201,141 +359,326 @@ class _AccessCard:
         return self
 
     def write(self):
-        if self.person is None:
+        _write_access_cards(self._lookup_info, [self])
+
+    def _check_person(self):
+        # Goes by what _load_people found, instead of looking the person up again
+        if self._person is None and self._name_id is None:
             raise InvalidPersonForAccessCard("The person must be set for an access card")
 
-        if not self.person.in_db:
+        if self.in_db and len(self._acl_group_combo.names) == 0:
+            return  # Taking access away from a card is fine even if its person has been deleted
+
+        if self._person is None or not self._person.in_db:
             raise InvalidPersonForAccessCard("The person for this card was not found")
 
-        self._acl_group_combo.write()
+    def _apply_to(self, card: CARDS, today: datetime):
+        card.NameID = self._name_id
+        card.AclGrpComboID = self._acl_group_combo.id
+        is_active: bool = len(self._acl_group_combo.names) > 0
+        card.Status = is_active
 
-        today = datetime.combine(date.today(), datetime.min.time())
+        card.StopDate = ACTIVE_STOP_DATE if is_active else today
 
-        with self._lookup_info.new_session() as session:
-            card: Optional[CARDS] = None
-            if self._card_id is not None:
-                card = session.scalar(
-                    select(CARDS)
-                    .where(CARDS.ID == self._card_id)
-                    .where(CARDS.LocGrp == self._location_group_id)
-                )
 
-            if card is None:
-                card = CARDS(
-                    LocGrp=self._location_group_id,
-                    Code=self._card_number,
-                    CardNum=str(self._card_number),
-                    StartDate=today,
+class _Unused:
+    pass
+
+
+AccessCard = Union[_AccessCard, _Unused]
+
+
+def _load_people(lookup_info: LookupInfo, cards: list['_AccessCard']) -> None:
+    # One lookup for all of them, instead of card.person looking each one up on its own
+    name_ids = {card._name_id for card in cards if card._person is None and card._name_id is not None}
+    if len(name_ids) == 0:
+        return
+
+    people = {person.id: person for person in PersonLookup(lookup_info).by_ids(*name_ids)}
+    for card in cards:
+        if card._person is None:
+            card._person = people.get(card._name_id)
+
+
+def _write_access_cards(lookup_info: LookupInfo, cards: list['_AccessCard']) -> None:
+    _load_people(lookup_info, cards)
+    for card in cards:
+        card._check_person()
+
+    location_group_id = lookup_info.location_group_id
+    today = datetime.combine(date.today(), datetime.min.time())
+
+    # The cards, their combos and their LocCards go in together
+    with lookup_info.batch():
+        _write_combos(lookup_info, cards)
+
+        with lookup_info.new_session() as session:
+            existing: dict[int, CARDS] = {
+                row.ID: row
+                for row in scalars_in(
+                    session,
+                    select(CARDS).where(CARDS.LocGrp == location_group_id),
+                    CARDS.ID,
+                    [card.id for card in cards if card.id is not None],
                 )
+            }
 
-            card.NameID = self._name_id
-            card.AclGrpComboID = self._acl_group_combo.id
-            is_active: bool = len(self._acl_group_combo.names) > 0
-            card.Status = is_active
+            rows: list[CARDS] = []
+            for card in cards:
+                row = existing.get(card.id) if card.id is not None else None
+                if row is None:
+                    row = CARDS(
+                        LocGrp=location_group_id,
+                        Code=card.card_number,
+                        CardNum=str(card.card_number),
+                        StartDate=today,
+                    )
+                    session.add(row)
 
-            card.StopDate = ACTIVE_STOP_DATE if is_active else today
+                card._apply_to(row, today)
+                rows.append(row)
 
-            session.add(card)
-            session.commit()
-            # noinspection PyTypeChecker
-            self._card_id = card.ID
-
-            # Creating this object does everything we need it to.
-            _AccessControlListUpdater(
-                self._location_group_id,
-                self._card_id,
-                self._acl_group_combo.id,
+            session.flush()
+            for card, row in zip(cards, rows):
+                # noinspection PyTypeChecker
+                card._card_id = row.ID
+                card._stored_combo_id = row.AclGrpComboID
+
+            resolver = _ComboAccessResolver(lookup_info, session)
+            loc_cards = _LocCardsWriter(lookup_info, session, [card.id for card in cards])
+            for card in cards:
+                loc_cards.apply(card.id, resolver.resolve(card._acl_group_combo.id))
+            loc_cards.flush()
+
+            lookup_info.flag_locations_for_download(
                 session,
-                self._lookup_info.updated_callback
+                resolver.locations_to_update | loc_cards.locations_to_update,
+                "TzCs", "AclCs", "DGrpCs", "CodeCs",
             )
+            session.commit()
 
-        self._lookup_info.updated_callback(self)
+        for card in cards:
+            lookup_info.updated_callback(card)
+
+
+def _write_combos(lookup_info: LookupInfo, cards: list['_AccessCard']) -> None:
+    _replace_deleted_combos(lookup_info, cards)
+
+    # Cards that were given the same new set of names share one new combo, instead of each writing their own
+    written: dict[frozenset[str], AclGroupComboSet] = {}
+    for card in cards:
+        combo = card._acl_group_combo
+        if combo.in_db or len(combo.names) == 0:
+            continue
+
+        if combo.names in written:
+            card._acl_group_combo = written[combo.names]
+            continue
+
+        combo.write()
+        written[combo.names] = combo
+
+
+def _replace_deleted_combos(lookup_info: LookupInfo, cards: list['_AccessCard']) -> None:
+    # A combo a card has just been given may not have been used by any card when it was looked up, and have been deleted
+    # as an orphan since, see AccessCompactor. Checked inside the write's batch, so it can't be deleted again before the
+    # cards pointing at it are in.
+    combo_ids = {
+        card._acl_group_combo.id
+        for card in cards
+        if card._acl_group_combo.in_db and card._acl_group_combo.id != card._stored_combo_id
+    }
+    if len(combo_ids) == 0:
+        return
+
+    with lookup_info.new_session() as session:
+        existing = set(scalars_in(
+            session,
+            select(AclGrpCombo.ComboID).where(AclGrpCombo.LocGrp == lookup_info.location_group_id).distinct(),
+            AclGrpCombo.ComboID,
+            combo_ids,
+        ))
+    if existing == combo_ids:
+        return
+
+    lookup_info.invalidate(AclGrpCombo)
+    combo_lookup = AclGroupComboLookup(lookup_info)
+    for card in cards:
+        combo = card._acl_group_combo
+        if combo.id in combo_ids and combo.id not in existing:
+            # Finds another combo with the same names, or one that _write_combos writes
+            card._acl_group_combo = combo_lookup.by_names(combo.names)
+
+
+def _recompute_access(lookup_info: LookupInfo, acl_group_name_ids: set[int]) -> int:
+    # The change detector's event may not have reached the cache yet, and we have to see the new definitions
+    lookup_info.cache.invalidate(AclGrp, AclGrpName)
+
+    combo_ids = [
+        combo_id
+        for combo_id, name_ids in combo_name_ids(lookup_info).items()
+        if name_ids & acl_group_name_ids
+    ]
+    if len(combo_ids) == 0:
+        return 0
+
+    return _recompute_loc_cards(lookup_info, CARDS.AclGrpComboID, combo_ids)
+
+
+def _recompute_loc_cards(lookup_info: LookupInfo, column: ColumnElement, keys: list[int]) -> int:
+    with lookup_info.batch(), lookup_info.new_session() as session:
+        cards = execute_in(
+            session,
+            select(CARDS.ID, CARDS.AclGrpComboID).where(CARDS.LocGrp == lookup_info.location_group_id),
+            column,
+            keys,
+        )
 
+        resolver = _ComboAccessResolver(lookup_info, session)
+        loc_cards = _LocCardsWriter(lookup_info, session, [card.ID for card in cards], only_changes=True)
+        for card in cards:
+            loc_cards.apply(card.ID, resolver.resolve(card.AclGrpComboID))
+        loc_cards.flush()
 
-class _Unused:
-    pass
+        lookup_info.flag_locations_for_download(
+            session,
+            resolver.locations_to_update | loc_cards.locations_to_update,
+            "TzCs", "AclCs", "DGrpCs", "CodeCs",
+        )
+        session.commit()
 
+    return len(loc_cards.cards_updated)
 
-AccessCard = Union[_AccessCard, _Unused]
+
+# A DGRP row has a D0 to D127 column for each device at its location
+DEVICES_PER_GROUP = 128
+_DEVICE_COLUMNS = tuple(getattr(DGRP, f"D{i}") for i in range(DEVICES_PER_GROUP))
 
 
-class _AccessControlListUpdater:
+def device_mask(devices: Iterable[int]) -> int:
     """
-    Updating the ACL stuff requires a lot of the same variables repeatedly. Instead of making it one long function or
-    making several functions that pass things from one function to another, I made this helper class. Creating this
-    class ensures that everything is set up correctly. You don't need to access or do anything with the class after it's
-    created. All functions that need to be called are called in the correct order in __init__.
+    The devices in a device group as one number, bit n set for device n. Devices past the last DGRP column are ignored.
     """
+    mask = 0
+    for device in devices:
+        if 0 <= device < DEVICES_PER_GROUP:
+            mask |= 1 << device
+    return mask
 
-    def __init__(self,
-                 location_group_id: int,
-                 card_id: int,
-                 acl_group_combo_id: int,
-                 session: Session,
-                 updated_callback: Callable[[Any], None]):
-        self._location_group_id = location_group_id
-        self._card_id = card_id
-        self._acl_group_combo_id = acl_group_combo_id
-        self._session = session
-        self._update_callback = updated_callback
 
-        self._location_ids_to_update: set[int] = set()
+def device_group_index(session: Session, location_id: int) -> dict[int, int]:
+    """
+    :return: {device mask -> DGrp} for every device group at the location
+    """
+    return device_group_indexes(session, [location_id]).get(location_id, {})
 
-        self._locations: list[int] = self.__get_locations()
-        self._acl_group_name_ids: list[int] = self.__get_acl_group_name_ids()
 
-        if len(self._acl_group_name_ids) == 0:
-            self._deactivate_loc_cards()
-            self.__update_locations()
-            return
+def device_group_indexes(session: Session, location_ids: Iterable[int]) -> dict[int, dict[int, int]]:
+    """
+    :return: {location_id -> {device mask -> DGrp}} for every device group at these locations
+    """
+    # We grab all the DGRP rows for the location. Trying to limit on the devices can cause an error in the MDB
+    # database.
+    rows = session.execute(
+        select(DGRP.Loc, DGRP.DGrp, *_DEVICE_COLUMNS)
+        .where(DGRP.Loc.in_(list(location_ids)))
+    ).all()
+
+    indexes: dict[int, dict[int, int]] = {}
+    for row in rows:
+        # If two groups have the same devices, the first one wins
+        indexes.setdefault(row[0], {}).setdefault(
+            device_mask(i for i, enabled in enumerate(row[2:]) if enabled), row[1]
+        )
+    return indexes
 
-        update_to_master = any(self._session.scalars(
-            select(AclGrpName.IsMaster)
-            .where(AclGrpName.LocGrp == self._location_group_id)
-            .where(AclGrpName.ID.in_(self._acl_group_name_ids))
-        ).all())
 
-        if update_to_master:
-            self.__update_loc_cards_to_master()
-            self.__update_locations()
-            return
+# Values for LocCards.Acl through Acl4
+_LocCardsAcls = tuple[int, int, int, int, int]
+_NO_ACCESS: _LocCardsAcls = (-1, -1, -1, -1, -1)
+# Everything a combo's resolved access depends on
+_COMBO_ACCESS_TABLES = (AclGrp, AclGrpName, AclGrpCombo, DGRP, ACL, LOC)
+_MASTER_ACCESS: _LocCardsAcls = (0, -1, -1, -1, -1)
 
-        self._acl_groups: list[AclGrp] = self.__get_acl_groups()
-        # The next two dictionaries are {location_id -> {timezone -> X}}
-        self._acl_groups_grouped: dict[int, dict[int, list[AclGrp]]] = self.__get_acl_groups_grouped()
-        self._device_groups: dict[int, dict[int, DGRP]] = self.__get_device_groups()
-        # This one is {location_id -> [ACL]}
-        self._acls: dict[int, list[ACL]] = self.__get_acls()
-        self._loc_cards: list[LocCards] = self.__get_loc_cards()
-
-        self.__update_locations()
-
-    def __get_acl_group_name_ids(self) -> list[int]:
-        return list(self._session.scalars(
-            select(AclGrpName.ID)
-            .join(AclGrpCombo, AclGrpCombo.AclGrpNameID == AclGrpName.ID)
-            .where(AclGrpName.LocGrp == self._location_group_id)
-            .where(AclGrpCombo.LocGrp == self._location_group_id)
-            .where(AclGrpCombo.ComboID == self._acl_group_combo_id)
-        ).all())
 
-    def __get_locations(self) -> list[int]:
-        return list(self._session.scalars(
-            select(LOC.Loc)
-            .where(LOC.LocGrp == self._location_group_id)
-        ).all())
+class _ComboAccessResolver:
+    """
+    Works out which ACLs each combo needs at each location, creating any DGRP and ACL rows that don't exist yet. Cards
+    that share a combo share the answer, and it's kept in the reference data cache until one of the tables it came from
+    changes, so writing a card with a combo we've seen before only touches CARDS and LocCards.
+    """
+
+    def __init__(self, lookup_info: LookupInfo, session: Session):
+        self._lookup_info = lookup_info
+        self._session = session
+        self._locations: list[int] = list(lookup_info.location_ids())
+        # {combo_id -> {location_id -> acls}}
+        self._resolved: dict[Optional[int], dict[int, _LocCardsAcls]] = {}
+        # {location_id -> {device mask -> DGrp}}, every device group at that location
+        self._device_groups: dict[int, dict[int, int]] = {}
+        # Locations we added DGRP or ACL rows to
+        self.locations_to_update: set[int] = set()
+
+    def resolve(self, combo_id: Optional[int]) -> dict[int, _LocCardsAcls]:
+        """
+        :return: {location_id -> the ACLs to set on LocCards there}. Locations the combo doesn't grant anything at are
+                 left out, unless the combo has no access at all.
+        """
+        if combo_id not in self._resolved:
+            self._resolved[combo_id] = self._lookup_info.cache.get(
+                f"combo_access:{combo_id}",
+                _COMBO_ACCESS_TABLES,
+                lambda: self._resolve(combo_id),
+            )
+        return self._resolved[combo_id]
+
+    def _resolve(self, combo_id: Optional[int]) -> dict[int, _LocCardsAcls]:
+        acl_group_name_ids = self._acl_group_name_ids(combo_id)
+
+        if len(acl_group_name_ids) == 0:
+            return {location_id: _NO_ACCESS for location_id in self._locations}
+
+        is_master = any(
+            acl_group_name.is_master
+            for acl_group_name in acl_group_names(self._lookup_info).values()
+            if acl_group_name.id in acl_group_name_ids
+        )
+        if is_master:
+            return {location_id: _MASTER_ACCESS for location_id in self._locations}
 
-    def __get_acl_groups(self) -> list[AclGrp]:
-        return list(self._session.scalars(
+        acl_groups: list[AclGrp] = list(self._session.scalars(
             select(AclGrp)
             .where(AclGrp.Loc.in_(self._locations))
-            .where(AclGrp.AclGrpNameID.in_(self._acl_group_name_ids))
+            .where(AclGrp.AclGrpNameID.in_(acl_group_name_ids))
         ).all())
 
-    def __get_acl_groups_grouped(self) -> dict[int, dict[int, list[AclGrp]]]:
+        result: dict[int, _LocCardsAcls] = {}
+        for location_id, timezone_acl_groups in self._group_by_location_and_timezone(acl_groups).items():
+            acl_ids: set[int] = set()
+            for timezone, timezone_groups in timezone_acl_groups.items():
+                device_group_id = self._device_group_id(location_id, {x.Dev for x in timezone_groups})
+                acl_ids.add(self._acl(location_id, timezone, device_group_id).Acl)
+
+            result[location_id] = (
+                acl_ids.pop() if acl_ids else -1,
+                acl_ids.pop() if acl_ids else -1,
+                acl_ids.pop() if acl_ids else -1,
+                acl_ids.pop() if acl_ids else -1,
+                acl_ids.pop() if acl_ids else -1,
+            )
+
+        return result
+
+    def _acl_group_name_ids(self, combo_id: Optional[int]) -> list[int]:
+        name_ids = combo_name_ids(self._lookup_info).get(combo_id, frozenset())
+        known_name_ids = {acl_group_name.id for acl_group_name in acl_group_names(self._lookup_info).values()}
+        return [name_id for name_id in name_ids if name_id in known_name_ids]
+
+    @staticmethod
+    def _group_by_location_and_timezone(acl_groups: list[AclGrp]) -> dict[int, dict[int, list[AclGrp]]]:
         result: dict[int, dict[int, list[AclGrp]]] = {}
 
-        for acl_group in self._acl_groups:
+        for acl_group in acl_groups:
             if acl_group.Loc not in result:
                 result[acl_group.Loc] = {}
 
@@ -351,201 +694,137 @@ class _AccessControlListUpdater:
 
         return result
 
-    def __get_device_groups(self) -> dict[int, dict[int, DGRP]]:
-        result: dict[int, dict[int, DGRP]] = {}
-        acl_groups: list[AclGrp]
-        for location_id, timezone_acl_groups in self._acl_groups_grouped.items():
-            result[location_id] = {}
-            for timezone, acl_groups in timezone_acl_groups.items():  # The timezone doesn't matter here
-                devices = set(x.Dev for x in acl_groups)
-
-                # We grab all the DGRP rows for this location. Trying to limit on the devices can cause an error in the
-                # MDB database.
-                device_groups = self._session.scalars(
-                    select(DGRP)
-                    .where(DGRP.Loc == location_id)
-                ).all()
-
-                device_group: Optional[DGRP] = None
-                for group in device_groups:
-                    mismatch = False
-
-                    for i in range(128):
-                        device_enabled: bool = getattr(group, f"D{i}")
-                        if device_enabled != (i in devices):
-                            mismatch = True
-                            break
-
-                    if not mismatch:
-                        device_group = group
-                        break
-
-                if device_group is not None:
-                    result[location_id][timezone] = device_group
-                    continue
-
-                new_device_group: DGRP = DGRP(
-                    Loc=location_id,
-                    DlFlag=1,
-                    CkSum=0
-                )
-
-                for i in range(128):
-                    setattr(new_device_group, f"D{i}", (i in devices))
-
-                new_device_group.DGrp = self._session.scalar(select(func.max(DGRP.DGrp))) + 1  # Grab the next one
-                self._session.add(new_device_group)
-                self._session.commit()
-                result[location_id][timezone] = new_device_group
-                # We added a new DGrp, so update this location
-                self._location_ids_to_update.add(location_id)
-
-        return result
-
-    def __get_acls(self) -> dict[int, list[ACL]]:
-        result: dict[int, list[ACL]] = {}
-
-        for location_id, timezone_device_groups in self._device_groups.items():
-            result[location_id] = []
-            for timezone, device_group in timezone_device_groups.items():
-                acl: Optional[ACL] = self._session.scalar(
-                    select(ACL)
-                    .where(ACL.Loc == location_id)
-                    .where(ACL.Tz == timezone)
-                    .where(ACL.DGrp == device_group.DGrp)
-                )
-
-                if acl is None:
-                    acl = ACL(
-                        Loc=location_id,
-                        Tz=timezone,
-                        DGrp=device_group.DGrp,
-                        Acl=self._session.scalar(select(func.max(ACL.Acl))) + 1,  # Grab the next one
-                        DlFlag=1,
-                        CkSum=0
-                    )
-                    self._session.add(acl)
-                    self._session.commit()
+    def _device_group_id(self, location_id: int, devices: set[int]) -> int:
+        if location_id not in self._device_groups:
+            self._device_groups[location_id] = device_group_index(self._session, location_id)
 
-                    # We added a new ACL, so update this location
-                    self._location_ids_to_update.add(location_id)
+        mask = device_mask(devices)
+        device_group_id = self._device_groups[location_id].get(mask)
+        if device_group_id is not None:
+            return device_group_id
 
-                result[location_id].append(acl)
+        new_device_group: DGRP = DGRP(
+            Loc=location_id,
+            DlFlag=1,
+            CkSum=0
+        )
 
-        return result
+        for i in range(DEVICES_PER_GROUP):
+            setattr(new_device_group, f"D{i}", (i in devices))
 
-    def __get_loc_cards(self) -> list[LocCards]:
-        result: list[LocCards] = []
+        new_device_group.DGrp = self._session.scalar(select(func.max(DGRP.DGrp))) + 1  # Grab the next one
+        self._session.add(new_device_group)
+        self._session.flush()
+        self._device_groups[location_id][mask] = new_device_group.DGrp
+        # We added a new DGrp, so update this location
+        self.locations_to_update.add(location_id)
+        self._lookup_info.invalidate(DGRP)
+        return new_device_group.DGrp
+
+    def _acl(self, location_id: int, timezone: int, device_group_id: int) -> ACL:
+        acl: Optional[ACL] = self._session.scalar(
+            select(ACL)
+            .where(ACL.Loc == location_id)
+            .where(ACL.Tz == timezone)
+            .where(ACL.DGrp == device_group_id)
+        )
 
-        for location_id, acls in self._acls.items():
-            acl_ids = set(x.Acl for x in acls)
-            loc_cards = self._session.scalar(
-                select(LocCards)
-                .where(LocCards.CardID == self._card_id)
-                .where(LocCards.Loc == location_id)
+        if acl is None:
+            acl = ACL(
+                Loc=location_id,
+                Tz=timezone,
+                DGrp=device_group_id,
+                Acl=self._session.scalar(select(func.max(ACL.Acl))) + 1,  # Grab the next one
+                DlFlag=1,
+                CkSum=0
             )
+            self._session.add(acl)
+            self._session.flush()
 
-            if loc_cards is None:
-                loc_cards = LocCards(
-                    Loc=location_id,
-                    CardID=self._card_id,
-                )
-
-            acl = acl_ids.pop() if acl_ids else -1
-            acl1 = acl_ids.pop() if acl_ids else -1
-            acl2 = acl_ids.pop() if acl_ids else -1
-            acl3 = acl_ids.pop() if acl_ids else -1
-            acl4 = acl_ids.pop() if acl_ids else -1
+            # We added a new ACL, so update this location
+            self.locations_to_update.add(location_id)
+            self._lookup_info.invalidate(ACL)
 
-            self.__set_loc_cards_acls(loc_cards, acl, acl1, acl2, acl3, acl4)
-            self._location_ids_to_update.add(location_id)
+        return acl
 
-        return result
 
-    def __update_locations(self):
-        for location_id in self._location_ids_to_update:
-            location = self._session.scalar(
-                select(LOC)
-                .where(LOC.LocGrp == self._location_group_id)
-                .where(LOC.Loc == location_id)
-            )
-            location.PlFlag = True
-            location.TzCs = 0
-            location.AclCs = 0
-            location.DGrpCs = 0
-            location.CodeCs = 0
-            self._session.add(location)
-
-            self._session.commit()
-
-    def _deactivate_loc_cards(self):
-        for location_id in self._locations:
-            loc_cards = self._session.scalar(
-                select(LocCards)
-                .where(LocCards.CardID == self._card_id)
-                .where(LocCards.Loc == location_id)
-            )
-
-            if loc_cards is None:
-                loc_cards = LocCards(
-                    Loc=location_id,
-                    CardID=self._card_id,
-                )
+class _LocCardsWriter:
+    """
+    Sets the ACLs on each card's LocCards rows, creating the rows that don't exist. Every existing row for the cards is
+    loaded up front, and new rows are inserted together when flushed.
 
-            self.__set_loc_cards_acls(loc_cards)
-            self._location_ids_to_update.add(location_id)
+    With only_changes, rows that already have the right ACLs are left alone, and existing rows at locations the card no
+    longer has access to are set to no access. That's for recomputing cards whose access definitions changed under them,
+    where most rows stay the same.
+    """
 
-    def __update_loc_cards_to_master(self):
-        for location_id in self._locations:
-            loc_cards = self._session.scalar(
-                select(LocCards)
-                .where(LocCards.CardID == self._card_id)
-                .where(LocCards.Loc == location_id)
+    def __init__(self, lookup_info: LookupInfo, session: Session, card_ids: list[int], only_changes: bool = False):
+        self._session = session
+        self._update_callback = lookup_info.updated_callback
+        self._only_changes = only_changes
+        self._locations: list[int] = list(lookup_info.location_ids())
+        self._rows: dict[tuple[int, int], LocCards] = {
+            (row.CardID, row.Loc): row
+            for row in scalars_in(
+                session,
+                select(LocCards).where(LocCards.Loc.in_(self._locations)),
+                LocCards.CardID,
+                card_ids,
             )
-
+        } if self._locations else {}
+        self._written: list[LocCards] = []
+        # Locations we set LocCards at
+        self.locations_to_update: set[int] = set()
+        # Cards that had a row written
+        self.cards_updated: set[int] = set()
+
+    def apply(self, card_id: int, acls_by_location: dict[int, _LocCardsAcls]) -> None:
+        if self._only_changes:
+            acls_by_location = {
+                **{location_id: _NO_ACCESS for (row_card_id, location_id) in self._rows if row_card_id == card_id},
+                **acls_by_location,
+            }
+
+        for location_id, acls in acls_by_location.items():
+            loc_cards = self._rows.get((card_id, location_id))
             if loc_cards is None:
                 loc_cards = LocCards(
                     Loc=location_id,
-                    CardID=self._card_id,
+                    CardID=card_id,
                 )
-
-            self.__set_loc_cards_acls(
-                    loc_cards,
-                    0  # This is what sets the Acl to master
-            )
-            self._location_ids_to_update.add(location_id)
-
-    def __set_loc_cards_acls(self,
-                             loc_cards: LocCards,
-                             acl: int = -1,
-                             acl1: int = -1,
-                             acl2: int = -1,
-                             acl3: int = -1,
-                             acl4: int = -1
-                             ) -> None:
-        acl_names = ["Acl", "Acl1", "Acl2", "Acl3", "Acl4"]
-        acl_ids = [acl, acl1, acl2, acl3, acl4]
-        for id_, name in zip(acl_ids, acl_names):
-            current_acl = getattr(loc_cards, name)
-
-            if current_acl == id_:
+                self._rows[(card_id, location_id)] = loc_cards
+            elif self._only_changes and _loc_cards_acls(loc_cards) == acls:
                 continue
 
-            setattr(loc_cards, name, id_)
+            for name, value in zip(("Acl", "Acl1", "Acl2", "Acl3", "Acl4"), acls):
+                if getattr(loc_cards, name) != value:
+                    setattr(loc_cards, name, value)
+
+            # 2 means delete, 1 means update. If they're all "no access" of -1, then we just delete the row.
+            loc_cards.DlFlag = 2 if acls == _NO_ACCESS else 1
+            loc_cards.CkSum = 0
 
-        # 2 means delete, 1 means update. If they're all "no access" of -1, then we just delete the row.
-        download = 2 if all(x == -1 for x in acl_ids) else 1
-        loc_cards.DlFlag = download
-        loc_cards.CkSum = 0
+            if loc_cards.ID is None:
+                # The model's nullable ID keeps SQLAlchemy from inserting several of these in one statement, and Access
+                # can't return the generated IDs for one anyway
+                self._session.add(loc_cards)
+                self._session.flush()
 
-        self._session.add(loc_cards)
+            self._written.append(loc_cards)
+            self.locations_to_update.add(location_id)
+            self.cards_updated.add(card_id)
+
+    def flush(self) -> None:
         self._session.flush()
 
-        self._session.commit()
-        self._update_callback(LocCardUpdated(
-            id=loc_cards.ID,
-            card_id=loc_cards.CardID,
-            location_id=loc_cards.Loc,
-        ))
+        for loc_cards in self._written:
+            self._update_callback(LocCardUpdated(
+                id=loc_cards.ID,
+                card_id=loc_cards.CardID,
+                location_id=loc_cards.Loc,
+            ))
+        self._written = []
 
 
+def _loc_cards_acls(loc_cards: LocCards) -> _LocCardsAcls:
+    return loc_cards.Acl, loc_cards.Acl1, loc_cards.Acl2, loc_cards.Acl3, loc_cards.Acl4
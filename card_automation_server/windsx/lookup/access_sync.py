@@ -0,0 +1,149 @@
+from dataclasses import dataclass
+from typing import Union, Mapping, Iterable, Optional
+
+from card_automation_server.windsx.db.scheduler import Priority
+from card_automation_server.windsx.lookup.access_card import AccessCardLookup, AccessCard, InvalidPersonForAccessCard
+from card_automation_server.windsx.lookup.acl_group_combo import AclGroupNameNotInDatabase, acl_group_names
+from card_automation_server.windsx.lookup.download_staging import DownloadStager
+from card_automation_server.windsx.lookup.person import Person, PersonLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo, chunked
+
+# How many cards go into one transaction. Each batch holds the database until it commits, so this keeps card scans from
+# waiting on the whole sync.
+_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class DesiredCard:
+    """
+    What a card should look like once the sync is done
+    """
+    person: Union[Person, int]  # The person, or their NAMES id
+    access: frozenset[str] = frozenset()
+
+    @property
+    def person_id(self) -> int:
+        return self.person if isinstance(self.person, int) else self.person.id
+
+
+@dataclass(frozen=True)
+class AccessSyncReport:
+    """
+    Card numbers, for each kind of change the sync made (or would have made, for a dry run)
+    """
+    created: tuple[int, ...] = ()
+    updated: tuple[int, ...] = ()
+    deactivated: tuple[int, ...] = ()
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> int:
+        return len(self.created) + len(self.updated) + len(self.deactivated)
+
+
+def _normalize_card_number(card_number: Union[int, str]) -> int:
+    return int(str(card_number).lstrip('0') or 0) if isinstance(card_number, str) else card_number
+
+
+def _needs_update(card: AccessCard, desired: DesiredCard) -> bool:
+    # Status is written from the access names, so a card whose Status disagrees with them needs writing too
+    return (
+        card.name_id != desired.person_id
+        or card.access != desired.access
+        or card.active != (len(desired.access) > 0)
+    )
+
+
+class AccessSync:
+    """
+    Makes the cards in our location group match a desired state, e.g. everyone in an external membership system. The
+    current cards are read in bulk and compared with what's wanted, and only the cards that differ are written, so
+    cards that didn't change aren't rewritten and don't cause hardware downloads.
+
+    With a stager, the changed cards are staged instead of written, and go out to the controllers in waves.
+    """
+
+    def __init__(self, lookup_info: LookupInfo, stager: Optional[DownloadStager] = None):
+        self._lookup_info = lookup_info
+        self._stager = stager
+
+    def apply(self,
+              desired: Mapping[Union[int, str], DesiredCard],
+              deactivate_missing: bool = False,
+              dry_run: bool = False) -> AccessSyncReport:
+        """
+        :param desired: {card number -> what that card should be}
+        :param deactivate_missing: Remove all access from active cards that aren't in desired. Only use this when desired
+                                   really is every card in the location group.
+        :param dry_run: Work out and return the changes without writing anything
+        :raises AclGroupNameNotInDatabase: An access name doesn't exist. Nothing is written.
+        :raises InvalidPersonForAccessCard: A person in desired doesn't exist. Nothing is written. Cards are deactivated
+                                            even if their person is gone.
+        """
+        desired = {_normalize_card_number(card_number): card for card_number, card in desired.items()}
+        self._check_access_names(card.access for card in desired.values())
+
+        with self._lookup_info.priority(Priority.BULK):
+            access_card_lookup = AccessCardLookup(self._lookup_info)
+            current = {card.card_number: card for card in access_card_lookup.all()}
+
+            to_deactivate = [
+                card for card_number, card in current.items()
+                if deactivate_missing and card_number not in desired and (card.active or card.access)
+            ]
+            # Cards being deactivated keep the person they have, which may have been deleted since
+            people = self._people({card.person_id for card in desired.values()})
+
+            to_write: list[AccessCard] = []
+            created: list[int] = []
+            updated: list[int] = []
+            unchanged = 0
+
+            for card_number, wanted in desired.items():
+                card = current.get(card_number)
+                if card is None:
+                    card = access_card_lookup.new(card_number)
+                    created.append(card_number)
+                elif _needs_update(card, wanted):
+                    updated.append(card_number)
+                else:
+                    unchanged += 1
+                    continue
+
+                card.person = people[wanted.person_id]
+                card.with_access(*(wanted.access - card.access))
+                card.without_access(*(card.access - wanted.access))
+                to_write.append(card)
+
+            for card in to_deactivate:
+                card.without_access(*card.access)
+                to_write.append(card)
+
+            if not dry_run and self._stager is not None:
+                self._stager.stage(*to_write)
+            elif not dry_run:
+                for batch in chunked(to_write, _BATCH_SIZE):
+                    access_card_lookup.write_many(batch)
+
+        return AccessSyncReport(
+            created=tuple(created),
+            updated=tuple(updated),
+            deactivated=tuple(card.card_number for card in to_deactivate),
+            unchanged=unchanged,
+        )
+
+    def _check_access_names(self, access: Iterable[frozenset[str]]) -> None:
+        known_names = acl_group_names(self._lookup_info)
+        for names in access:
+            for name in names:
+                if name not in known_names:
+                    raise AclGroupNameNotInDatabase(name)
+
+    def _people(self, person_ids: set[int]) -> dict[int, Person]:
+        people = {person.id: person for person in PersonLookup(self._lookup_info).by_ids(*person_ids)}
+
+        for person_id in person_ids:
+            if person_id not in people:
+                raise InvalidPersonForAccessCard(f"Person {person_id} was not found")
+
+        return people
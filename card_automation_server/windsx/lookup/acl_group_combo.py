@@ -1,11 +1,12 @@
-from itertools import groupby
+from dataclasses import dataclass
 from typing import Optional, Union, Iterable, Dict, Collection, List
 
 from sqlalchemy import select
-from sqlalchemy.orm import Session
 
+from card_automation_server.windsx.db.bulk_keys import execute_in
 from card_automation_server.windsx.db.models import AclGrpCombo, AclGrpName
-from card_automation_server.windsx.lookup.utils import LookupInfo, chunked
+from card_automation_server.windsx.lookup.cache import invalidates
+from card_automation_server.windsx.lookup.utils import LookupInfo
 
 StringOrFrozenSet = Union[str, frozenset[str], Iterable[str]]
 
@@ -30,6 +31,68 @@ class AclGroupNameNotInDatabase(_AclGroupNameNotFound):
         super().__init__(f"\"{name}\" was not found in the database", name)
 
 
+@dataclass(frozen=True)
+class AclGroupName:
+    id: int
+    name: str
+    is_master: bool
+
+
+def acl_group_names(lookup_info: LookupInfo) -> dict[str, AclGroupName]:
+    """
+    :return: {name -> AclGroupName} for every ACL group name in our location group
+    """
+    location_group_id = lookup_info.location_group_id
+
+    def _load() -> dict[str, AclGroupName]:
+        with lookup_info.new_session() as session:
+            return {
+                row.Name: AclGroupName(id=row.ID, name=row.Name, is_master=bool(row.IsMaster))
+                for row in session.execute(
+                    select(AclGrpName.ID, AclGrpName.Name, AclGrpName.IsMaster)
+                    .where(AclGrpName.LocGrp == location_group_id)
+                ).all()
+            }
+
+    return lookup_info.cache.get("acl_group_names", [AclGrpName], _load)
+
+
+def combo_name_ids(lookup_info: LookupInfo) -> dict[int, frozenset[int]]:
+    """
+    :return: {combo id -> ACL group name ids in it} for every combo in our location group
+    """
+    location_group_id = lookup_info.location_group_id
+
+    def _load() -> dict[int, frozenset[int]]:
+        combos: dict[int, set[int]] = {}
+        with lookup_info.new_session() as session:
+            for row in session.execute(
+                select(AclGrpCombo.ComboID, AclGrpCombo.AclGrpNameID)
+                .where(AclGrpCombo.LocGrp == location_group_id)
+            ).all():
+                combos.setdefault(row.ComboID, set()).add(row.AclGrpNameID)
+
+        return {combo_id: frozenset(name_ids) for combo_id, name_ids in combos.items()}
+
+    return lookup_info.cache.get("combo_name_ids", [AclGrpCombo], _load)
+
+
+def combo_ids_by_name_ids(lookup_info: LookupInfo) -> dict[frozenset[int], int]:
+    """
+    :return: {ACL group name ids -> combo id}, the other way around from combo_name_ids. If more than one combo has the
+             same names, the lowest combo id is used.
+    """
+
+    def _load() -> dict[frozenset[int], int]:
+        index: dict[frozenset[int], int] = {}
+        for combo_id, name_ids in combo_name_ids(lookup_info).items():
+            if name_ids not in index or combo_id < index[name_ids]:
+                index[name_ids] = combo_id
+        return index
+
+    return lookup_info.cache.get("combo_ids_by_name_ids", [AclGrpCombo], _load)
+
+
 class AclGroupComboLookup:
     def __init__(self, lookup_info: LookupInfo):
         self._lookup_info: LookupInfo = lookup_info
@@ -47,7 +110,7 @@ class AclGroupComboLookup:
         return self.empty().with_names(*names)
 
     def by_id(self, combo_id: int) -> Optional['AclGroupComboSet']:
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.new_read_session() as session:
             rows = session.execute(
                 self._base_statement.where(AclGrpCombo.ComboID == combo_id)
             ).all()
@@ -58,13 +121,10 @@ class AclGroupComboLookup:
 
     def by_ids(self, *combo_ids: int) -> List['AclGroupComboSet']:
         combos: Dict[int, frozenset[str]] = {}
-        with self._lookup_info.new_session() as session:
-            for chunk in chunked(list(combo_ids)):
-                for row in session.execute(
-                    self._base_statement.where(AclGrpCombo.ComboID.in_(chunk))
-                ).all():
-                    combo_id, name = row.ComboID, row.Name
-                    combos[combo_id] = combos.get(combo_id, frozenset()) | {name}
+        with self._lookup_info.new_read_session() as session:
+            for row in execute_in(session, self._base_statement, AclGrpCombo.ComboID, combo_ids):
+                combo_id, name = row.ComboID, row.Name
+                combos[combo_id] = combos.get(combo_id, frozenset()) | {name}
 
         return [
             _AclGroupComboSet(self._lookup_info, combo_id, names)
@@ -72,7 +132,7 @@ class AclGroupComboLookup:
         ]
 
     def all(self) -> List['AclGroupComboSet']:
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.new_read_session() as session:
             rows = session.execute(self._base_statement).all()
 
             combos: Dict[int, frozenset[str]] = {}
@@ -86,6 +146,7 @@ class AclGroupComboLookup:
             ]
 
 
+@invalidates(AclGrpCombo)
 class _AclGroupComboSet:
     def __init__(self,
                  lookup_info: LookupInfo,
@@ -127,26 +188,15 @@ class _AclGroupComboSet:
 
         return result
 
-    def _name_ids_by_name(self, session: Session, names: Collection[str]) -> Dict[str, int]:
-        if len(names) == 0:
-            # Our tests would handle the below SQL statement just fine, but Microsoft Access is less happy with it.
-            return {}
-
-        acl_group_name_rows = session.execute(
-            select(AclGrpName.ID, AclGrpName.Name)
-            .where(AclGrpName.Name.in_(names))
-            .where(AclGrpName.LocGrp == self._location_group_id)
-        ).all()
+    def _name_ids_by_name(self, names: Collection[str]) -> Dict[str, int]:
+        known_names = acl_group_names(self._lookup_info)
 
         names_to_ids = {}
+        for name in names:
+            if name not in known_names:
+                raise AclGroupNameNotInDatabase(name)
 
-        for row in acl_group_name_rows:
-            names_to_ids[row[1]] = row[0]
-
-        if len(names) != len(names_to_ids):  # Something doesn't match up here, meaning we're missing a name
-            for name in names:
-                if name not in names_to_ids:
-                    raise AclGroupNameNotInDatabase(name)
+            names_to_ids[name] = known_names[name].id
 
         return names_to_ids
 
@@ -168,22 +218,11 @@ class _AclGroupComboSet:
         return self._get_acl_by_names(new_names)
 
     def _get_acl_by_names(self, all_names: frozenset[str]) -> 'AclGroupComboSet':
-        with self._lookup_info.new_session() as session:
-            wanted_name_ids = set(self._name_ids_by_name(session, all_names).values())
-
-            acl_combos = session.execute(
-                select(AclGrpCombo.AclGrpNameID, AclGrpCombo.ComboID)
-                .where(AclGrpCombo.LocGrp == self._location_group_id)
-            ).all()
-            grouped_by_combo_id = groupby(acl_combos, lambda x: x[1])  # Group by the Combo ID
-
-            for new_combo_id, value in grouped_by_combo_id:
-                acl_name_ids = set([x.AclGrpNameID for x in value])
-                if acl_name_ids == wanted_name_ids:  # Oh good, we found an exact match
-                    return _AclGroupComboSet(self._lookup_info, new_combo_id, all_names)
+        wanted_name_ids = frozenset(self._name_ids_by_name(all_names).values())
 
-        # This doesn't exist, so we create one with the names but mark it as not in the database
-        return _AclGroupComboSet(self._lookup_info, None, all_names)
+        # None if this doesn't exist, so we create one with the names but mark it as not in the database
+        new_combo_id = combo_ids_by_name_ids(self._lookup_info).get(wanted_name_ids)
+        return _AclGroupComboSet(self._lookup_info, new_combo_id, all_names)
 
     def write(self):
         if self.in_db:
@@ -192,8 +231,9 @@ class _AclGroupComboSet:
         if len(self._names) == 0:
             return
 
-        with self._lookup_info.new_session() as session:
-            names_to_ids = self._name_ids_by_name(session, self._names)
+        names_to_ids = self._name_ids_by_name(self._names)
+
+        with self._lookup_info.batch(), self._lookup_info.new_session() as session:
             name_id_iterator = iter(names_to_ids.values())
 
             # We need to insert one of them to get a new combo id. The ID field gets a generated ID, which we treat as the
@@ -0,0 +1,92 @@
+import threading
+from typing import Callable, TypeVar, Optional, Iterable, Any
+
+from card_automation_server.metrics import Metrics
+
+T = TypeVar('T')
+
+# {class -> the tables its updated_callback means were written to}, filled in by @invalidates
+_invalidated_tables: dict[type, tuple[type, ...]] = {}
+
+
+def invalidates(*tables: type):
+    """
+    Marks which tables have been written to when an instance of this class is passed to updated_callback, so
+    LookupInfo can drop anything cached from those tables.
+    """
+
+    def _inner(cls: type[T]) -> type[T]:
+        _invalidated_tables[cls] = tables
+        return cls
+
+    return _inner
+
+
+def tables_written_by(value: Any) -> tuple[type, ...]:
+    for cls in type(value).__mro__:
+        if cls in _invalidated_tables:
+            return _invalidated_tables[cls]
+
+    return ()
+
+
+class _Entry:
+    def __init__(self, value: Any, tables: frozenset[type]):
+        self.value = value
+        self.tables = tables
+
+
+class ReferenceDataCache:
+    """
+    Holds data from tables that rarely change (locations, doors, ACL group names, UDF definitions...) so lookups don't
+    have to query it every time. Entries are dropped when any table they were loaded from is invalidated, which happens
+    when the ACS database changes on disk and whenever we write to one of those tables ourselves.
+
+    Only cache plain values (ints, strings, tuples, frozen dataclasses), never ORM objects, since they're shared between
+    threads and sessions.
+    """
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._lock = threading.Lock()
+        self._entries: dict[str, _Entry] = {}
+        # Bumped on every invalidation, so a load that raced with one doesn't put stale data back
+        self._generation: int = 0
+
+    def get(self, key: str, tables: Iterable[type], loader: Callable[[], T]) -> T:
+        """
+        :param key: Unique name for this data. If it depends on arguments, include them in the key.
+        :param tables: Every table the loader reads from.
+        :param loader: Called to load the data when it isn't cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generation
+
+        if entry is not None:
+            self._metrics.counter("reference_cache_hits", key=key.split(":")[0]).inc()
+            return entry.value
+
+        self._metrics.counter("reference_cache_misses", key=key.split(":")[0]).inc()
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = _Entry(value, frozenset(tables))
+
+        return value
+
+    def invalidate(self, *tables: type) -> None:
+        tables = frozenset(tables)
+        if len(tables) == 0:
+            return
+
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, entry in self._entries.items() if entry.tables & tables]:
+                del self._entries[key]
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
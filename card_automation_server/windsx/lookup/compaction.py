@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import select, delete, exists, or_
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.models import AclGrpCombo, CARDS, ACL, LocCards, DGRP, AclName
+from card_automation_server.windsx.db.scheduler import Priority
+from card_automation_server.windsx.lookup.utils import LookupInfo, chunked
+
+# How many rows are deleted in one transaction
+_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class CompactionReport:
+    """
+    How many of each were deleted
+    """
+    combos: int = 0
+    acls: int = 0
+    device_groups: int = 0
+
+    @property
+    def deleted(self) -> int:
+        return self.combos + self.acls + self.device_groups
+
+
+class AccessCompactor:
+    """
+    Card writes only ever add AclGrpCombo combos, DGRP device groups and ACL rows, so they pile up as access changes. This
+    deletes the ones in our location group that nothing refers to anymore:
+
+    - A combo no card has, as its access or its temporary access, and no AclName refers to
+    - An ACL no LocCards row at its location has in Acl through Acl4, and that has no AclName, since operators name the
+      ACLs they set up by hand
+    - A device group no ACL at its location uses
+
+    ACLs go before device groups, so device groups only used by orphaned ACLs are removed in the same run. Each batch
+    looks for orphans again inside its own transaction, so a card written in between can't lose anything it uses.
+    """
+
+    def __init__(self, lookup_info: LookupInfo, batch_size: int = _BATCH_SIZE):
+        self._lookup_info = lookup_info
+        self._location_group_id = lookup_info.location_group_id
+        self._batch_size = batch_size
+
+    def compact(self) -> CompactionReport:
+        with self._lookup_info.priority(Priority.BULK):
+            return CompactionReport(
+                combos=self._delete_in_batches(self._delete_orphaned_combos),
+                acls=self._delete_in_batches(self._delete_orphaned_acls),
+                device_groups=self._delete_in_batches(self._delete_orphaned_device_groups),
+            )
+
+    def _delete_in_batches(self, delete_batch: Callable[[Session], int]) -> int:
+        total = 0
+        while True:
+            with self._lookup_info.batch(), self._lookup_info.new_session() as session:
+                deleted = delete_batch(session)
+                session.commit()
+
+            total += deleted
+            if deleted < self._batch_size:
+                return total
+
+    def _delete_orphaned_combos(self, session: Session) -> int:
+        combo_ids = session.scalars(
+            select(AclGrpCombo.ComboID)
+            .where(AclGrpCombo.LocGrp == self._location_group_id)
+            .where(~exists().where(
+                CARDS.LocGrp == self._location_group_id,
+                or_(
+                    CARDS.AclGrpComboID == AclGrpCombo.ComboID,
+                    CARDS.TempAclGrpComboID == AclGrpCombo.ComboID,
+                ),
+            ))
+            .where(~exists().where(
+                AclName.Loc.in_(self._lookup_info.location_ids()),
+                AclName.AclGrpComboID == AclGrpCombo.ComboID,
+            ))
+            .distinct()
+            .limit(self._batch_size)
+        ).all()
+
+        for chunk in chunked(list(combo_ids)):
+            session.execute(
+                delete(AclGrpCombo)
+                .where(AclGrpCombo.LocGrp == self._location_group_id)
+                .where(AclGrpCombo.ComboID.in_(chunk))
+            )
+
+        if combo_ids:
+            self._lookup_info.invalidate(AclGrpCombo)
+        return len(combo_ids)
+
+    def _delete_orphaned_acls(self, session: Session) -> int:
+        rows = session.execute(
+            select(ACL.ID, ACL.Loc)
+            .where(ACL.Loc.in_(self._lookup_info.location_ids()))
+            .where(ACL.Acl > 0)  # 0 is master access, which has no ACL row of its own
+            .where(~exists().where(
+                LocCards.Loc == ACL.Loc,
+                or_(
+                    LocCards.Acl == ACL.Acl,
+                    LocCards.Acl1 == ACL.Acl,
+                    LocCards.Acl2 == ACL.Acl,
+                    LocCards.Acl3 == ACL.Acl,
+                    LocCards.Acl4 == ACL.Acl,
+                ),
+            ))
+            .where(~exists().where(
+                AclName.Loc == ACL.Loc,
+                AclName.Acl == ACL.Acl,
+            ))
+            .limit(self._batch_size)
+        ).all()
+
+        return self._delete_rows(session, ACL, rows, "AclCs")
+
+    def _delete_orphaned_device_groups(self, session: Session) -> int:
+        rows = session.execute(
+            select(DGRP.ID, DGRP.Loc)
+            .where(DGRP.Loc.in_(self._lookup_info.location_ids()))
+            .where(DGRP.DGrp > 0)
+            .where(~exists().where(
+                ACL.Loc == DGRP.Loc,
+                ACL.DGrp == DGRP.DGrp,
+            ))
+            .limit(self._batch_size)
+        ).all()
+
+        return self._delete_rows(session, DGRP, rows, "DGrpCs")
+
+    def _delete_rows(self, session: Session, table: type, rows: list, checksum: str) -> int:
+        for chunk in chunked([row.ID for row in rows]):
+            session.execute(delete(table).where(table.ID.in_(chunk)))
+
+        if rows:
+            # 2 so the comm server removes them from the controllers too
+            self._lookup_info.flag_locations_for_download(session, {row.Loc for row in rows}, checksum, dl_flag=2)
+            self._lookup_info.invalidate(table)
+        return len(rows)
@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from datetime import timedelta
 from typing import Optional
 
@@ -9,53 +10,61 @@ from card_automation_server.windsx.lookup.utils import LookupInfo
 from card_automation_server.workers.events import DoorStateUpdate, DoorState
 
 
+@dataclass(frozen=True)
+class _DoorRow:
+    id: int
+    name: str
+    device_id: int
+    location_id: int
+
+
 class DoorLookup:
     def __init__(self,
                  lookup_info: LookupInfo,
                  *door_ids: int):
         self._lookup_info: LookupInfo = lookup_info
-        self._base_statement = (
-            select(DEV)
-            .join(LOC, LOC.Loc == DEV.Loc)
-            .where(LOC.LocGrp == lookup_info.location_group_id)
-        )
+        self._door_ids: frozenset[int] = frozenset(door_ids)
+
+    def _rows(self) -> tuple[_DoorRow, ...]:
+        location_group_id = self._lookup_info.location_group_id
+
+        def _load() -> tuple[_DoorRow, ...]:
+            with self._lookup_info.new_session() as session:
+                return tuple(
+                    _DoorRow(id=d.ID, name=d.Name, device_id=d.Device, location_id=d.Loc)
+                    for d in session.scalars(
+                        select(DEV)
+                        .join(LOC, LOC.Loc == DEV.Loc)
+                        .where(LOC.LocGrp == location_group_id)
+                    ).all()
+                )
+
+        rows = self._lookup_info.cache.get("doors", [DEV, LOC], _load)
+        if self._door_ids:
+            rows = tuple(row for row in rows if row.id in self._door_ids)
 
-        if door_ids:
-            self._base_statement = self._base_statement.where(DEV.ID.in_(door_ids))
+        return rows
+
+    def _door(self, row: Optional[_DoorRow]) -> Optional['Door']:
+        if row is None:
+            return None
+
+        return Door(self._lookup_info, row.id, row.name, row.device_id, row.location_id)
 
     def all(self) -> list['Door']:
-        with self._lookup_info.new_session() as session:
-            devs = session.scalars(self._base_statement).all()
-            return [Door(self._lookup_info, d.ID, d.Name, d.Device, d.Loc) for d in devs]
+        return [self._door(row) for row in self._rows()]
 
     def by_id(self, id_: int) -> Optional['Door']:
-        statement = self._base_statement.where(DEV.ID == id_)
-
-        with self._lookup_info.new_session() as session:
-            dev = session.scalar(statement)
-            return Door(self._lookup_info, dev.ID, dev.Name, dev.Device, dev.Loc) if dev is not None else None
+        return self._door(next((row for row in self._rows() if row.id == id_), None))
 
     def by_device_info(self, location_id: int, device_id: int) -> Optional['Door']:
-        statement = (
-            self._base_statement
-            .where(DEV.Loc == location_id)
-            .where(DEV.Device == device_id)
-        )
-
-        with self._lookup_info.new_session() as session:
-            dev = session.scalar(statement)
-            return Door(self._lookup_info, dev.ID, dev.Name, dev.Device, dev.Loc) if dev is not None else None
+        return self._door(next(
+            (row for row in self._rows() if row.location_id == location_id and row.device_id == device_id),
+            None
+        ))
 
     def by_card_scan(self, card_scan: CardScan) -> Optional['Door']:
-        statement = (
-            self._base_statement
-            .where(DEV.Loc == card_scan.location_id)
-            .where(DEV.Device == card_scan.device)
-        )
-
-        with self._lookup_info.new_session() as session:
-            dev = session.scalar(statement)
-            return Door(self._lookup_info, dev.ID, dev.Name, dev.Device, dev.Loc) if dev is not None else None
+        return self.by_device_info(card_scan.location_id, card_scan.device)
 
 
 class Door:
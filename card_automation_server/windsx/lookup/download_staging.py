@@ -0,0 +1,118 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, Any
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.scheduler import Priority
+from card_automation_server.windsx.lookup.access_card import AccessCard, AccessCardLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
+
+
+class DownloadStager:
+    """
+    Holds bulk card writes back so they reach the controllers in waves. Writing thousands of cards at once flags
+    thousands of LocCards for download, and a card written after that waits for all of them. Staged cards are only
+    written when release() is called, which DownloadStagingWorker does a wave at a time as the controllers keep up.
+
+    A card that's written any other way, e.g. card.write() for someone who needs access now, skips the queue, and any
+    staged copy of it is dropped so it can't overwrite that write later.
+
+    Staged cards are only kept in memory. DownloadStagingWorker writes whatever is left when it stops, but anything
+    staged is lost if the server crashes before then, even though AccessSync already reported it as written. Running the
+    sync again puts it right.
+    """
+
+    def __init__(self, lookup_info: LookupInfo, metrics: Optional[Metrics] = None):
+        self._lookup_info = lookup_info
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._lock = threading.Lock()
+        # {card number -> (the card, when it was staged)}, oldest first
+        self._staged: dict[int, tuple[AccessCard, datetime]] = {}
+        # Set while this thread writes a wave, so those writes don't drop cards staged again in the meantime
+        self._releasing = threading.local()
+
+        lookup_info.add_write_listener(self._on_write)
+
+    @property
+    def staged(self) -> int:
+        """
+        :return: How many cards are waiting to be written
+        """
+        with self._lock:
+            return len(self._staged)
+
+    def oldest_wait(self) -> timedelta:
+        """
+        :return: How long the card at the front of the queue has been waiting
+        """
+        with self._lock:
+            if len(self._staged) == 0:
+                return timedelta()
+            _, staged_at = next(iter(self._staged.values()))
+
+        return datetime.now() - staged_at
+
+    def stage(self, *cards: AccessCard) -> None:
+        """
+        Queues these cards to be written. A card that's already staged is replaced, and keeps its place in the queue.
+        """
+        now = datetime.now()
+        with self._lock:
+            for card in cards:
+                _, staged_at = self._staged.get(card.card_number, (None, now))
+                self._staged[card.card_number] = (card, staged_at)
+            self._update_gauge()
+
+    def write_now(self, card: AccessCard) -> None:
+        """
+        Same as card.write()
+        """
+        card.write()
+
+    def release(self, count: Optional[int] = None) -> int:
+        """
+        Writes the `count` cards that have been staged longest, or all of them. If writing fails, they're put back at
+        the front of the queue, unless they were staged again in the meantime.
+
+        :return: How many cards were written
+        """
+        with self._lock:
+            card_numbers = list(self._staged)[:count]
+            wave = [self._staged.pop(card_number) for card_number in card_numbers]
+            self._update_gauge()
+
+        if len(wave) == 0:
+            return 0
+
+        self._releasing.active = True
+        try:
+            with self._lookup_info.priority(Priority.BULK):
+                AccessCardLookup(self._lookup_info).write_many([card for card, _ in wave])
+        except Exception:
+            with self._lock:
+                newer = self._staged
+                self._staged = {card.card_number: (card, staged_at) for card, staged_at in wave}
+                self._staged.update(newer)
+                self._update_gauge()
+            raise
+        finally:
+            self._releasing.active = False
+
+        now = datetime.now()
+        histogram = self._metrics.histogram("download_staging_wait_seconds")
+        for _, staged_at in wave:
+            histogram.observe((now - staged_at).total_seconds())
+        self._metrics.counter("download_staging_released").inc(len(wave))
+
+        return len(wave)
+
+    def _on_write(self, value: Any) -> None:
+        if getattr(self._releasing, "active", False) or not isinstance(value, AccessCard):
+            return
+
+        with self._lock:
+            if self._staged.pop(value.card_number, None) is not None:
+                self._update_gauge()
+
+    def _update_gauge(self) -> None:
+        self._metrics.gauge("download_staging_backlog").set(len(self._staged))
@@ -1,10 +1,11 @@
 from datetime import date as date_type, datetime
-from typing import Optional, Union
+from typing import Optional, Union, Iterator, Iterable
 
 from sqlalchemy import select
-from sqlalchemy.orm import Session
 
+from card_automation_server.windsx.db.bulk_keys import scalars_in
 from card_automation_server.windsx.db.models import HOL, LOC
+from card_automation_server.windsx.lookup.cache import invalidates
 from card_automation_server.windsx.lookup.utils import LookupInfo
 
 
@@ -92,10 +93,26 @@ class HolidayLookup:
         holiday.write()
         return holiday
 
+    def iter_all(self, page_size: int = 500) -> Iterator["Holiday"]:
+        """
+        Same as all(), a page of holiday dates at a time
+        """
+        dates = select(HOL.HolDate).join(LOC, LOC.Loc == HOL.Loc) \
+            .where(LOC.LocGrp == self._lookup_info.location_group_id) \
+            .distinct()
+
+        for page in self._lookup_info.read_pages(dates, HOL.HolDate, page_size, key_of=lambda hol_date: hol_date):
+            with self._lookup_info.new_read_session() as session:
+                rows = scalars_in(session, self._base_statement, HOL.HolDate, page)
+            yield from self._build(rows)
+
     def _collect(self, statement) -> list["Holiday"]:
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.new_read_session() as session:
             rows = list(session.scalars(statement).all())
 
+        return self._build(rows)
+
+    def _build(self, rows: Iterable[HOL]) -> list["Holiday"]:
         # Each (HolDate) maps to one logical Holiday spanning every Loc in the group.
         by_date: dict[datetime, list[HOL]] = {}
         for row in rows:
@@ -115,6 +132,7 @@ class HolidayLookup:
         ]
 
 
+@invalidates(HOL)
 class _Holiday:
     def __init__(self,
                  lookup_info: LookupInfo,
@@ -178,11 +196,6 @@ class _Holiday:
     def recurring(self, value: bool):
         self._recurring = value
 
-    def _locations(self, session: Session) -> list[LOC]:
-        return list(session.scalars(
-            select(LOC).where(LOC.LocGrp == self._location_group_id)
-        ).all())
-
     def write(self):
         if self._date is None:
             raise Exception("Holiday requires a date before write")
@@ -198,24 +211,24 @@ class _Holiday:
             else None
         )
 
-        with self._lookup_info.new_session() as session:
-            locations = self._locations(session)
+        with self._lookup_info.batch(), self._lookup_info.new_session() as session:
+            locations = self._lookup_info.location_ids()
             if not locations:
                 raise NoLocationsInGroup(
                     f"Location group {self._location_group_id} has no locations to write a holiday to"
                 )
 
-            for location in locations:
+            for location_id in locations:
                 hol: Optional[HOL] = None
                 if original_dt is not None:
                     hol = session.scalar(
                         select(HOL)
-                        .where(HOL.Loc == location.Loc)
+                        .where(HOL.Loc == location_id)
                         .where(HOL.HolDate == original_dt)
                     )
 
                 if hol is None:
-                    hol = HOL(Loc=location.Loc, HolDate=target_dt)
+                    hol = HOL(Loc=location_id, HolDate=target_dt)
                 else:
                     hol.HolDate = target_dt
 
@@ -227,11 +240,7 @@ class _Holiday:
                 hol.CkSum = 0
                 session.add(hol)
 
-                location.DlFlag = 1
-                location.HolCs = 0
-                location.PlFlag = True
-                session.add(location)
-
+            self._lookup_info.flag_locations_for_download(session, locations, "HolCs", dl_flag=1)
             session.commit()
 
         self._in_db = True
@@ -244,22 +253,19 @@ class _Holiday:
 
         original_dt = datetime.combine(self._original_date, datetime.min.time())
 
-        with self._lookup_info.new_session() as session:
-            locations = self._locations(session)
-            for location in locations:
+        with self._lookup_info.batch(), self._lookup_info.new_session() as session:
+            locations = self._lookup_info.location_ids()
+            for location_id in locations:
                 hol = session.scalar(
                     select(HOL)
-                    .where(HOL.Loc == location.Loc)
+                    .where(HOL.Loc == location_id)
                     .where(HOL.HolDate == original_dt)
                 )
                 if hol is not None:
                     session.delete(hol)
 
-                location.DlFlag = 2
-                location.HolCs = 0
-                location.PlFlag = True
-                session.add(location)
-
+            if locations:
+                self._lookup_info.flag_locations_for_download(session, locations, "HolCs", dl_flag=2)
             session.commit()
 
         self._in_db = False
@@ -1,12 +1,15 @@
 import abc
 import enum
-from typing import Optional, Any, Sequence, Union, Pattern
+from dataclasses import dataclass
+from typing import Optional, Any, Sequence, Union, Pattern, Iterator
 
-from sqlalchemy import select
+from sqlalchemy import select, Select
 from sqlalchemy.orm import Session
 
+from card_automation_server.windsx.db.bulk_keys import execute_in, scalars_in
 from card_automation_server.windsx.db.models import NAMES, UDF, UdfName, CARDS, UdfSel
-from card_automation_server.windsx.lookup.utils import LookupInfo, chunked
+from card_automation_server.windsx.lookup.cache import invalidates
+from card_automation_server.windsx.lookup.utils import LookupInfo
 
 
 class InvalidUdfName(Exception):
@@ -36,17 +39,50 @@ class _SearchCriteria(enum.Enum):
     COMPANY_ID = enum.auto()
 
 
+@dataclass(frozen=True)
+class _UdfDefinition:
+    udf_num: int
+    name: str
+    required: bool
+    # Only set if the field has to be one of a fixed set of options
+    options: Optional[frozenset[str]]
+
+
+def _udf_definitions(lookup_info: LookupInfo) -> tuple[_UdfDefinition, ...]:
+    location_group_id = lookup_info.location_group_id
+
+    def _load() -> tuple[_UdfDefinition, ...]:
+        with lookup_info.new_session() as session:
+            options: dict[int, set[str]] = {}
+            for row in session.execute(
+                select(UdfSel.UdfNum, UdfSel.SelText).where(UdfSel.LocGrp == location_group_id)
+            ).all():
+                options.setdefault(row.UdfNum, set()).add(row.SelText)
+
+            return tuple(
+                _UdfDefinition(
+                    udf_num=udf_name.UdfNum,
+                    name=udf_name.Name,
+                    required=bool(udf_name.Required),
+                    options=frozenset(options.get(udf_name.UdfNum, ()))
+                    if udf_name.Combo and udf_name.ComboOnly else None,
+                )
+                for udf_name in session.scalars(select(UdfName).where(UdfName.LocGrp == location_group_id)).all()
+            )
+
+    return lookup_info.cache.get("udf_definitions", [UdfName, UdfSel], _load)
+
+
 def _load_udfs(session: Session, location_group_id: int, name_ids: list[int]) -> dict[int, dict[str, str]]:
     result: dict[int, dict[str, str]] = {name_id: {} for name_id in name_ids}
-    for chunk in chunked(name_ids):
-        for row in session.execute(
-            select(UdfName.Name, UDF.UdfText, UDF.NameID)
-            .join(UDF, UDF.UdfNum == UdfName.UdfNum)
-            .where(UdfName.LocGrp == location_group_id)
-            .where(UDF.LocGrp == location_group_id)
-            .where(UDF.NameID.in_(chunk))
-        ).all():
-            result[row.NameID][row.Name] = row.UdfText
+    statement = (
+        select(UdfName.Name, UDF.UdfText, UDF.NameID)
+        .join(UDF, UDF.UdfNum == UdfName.UdfNum)
+        .where(UdfName.LocGrp == location_group_id)
+        .where(UDF.LocGrp == location_group_id)
+    )
+    for row in execute_in(session, statement, UDF.NameID, name_ids):
+        result[row.NameID][row.Name] = row.UdfText
     return result
 
 
@@ -97,15 +133,11 @@ class _PersonSearchBase(abc.ABC):
         return search
 
     def __get_udf_name_ids(self, session: Session) -> set[int]:
-        udf_names_and_ids = session.execute(
-            select(UdfName.UdfNum, UdfName.Name) \
-                .where(UdfName.LocGrp == self._lookup_info.location_group_id) \
-                .where(UdfName.Name.in_(self._udf_criteria.keys()))
-        ).all()
+        udf_definitions = _udf_definitions(self._lookup_info)
 
         names_to_ids = {}
         for udf_name in self._udf_criteria.keys():
-            valid_rows = [r.UdfNum for r in udf_names_and_ids if r.Name == udf_name]
+            valid_rows = [d.udf_num for d in udf_definitions if d.name == udf_name]
             if len(valid_rows) == 0:
                 raise InvalidUdfName(f"User defined field \"{udf_name}\" not found in the database", udf_name)
             if len(valid_rows) > 1:
@@ -144,7 +176,7 @@ class _PersonSearchBase(abc.ABC):
 
         return name_ids_result
 
-    def find(self) -> list["Person"]:
+    def _statement(self) -> Select:
         statement = select(NAMES).where(NAMES.LocGrp == self._location_group_id)
 
         criteria_key: _SearchCriteria
@@ -160,38 +192,64 @@ class _PersonSearchBase(abc.ABC):
             elif criteria_key == _SearchCriteria.COMPANY_ID:
                 statement = statement.where(NAMES.Company == criteria)
             elif criteria_key == _SearchCriteria.UDF:
-                pass  # handled below with session
+                pass  # handled with a session, see _udf_statement
             else:
                 raise Exception("Unknown search criteria")
 
-        with self._lookup_info.new_session() as session:
-            if _SearchCriteria.UDF in self._criteria:
-                udf_name_ids = self.__get_udf_name_ids(session)
-                if not udf_name_ids:
-                    # We have no matching criteria, so this query would fail anyway
-                    # Access hates having an empty query in an in_ statement.
-                    return []
-                statement = statement.where(NAMES.ID.in_(udf_name_ids))
+        return statement
 
-            names = session.scalars(statement).all()
+    def _udf_statement(self, session: Session, statement: Select) -> Optional[Select]:
+        if _SearchCriteria.UDF not in self._criteria:
+            return statement
+
+        udf_name_ids = self.__get_udf_name_ids(session)
+        if not udf_name_ids:
+            # We have no matching criteria, so this query would fail anyway
+            # Access hates having an empty query in an in_ statement.
+            return None
+        return statement.where(NAMES.ID.in_(udf_name_ids))
+
+    def _build_people(self, session: Session, names: Sequence[NAMES]) -> list["Person"]:
+        if not names:
+            return []
+
+        name_ids = [n.ID for n in names]
+        udf_by_name_id = _load_udfs(session, self._location_group_id, name_ids)
+
+        return [
+            _existing_person(
+                self._lookup_info,
+                n.ID,
+                n.FName,
+                n.LName,
+                n.Company,
+                udf_by_name_id[n.ID],
+            )
+            for n in names
+        ]
 
-            if not names:
+    def find(self) -> list["Person"]:
+        with self._lookup_info.new_read_session() as session:
+            statement = self._udf_statement(session, self._statement())
+            if statement is None:
                 return []
 
-            name_ids = [n.ID for n in names]
-            udf_by_name_id = _load_udfs(session, self._location_group_id, name_ids)
+            return self._build_people(session, session.scalars(statement).all())
 
-            return [
-                _existing_person(
-                    self._lookup_info,
-                    n.ID,
-                    n.FName,
-                    n.LName,
-                    n.Company,
-                    udf_by_name_id[n.ID],
-                )
-                for n in names
-            ]
+    def iter_find(self, page_size: int = 500) -> Iterator["Person"]:
+        """
+        Same as find(), a page of people at a time, so going through everyone doesn't need them all (and their user
+        defined fields) in memory at once.
+        """
+        with self._lookup_info.new_read_session() as session:
+            statement = self._udf_statement(session, self._statement())
+        if statement is None:
+            return
+
+        for page in self._lookup_info.read_pages(statement, NAMES.ID, page_size):
+            with self._lookup_info.new_read_session() as session:
+                people = self._build_people(session, page)
+            yield from people
 
 
 class _PersonSearchBuilder(_PersonSearchBase):
@@ -210,14 +268,13 @@ class PersonLookup(_PersonSearchBase):
         return _new_person(self._lookup_info)
 
     def by_ids(self, *name_ids: int) -> list["Person"]:
-        with self._lookup_info.new_session() as session:
-            names = []
-            for chunk in chunked(list(name_ids)):
-                names.extend(session.scalars(
-                    select(NAMES)
-                    .where(NAMES.ID.in_(chunk))
-                    .where(NAMES.LocGrp == self._location_group_id)
-                ).all())
+        with self._lookup_info.new_read_session() as session:
+            names = scalars_in(
+                session,
+                select(NAMES).where(NAMES.LocGrp == self._location_group_id),
+                NAMES.ID,
+                name_ids,
+            )
 
             ids = [name.ID for name in names]
             udf_data = _load_udfs(session, self._location_group_id, ids)
@@ -228,7 +285,7 @@ class PersonLookup(_PersonSearchBase):
             ]
 
     def by_id(self, name_id: int) -> Optional["Person"]:
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.new_read_session() as session:
             name: Optional[NAMES] = session.scalar(
                 select(NAMES)
                 .where(NAMES.ID == name_id)
@@ -250,6 +307,7 @@ class PersonLookup(_PersonSearchBase):
             )
 
 
+@invalidates(NAMES, UDF)
 class _Person:
     def __init__(self,
                  lookup_info: LookupInfo,
@@ -303,29 +361,13 @@ class _Person:
         return self._user_defined_fields
 
     def _write_user_defined_fields(self, session: Session) -> None:
-        known_udf_names: Sequence[UdfName] = session.scalars(
-            select(UdfName).where(UdfName.LocGrp == self._location_group_id)
-        ).all()
-        udf_selection_options: dict[str, set[str]] = {}
-        udf_name: UdfName
-        for udf_name in known_udf_names:
-            if not udf_name.Combo:
-                continue
-
-            if not udf_name.ComboOnly:
-                continue
-
-            udf_selection_options[udf_name.Name] = set(session.scalars(
-                select(UdfSel.SelText)
-                    .where(UdfSel.UdfNum == udf_name.UdfNum)
-                    .where(UdfSel.LocGrp == self._location_group_id)
-            ).all())
+        known_udf_names = _udf_definitions(self._lookup_info)
 
         known_user_defined_fields: Sequence[UDF] = session.scalars(
             select(UDF)
                 .where(UDF.NameID == self._name_id)
                 .where(UDF.LocGrp == self._location_group_id)
-                .where(UDF.UdfNum.in_([n.UdfNum for n in known_udf_names]))
+                .where(UDF.UdfNum.in_([n.udf_num for n in known_udf_names]))
         ).all()
         id_to_udf: dict[int, UDF] = {}
         for udf in known_user_defined_fields:
@@ -333,8 +375,8 @@ class _Person:
 
         user_defined_fields_copy = dict(self._user_defined_fields)
         for udf_name in known_udf_names:
-            udf_name_str: str = udf_name.Name
-            udf_num: int = udf_name.UdfNum
+            udf_name_str: str = udf_name.name
+            udf_num: int = udf_name.udf_num
 
             if udf_num in id_to_udf:
                 udf: UDF = id_to_udf[udf_num]
@@ -348,7 +390,7 @@ class _Person:
             if udf_name_str in user_defined_fields_copy:
                 udf_text = user_defined_fields_copy[udf_name_str]
 
-                if udf_name_str in udf_selection_options and udf_text not in udf_selection_options[udf_name_str]:
+                if udf_name.options is not None and udf_text not in udf_name.options:
                     # ComboOnly and this isn't a valid value
                     raise InvalidUdfSelection(
                         f"{udf_text} is not a valid option for the UDF {udf_name_str}",
@@ -359,7 +401,7 @@ class _Person:
                 udf.UdfText = udf_text
                 del user_defined_fields_copy[udf_name_str]
                 session.add(udf)
-            elif udf_name.Required:
+            elif udf_name.required:
                 raise MissingRequiredUserDefinedField(
                     f"Required user defined field {udf_name_str} not found.",
                     udf_name_str
@@ -376,7 +418,7 @@ class _Person:
             )
 
     def write(self):
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.batch(), self._lookup_info.new_session() as session:
             name: Optional[NAMES] = None
             if self._name_id is not None:
                 name = session.scalar(
@@ -1,9 +1,11 @@
-from typing import Optional, Union
+from typing import Optional, Union, Iterator, Iterable
 
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from card_automation_server.windsx.db.bulk_keys import scalars_in
 from card_automation_server.windsx.db.models import LOC, TZ
+from card_automation_server.windsx.lookup.cache import invalidates
 from card_automation_server.windsx.lookup.utils import LookupInfo
 
 
@@ -69,10 +71,26 @@ class TimezoneLookup:
     def by_name(self, name: str) -> list["Timezone"]:
         return self._collect(self._base_statement.where(TZ.Name == name))
 
+    def iter_all(self, page_size: int = 500) -> Iterator["Timezone"]:
+        """
+        Same as all(), a page of timezone numbers at a time
+        """
+        numbers = select(TZ.TZ).join(LOC, LOC.Loc == TZ.Loc) \
+            .where(LOC.LocGrp == self._lookup_info.location_group_id) \
+            .distinct()
+
+        for page in self._lookup_info.read_pages(numbers, TZ.TZ, page_size, key_of=lambda tz_number: tz_number):
+            with self._lookup_info.new_read_session() as session:
+                rows = scalars_in(session, self._base_statement, TZ.TZ, page)
+            yield from self._build(rows)
+
     def _collect(self, statement) -> list["Timezone"]:
-        with self._lookup_info.new_session() as session:
+        with self._lookup_info.new_read_session() as session:
             rows = list(session.scalars(statement).all())
 
+        return self._build(rows)
+
+    def _build(self, rows: Iterable[TZ]) -> list["Timezone"]:
         # Each TZ number maps to one logical Timezone spanning every Loc in the group.
         by_tz: dict[int, list[TZ]] = {}
         for row in rows:
@@ -96,6 +114,7 @@ class TimezoneLookup:
         return result
 
 
+@invalidates(TZ)
 class _Timezone:
     def __init__(self,
                  lookup_info: LookupInfo,
@@ -184,11 +203,6 @@ class _Timezone:
     def hol3(self) -> _StartStop:
         return self._hol3
 
-    def _locations(self, session: Session) -> list[LOC]:
-        return list(session.scalars(
-            select(LOC).where(LOC.LocGrp == self._location_group_id)
-        ).all())
-
     def _next_free_tz_number(self, session: Session) -> int:
         max_tz = session.scalar(
             select(TZ.TZ)
@@ -203,8 +217,8 @@ class _Timezone:
         if self._name is None:
             raise Exception("Timezone requires a name before write")
 
-        with self._lookup_info.new_session() as session:
-            locations = self._locations(session)
+        with self._lookup_info.batch(), self._lookup_info.new_session() as session:
+            locations = self._lookup_info.location_ids()
             if not locations:
                 raise NoLocationsInGroup(
                     f"Location group {self._location_group_id} has no locations to write a timezone to"
@@ -214,14 +228,14 @@ class _Timezone:
             if tz_number is None:
                 tz_number = self._next_free_tz_number(session)
 
-            for location in locations:
+            for location_id in locations:
                 row: Optional[TZ] = session.scalar(
                     select(TZ)
-                    .where(TZ.Loc == location.Loc)
+                    .where(TZ.Loc == location_id)
                     .where(TZ.TZ == tz_number)
                 )
                 if row is None:
-                    row = TZ(Loc=location.Loc, TZ=tz_number)
+                    row = TZ(Loc=location_id, TZ=tz_number)
 
                 row.Name = self._name
                 row.Notes = self._notes
@@ -233,11 +247,7 @@ class _Timezone:
                 row.CkSum = 0
                 session.add(row)
 
-                location.DlFlag = 1
-                location.TzCs = 0
-                location.PlFlag = True
-                session.add(location)
-
+            self._lookup_info.flag_locations_for_download(session, locations, "TzCs", dl_flag=1)
             session.commit()
 
         self._tz_number = tz_number
@@ -1,18 +1,57 @@
-from typing import Callable, Any, TypeVar, Generator
+import contextlib
+import threading
+from typing import Callable, Any, TypeVar, Generator, Optional, Iterable
 
 T = TypeVar('T')
 
 _CHUNK_SIZE = 100
+# How many rows read_pages() reads at a time
+_PAGE_SIZE = 500
 
 
 def chunked(items: list[T], size: int = _CHUNK_SIZE) -> Generator[list[T], None, None]:
     for i in range(0, len(items), size):
         yield items[i:i + size]
 
-from sqlalchemy import Engine
-from sqlalchemy.orm import Session
+from sqlalchemy import Engine, select, update, Connection, Select
+from sqlalchemy.orm import Session, InstrumentedAttribute
 
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.mirror import AcsMirror
+from card_automation_server.windsx.db.models import LOC
+from card_automation_server.windsx.db.scheduler import DbScheduler, ScheduledSession, Priority
 from card_automation_server.windsx.engines import AcsEngine
+from card_automation_server.windsx.lookup.cache import ReferenceDataCache, tables_written_by
+
+
+class _LocationFlags:
+    def __init__(self):
+        # The LOC checksum columns to zero out, so the comm server re-sends those tables
+        self.checksums: set[str] = set()
+        self.dl_flag: Optional[int] = None
+
+    def merge(self, checksums: Iterable[str], dl_flag: Optional[int]):
+        self.checksums.update(checksums)
+        if dl_flag is not None:
+            # 2 (delete) has to win over 1 (update), or a deletion could go undownloaded
+            self.dl_flag = dl_flag if self.dl_flag is None else max(self.dl_flag, dl_flag)
+
+    def values(self) -> dict[str, Any]:
+        values: dict[str, Any] = {checksum: 0 for checksum in self.checksums}
+        values["PlFlag"] = True
+        if self.dl_flag is not None:
+            values["DlFlag"] = self.dl_flag
+        return values
+
+
+class _Batch:
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.updates: list[Any] = []
+        # {location_id -> flags}
+        self.locations: dict[int, _LocationFlags] = {}
+        # Tables passed to LookupInfo.invalidate
+        self.tables: set[type] = set()
 
 
 class LookupInfo:
@@ -24,19 +63,243 @@ class LookupInfo:
     def __init__(self,
                  acs_engine: AcsEngine,
                  location_group_id: int,
-                 updated_callback: Callable[[Any], None]
+                 updated_callback: Callable[[Any], None],
+                 scheduler: Optional[DbScheduler] = None,
+                 metrics: Optional[Metrics] = None,
+                 mirror: Optional[AcsMirror] = None,
                  ):
         self._acs_engine: Engine = acs_engine
         self._location_group_id = location_group_id
         self._updated_callback = updated_callback
+        self._scheduler = scheduler if scheduler is not None else DbScheduler(max_concurrent=None)
+        self._cache = ReferenceDataCache(metrics)
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._mirror = mirror
+        self._local = threading.local()
+        self._write_listeners: list[Callable[[Any], None]] = []
+
+    @property
+    def _batch(self) -> Optional[_Batch]:
+        return getattr(self._local, "batch", None)
 
     def new_session(self) -> Session:
-        return Session(self._acs_engine)
+        """
+        A session for reading and writing the ACS database. Each transaction on it holds one of the DbScheduler's slots
+        from its first query until it's committed, rolled back or the session is closed, so commit or close it as soon
+        as you're done instead of keeping it around, or everyone else waits on it.
+        """
+        batch = self._batch
+        if batch is not None:
+            # Joins the batch's transaction. Committing it only flushes, and closing it leaves the transaction alone.
+            session = Session(batch.connection, join_transaction_mode="rollback_only")
+        else:
+            session = ScheduledSession(self._acs_engine, self._scheduler)
+
+        if self._mirror is not None:
+            self._mirror.track_writes(session)
+        return session
+
+    def new_read_session(self) -> Session:
+        """
+        A session for lookups that only read. It reads from the local mirror when there is one and it has everything
+        we've written so far, otherwise from the ACS database. Never write through it.
+        """
+        if self._batch is not None:
+            return self.new_session()  # Has to see what the batch wrote but hasn't committed yet
+
+        if getattr(self._local, "bypass_mirror", False):
+            return self.new_session()
+
+        if self._mirror is not None and self._mirror.is_current():
+            self._metrics.counter("mirror_reads", source="mirror").inc()
+            return self._mirror.new_session()
+
+        if self._mirror is not None:
+            self._metrics.counter("mirror_reads", source="acs").inc()
+        return self.new_session()
+
+    def read_pages(self,
+                   statement: Select,
+                   key: InstrumentedAttribute,
+                   page_size: int = _PAGE_SIZE,
+                   key_of: Optional[Callable[[Any], Any]] = None) -> Generator[list, None, None]:
+        """
+        Reads the scalars of statement a page at a time in order of key, which has to be unique. Each page starts after
+        the last key of the one before instead of at an offset, and is read in its own read session, so nothing is held
+        open while the caller works through a page.
+
+        :param key_of: Gets the key from a result, when that isn't the key attribute of a mapped row
+        """
+        last_key = None
+        while True:
+            page_statement = statement.order_by(key).limit(page_size)
+            if last_key is not None:
+                page_statement = page_statement.where(key > last_key)
+
+            with self.new_read_session() as session:
+                page = list(session.scalars(page_statement).all())
+
+            if len(page) > 0:
+                yield page
+            if len(page) < page_size:
+                return
+
+            last_key = key_of(page[-1]) if key_of is not None else getattr(page[-1], key.key)
+
+    @contextlib.contextmanager
+    def batch(self) -> Generator[None, None, None]:
+        """
+        Everything written through the lookups on this thread inside this block goes into one transaction, which is
+        committed when the block exits, or rolled back if it raises. Locations are flagged for download once each at
+        the end instead of after every write, and updated_callback isn't called until the transaction is committed.
+
+        Nested batches are part of the outermost one.
+        """
+        if self._batch is not None:
+            yield
+            return
+
+        slot = self._scheduler.acquire()
+        try:
+            with self._acs_engine.connect() as connection:
+                transaction = connection.begin()
+                batch = self._local.batch = _Batch(connection)
+                try:
+                    yield
+                    if len(batch.locations) > 0:
+                        with Session(connection, join_transaction_mode="rollback_only") as session:
+                            self._apply_location_flags(session, batch.locations)
+                            session.commit()
+                    transaction.commit()
+                except BaseException:
+                    transaction.rollback()
+                    # Anything cached while the batch was running may have come from the rolled back transaction
+                    for value in batch.updates:
+                        self._cache.invalidate(*tables_written_by(value))
+                    self._cache.invalidate(*batch.tables)
+                    raise
+                finally:
+                    self._local.batch = None
+        finally:
+            self._scheduler.release(slot)
+
+        self._cache.invalidate(*batch.tables)
+        for value in batch.updates:
+            self._on_updated(value)
+
+    @contextlib.contextmanager
+    def bypass_mirror(self) -> Generator[None, None, None]:
+        """
+        Lookups on this thread inside this block read from the ACS database even when the mirror is current, for
+        anything that has to see what WinDSX or the hardware changed that the mirror may not have caught up with yet.
+        """
+        previous = getattr(self._local, "bypass_mirror", False)
+        self._local.bypass_mirror = True
+        try:
+            yield
+        finally:
+            self._local.bypass_mirror = previous
+
+    @contextlib.contextmanager
+    def priority(self, priority: Priority) -> Generator[None, None, None]:
+        """
+        Database work done on this thread inside this block waits its turn with the given priority, e.g. a bulk sync
+        can use Priority.BULK so it doesn't hold up card scans.
+        """
+        with self._scheduler.priority(priority):
+            yield
 
     @property
     def location_group_id(self) -> int:
         return self._location_group_id
 
+    @property
+    def cache(self) -> ReferenceDataCache:
+        return self._cache
+
+    def location_ids(self) -> tuple[int, ...]:
+        """
+        :return: Every location in our location group
+        """
+
+        def _load() -> tuple[int, ...]:
+            with self.new_session() as session:
+                return tuple(session.scalars(
+                    select(LOC.Loc).where(LOC.LocGrp == self._location_group_id)
+                ).all())
+
+        return self._cache.get("location_ids", [LOC], _load)
+
+    def flag_locations_for_download(self,
+                                    session: Session,
+                                    location_ids: Iterable[int],
+                                    *checksums: str,
+                                    dl_flag: Optional[int] = None) -> None:
+        """
+        Sets PlFlag on these locations and zeroes the given LOC checksum columns (TzCs, AclCs...), so the comm server
+        downloads the tables we changed. Inside a batch this is done once per location when the batch commits.
+        """
+        locations: dict[int, _LocationFlags] = {}
+        batch = self._batch
+        if batch is not None:
+            locations = batch.locations
+
+        for location_id in location_ids:
+            locations.setdefault(location_id, _LocationFlags()).merge(checksums, dl_flag)
+
+        if batch is None:
+            self._apply_location_flags(session, locations)
+
+    def _apply_location_flags(self, session: Session, locations: dict[int, _LocationFlags]) -> None:
+        # Locations flagged the same way share one UPDATE
+        grouped: dict[tuple, list[int]] = {}
+        for location_id, flags in locations.items():
+            grouped.setdefault(tuple(sorted(flags.values().items())), []).append(location_id)
+
+        for values, location_ids in grouped.items():
+            for chunk in chunked(sorted(location_ids)):
+                session.execute(
+                    update(LOC)
+                    .where(LOC.LocGrp == self._location_group_id)
+                    .where(LOC.Loc.in_(chunk))
+                    .values(dict(values))
+                )
+
+    def invalidate(self, *tables: type) -> None:
+        """
+        Drops anything cached from these tables, for writes that nobody outside needs to hear about through
+        updated_callback. Inside a batch they're dropped again when it commits or rolls back.
+        """
+        self._cache.invalidate(*tables)
+
+        batch = self._batch
+        if batch is not None:
+            batch.tables.update(tables)
+
     @property
     def updated_callback(self) -> Callable[[Any], None]:
-        return self._updated_callback
+        return self._on_write
+
+    def add_write_listener(self, listener: Callable[[Any], None]) -> None:
+        """
+        Calls listener with everything written through the lookups, on the writing thread as soon as it's written, which
+        inside a batch is before the batch commits.
+        """
+        self._write_listeners.append(listener)
+
+    def _on_write(self, value: Any) -> None:
+        # Whatever we just wrote can't be served from the cache anymore, even inside a batch where later writes may read
+        # it back
+        self._cache.invalidate(*tables_written_by(value))
+        for listener in self._write_listeners:
+            listener(value)
+
+        batch = self._batch
+        if batch is not None:
+            batch.updates.append(value)
+        else:
+            self._updated_callback(value)
+
+    def _on_updated(self, value: Any) -> None:
+        self._cache.invalidate(*tables_written_by(value))
+        self._updated_callback(value)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from typing import Optional
+
+from card_automation_server.config import Config
+from card_automation_server.windsx.lookup.access_audit import AccessAuditor, DiscrepancyKind
+from card_automation_server.workers.utils import ThreadedWorker
+
+_AUDIT_INTERVAL = timedelta(days=1)
+# How many discrepancies are logged one by one, the rest are only counted
+_LOGGED_DISCREPANCIES = 20
+
+
+class AccessAuditWorker(ThreadedWorker[None]):
+    def __init__(self, config: Config, auditor: AccessAuditor):
+        super().__init__()
+        self._log = config.logger
+        self._repair = config.windsx.repair_access_discrepancies
+        self._auditor = auditor
+
+    def _run(self) -> None:
+        while True:
+            # The first audit waits a full interval too. Startup is busy enough with the caches loading and the change
+            # detector's first pass without a full read of CARDS and LocCards on top.
+            self._wake_event.wait(_AUDIT_INTERVAL.total_seconds())
+            self._wake_event.clear()
+
+            if self._keep_running.is_set():
+                break
+
+            try:
+                self._audit()
+            except Exception as ex:
+                self._log.exception(ex)
+
+    def _audit(self) -> None:
+        report = self._auditor.audit()
+        if not report.discrepancies:
+            return
+
+        counts = ", ".join(
+            f"{len(report.card_ids(kind))} {kind.value}" for kind in DiscrepancyKind if report.card_ids(kind)
+        )
+        self._log.warning(f"Access audit of {report.cards} card(s) found {len(report.card_ids())} out of step "
+                          f"({counts})")
+        for discrepancy in report.discrepancies[:_LOGGED_DISCREPANCIES]:
+            if discrepancy.location_id is None:
+                self._log.warning(f"Card {discrepancy.card_number}: {discrepancy.kind.value}")
+            else:
+                self._log.warning(f"Card {discrepancy.card_number}: {discrepancy.kind.value} at location "
+                                  f"{discrepancy.location_id}, expected {_acls(discrepancy.expected)}, "
+                                  f"found {_acls(discrepancy.actual)}")
+
+        if self._repair:
+            self._log.info(f"Repaired {self._auditor.repair(report)} card(s)")
+
+
+def _acls(acls: Optional[frozenset[int]]) -> str:
+    return "-" if acls is None else str(sorted(acls))
@@ -0,0 +1,121 @@
+from datetime import timedelta
+from typing import Union, Optional
+
+from sentry_sdk import capture_exception
+from sqlalchemy import select
+
+from card_automation_server.config import Config
+from card_automation_server.windsx.db.models import AclGrp, AclGrpName
+from card_automation_server.windsx.lookup.access_card import AccessCardLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.events import AclDefinitionsChanged, AcsDatabaseUpdated
+from card_automation_server.workers.utils import EventsWorker
+
+_Events = Union[
+    AclDefinitionsChanged,
+    AcsDatabaseUpdated,
+]
+
+# Definitions are compared this often even if no change was reported, in case one was missed
+_CHECK_INTERVAL = timedelta(minutes=5)
+
+# {AclGrpName ID -> (IsMaster, every (Loc, Dev, Tz1, Tz2, Tz3, Tz4) it covers)}
+Definitions = dict[int, tuple[bool, frozenset[tuple]]]
+
+
+class AccessRecomputer(EventsWorker[_Events]):
+    """
+    When someone changes which doors or timezones an access level covers in WinDSX, the cards that have it keep their
+    old ACLs until they're written again. This keeps a copy of every access level's AclGrp rows, and recomputes LocCards
+    for the cards with an access level that actually changed. Taking a copy is cheap, so it's compared whenever the ACS
+    database file changes and every _CHECK_INTERVAL, not only when AcsChangeDetector says the access definitions
+    changed.
+    """
+
+    def __init__(self, config: Config, lookup_info: LookupInfo, access_card_lookup: AccessCardLookup):
+        super().__init__()
+        self._log = config.logger
+        self._lookup_info = lookup_info
+        self._access_card_lookup = access_card_lookup
+        self._definitions: Optional[Definitions] = None
+        self._needs_check: bool = False
+
+        self._call_every(_CHECK_INTERVAL, self._check_definitions)
+
+    def _pre_run(self) -> None:
+        try:
+            self._definitions = self._take_definitions()
+        except Exception as ex:
+            # Without a starting point we can't tell what changed, so we'll take one on the next change instead
+            self._log.exception(ex)
+
+    def _handle_event(self, event: _Events):
+        if isinstance(event, (AclDefinitionsChanged, AcsDatabaseUpdated)):
+            self._needs_check = True
+
+    def _post_event(self) -> None:
+        if not self._inbound_event_queue.empty():
+            return  # Check once the burst of changes is through
+
+        if not self._needs_check:
+            return
+        self._needs_check = False
+
+        self._check_definitions()
+
+    def _check_definitions(self) -> None:
+        try:
+            definitions = self._take_definitions()
+        except Exception as ex:
+            self._log.exception(ex)
+            capture_exception(ex)
+            return
+
+        if self._definitions is None:
+            self._definitions = definitions
+            return
+
+        changed = self.changed_names(self._definitions, definitions)
+        if len(changed) == 0:
+            self._definitions = definitions
+            return
+
+        try:
+            count = self._access_card_lookup.recompute_access(changed)
+        except Exception as ex:
+            # We keep the old definitions, so the same access levels come up as changed next time
+            self._log.exception(ex)
+            capture_exception(ex)
+            return
+
+        self._definitions = definitions
+        self._log.info(f"Access levels {sorted(changed)} changed, updated the ACLs on {count} card(s)")
+
+    @staticmethod
+    def changed_names(before: Definitions, after: Definitions) -> frozenset[int]:
+        return frozenset(
+            name_id
+            for name_id in before.keys() | after.keys()
+            if before.get(name_id) != after.get(name_id)
+        )
+
+    def _take_definitions(self) -> Definitions:
+        location_ids = self._lookup_info.location_ids()
+
+        with self._lookup_info.new_session() as session:
+            definitions: dict[int, tuple[bool, set[tuple]]] = {
+                row.ID: (bool(row.IsMaster), set())
+                for row in session.execute(
+                    select(AclGrpName.ID, AclGrpName.IsMaster)
+                    .where(AclGrpName.LocGrp == self._lookup_info.location_group_id)
+                ).all()
+            }
+
+            for row in session.execute(
+                select(AclGrp.AclGrpNameID, AclGrp.Loc, AclGrp.Dev, AclGrp.Tz1, AclGrp.Tz2, AclGrp.Tz3, AclGrp.Tz4)
+                .where(AclGrp.Loc.in_(location_ids))
+            ).all():
+                if row.AclGrpNameID in definitions:
+                    definitions[row.AclGrpNameID][1].add(tuple(row[1:]))
+
+        return {name_id: (is_master, frozenset(rows)) for name_id, (is_master, rows) in definitions.items()}
@@ -0,0 +1,151 @@
+import zlib
+from typing import Union, Optional
+
+from sentry_sdk import capture_exception
+from sqlalchemy import select, func, Select
+from sqlalchemy.orm import Session
+
+from card_automation_server.config import Config
+from card_automation_server.windsx.db.models import CARDS, NAMES, UDF, LocCards, LOC, DEV, AclGrpName, AclGrpCombo, \
+    AclGrp, ACL, DGRP, TZ, HOL, UdfName, UdfSel
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.events import AcsDatabaseUpdated, AcsTablesChanged, CardsChanged, \
+    LocCardsChanged, AclDefinitionsChanged, WorkerEvent
+from card_automation_server.workers.utils import EventsWorker
+
+_Events = Union[
+    AcsDatabaseUpdated
+]
+
+_WATCHED_TABLES: tuple[type, ...] = (
+    CARDS, NAMES, UDF, LocCards, LOC, DEV, AclGrpName, AclGrpCombo, AclGrp, ACL, DGRP, TZ, HOL, UdfName, UdfSel,
+)
+
+# (event, the tables that fire it)
+_TABLE_EVENTS: list[tuple[type[WorkerEvent], frozenset[type]]] = [
+    (CardsChanged, frozenset({CARDS, NAMES, UDF})),
+    (LocCardsChanged, frozenset({LocCards})),
+    (AclDefinitionsChanged, frozenset({AclGrpName, AclGrpCombo, AclGrp, ACL, DGRP})),
+]
+
+# WinDSX edits these in place without touching DlFlag (or they don't have one), e.g. renaming an access level or a
+# timezone. A rename doesn't change the row count or max ID, so their fingerprint also includes a checksum of every
+# column. They're small reference tables, the big ones are only ever aggregated, since reading them in full every time
+# the file changes would cost more than it saves.
+_CONTENT_CHECKED: frozenset[type] = frozenset({
+    AclGrpName, TZ, HOL, UdfName, UdfSel,
+})
+# How many rows are fetched at a time while working out a content checksum
+_CHECKSUM_ROWS = 1000
+
+Fingerprint = tuple
+
+
+def _fingerprint_statements(table: type) -> list[Select]:
+    columns = table.__table__.c
+    aggregates = [func.count(), func.max(columns.ID)]
+    if "DlFlag" in columns:
+        aggregates.append(func.sum(columns.DlFlag))
+
+    statements = [select(*aggregates).select_from(table)]
+
+    if table is LOC:
+        # Locations are never really added, what changes is whether they need a download
+        statements.append(select(func.count()).select_from(LOC).where(LOC.PlFlag))
+
+    return statements
+
+
+class AcsChangeDetector(EventsWorker[_Events]):
+    """
+    DatabaseFileWatcher can only tell us that the ACS database file changed. This works out which tables actually
+    changed, using a fingerprint of each one (row count, max ID and the sum of DlFlag), so everyone else only has to
+    refresh what's relevant to them.
+
+    The small reference tables that WinDSX edits in place, like AclGrpName and TZ, also get a checksum of their
+    contents, see _CONTENT_CHECKED. An edit to any other table that doesn't add or remove rows or touch DlFlag, like
+    renaming a person or changing the timezone on an AclGrp, won't be seen. AcsMirrorWorker and AccessRecomputer also
+    check everything on a timer for that reason.
+
+    If the database can't be read, e.g. WinDSX has it locked, the check is tried again on the next loop.
+    """
+
+    def __init__(self, config: Config, lookup_info: LookupInfo):
+        super().__init__()
+        self._log = config.logger
+        self._lookup_info = lookup_info
+        self._fingerprints: Optional[dict[type, Fingerprint]] = None
+        self._needs_check: bool = False
+
+    def _pre_run(self) -> None:
+        try:
+            self._fingerprints = self._take_fingerprints()
+        except Exception as ex:
+            # We'll try again on the next update, and treat everything as changed then
+            self._log.exception(ex)
+
+    def _handle_event(self, event: _Events):
+        if isinstance(event, AcsDatabaseUpdated):
+            self._needs_check = True
+
+    def _post_event(self) -> None:
+        if not self._inbound_event_queue.empty():
+            return  # The file tends to change several times in a row, check once they're all in
+
+        if not self._needs_check:
+            return
+
+        try:
+            fingerprints = self._take_fingerprints()
+        except Exception as ex:
+            # _needs_check stays set, so this is tried again next loop
+            self._log.exception(ex)
+            capture_exception(ex)
+            return
+        self._needs_check = False
+
+        changed = self.changed_tables(self._fingerprints, fingerprints)
+        self._fingerprints = fingerprints
+
+        if len(changed) == 0:
+            return
+
+        self._log.debug(f"ACS tables changed: {', '.join(sorted(t.__tablename__ for t in changed))}")
+        self._outbound_event_queue.put(AcsTablesChanged(tables=changed))
+        for event_type, tables in _TABLE_EVENTS:
+            if changed & tables:
+                self._outbound_event_queue.put(event_type())
+
+    @staticmethod
+    def changed_tables(before: Optional[dict[type, Fingerprint]],
+                       after: dict[type, Fingerprint]) -> frozenset[type]:
+        if before is None:
+            return frozenset(after.keys())
+
+        return frozenset(table for table, fingerprint in after.items() if before.get(table) != fingerprint)
+
+    def _take_fingerprints(self) -> dict[type, Fingerprint]:
+        with self._lookup_info.new_session() as session:
+            return {table: self._fingerprint(session, table) for table in _WATCHED_TABLES}
+
+    @staticmethod
+    def _fingerprint(session: Session, table: type) -> Fingerprint:
+        fingerprint = tuple(
+            value
+            for statement in _fingerprint_statements(table)
+            for value in session.execute(statement).one()
+        )
+
+        if table in _CONTENT_CHECKED:
+            fingerprint += (_content_checksum(session, table),)
+        return fingerprint
+
+
+def _content_checksum(session: Session, table: type) -> int:
+    checksum = 0
+    result = session.execute(
+        select(table.__table__).order_by(table.__table__.c.ID).execution_options(yield_per=_CHECKSUM_ROWS)
+    )
+    for row in result:
+        checksum = zlib.crc32(repr(tuple(row)).encode(), checksum)
+    return checksum
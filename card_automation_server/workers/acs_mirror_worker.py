@@ -0,0 +1,79 @@
+from datetime import timedelta
+from typing import Union, Optional
+
+from sentry_sdk import capture_exception
+
+from card_automation_server.config import Config
+from card_automation_server.windsx.db.mirror import AcsMirror
+from card_automation_server.workers.events import AcsTablesChanged
+from card_automation_server.workers.utils import EventsWorker
+
+_Events = Union[
+    AcsTablesChanged
+]
+
+# Our writes tend to come in bursts, wait for them to settle before copying the tables again
+_WRITE_QUIET_SECONDS = 2
+# Every table is copied again this often, in case a change on disk wasn't detected
+_FULL_REFRESH_INTERVAL = timedelta(minutes=15)
+
+
+class AcsMirrorWorker(EventsWorker[_Events]):
+    """
+    Keeps the AcsMirror up to date. Tables are copied again when AcsChangeDetector says they changed on disk, and when
+    we've written to them ourselves. AcsChangeDetector can miss some edits made in place, so everything is also copied
+    again every _FULL_REFRESH_INTERVAL.
+    """
+
+    def __init__(self, config: Config, mirror: AcsMirror):
+        super().__init__()
+        self._log = config.logger
+        self._mirror = mirror
+        self._pending: set[type] = set()
+        # Nothing is read from the mirror until it's been copied in full once
+        self._needs_full_refresh: bool = True
+
+        self._call_every(_FULL_REFRESH_INTERVAL, self._schedule_full_refresh)
+
+    def _pre_run(self) -> None:
+        self._refresh_all()
+
+    def _handle_event(self, event: _Events):
+        if isinstance(event, AcsTablesChanged):
+            self._pending |= event.tables & set(self._mirror.tables)
+
+    def _post_event(self) -> None:
+        if not self._inbound_event_queue.empty():
+            return  # Wait until the burst of events is through
+
+        if self._needs_full_refresh:
+            self._refresh_all()
+            return
+
+        tables = set(self._pending)
+        if self._mirror.seconds_since_last_write() >= _WRITE_QUIET_SECONDS:
+            tables |= self._mirror.dirty_tables()
+
+        if len(tables) == 0:
+            return
+
+        self._pending -= tables
+        if not self._refresh(tables):
+            self._pending |= tables
+
+    def _schedule_full_refresh(self):
+        self._needs_full_refresh = True
+
+    def _refresh_all(self):
+        self._pending.clear()
+        self._needs_full_refresh = not self._refresh(None)
+
+    def _refresh(self, tables: Optional[set[type]]) -> bool:
+        try:
+            self._mirror.refresh(tables)
+            return True
+        except BaseException as ex:
+            # Reads fall back to the ACS database until a refresh works, so keep going
+            self._log.warning(f"Failed to refresh the ACS mirror: {ex}")
+            capture_exception(ex)
+            return False
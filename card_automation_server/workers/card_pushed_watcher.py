@@ -1,33 +1,52 @@
-from typing import Union
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Union, Optional
 
 from sqlalchemy import select
 
 from card_automation_server.config import Config
-from card_automation_server.plugins.types import CommServerEventType
+from card_automation_server.metrics import Metrics
+from card_automation_server.plugins.types import DownloadCompleteEvent
 from card_automation_server.windsx.db.models import LocCards, LOC
 from card_automation_server.windsx.lookup.access_card import AccessCardLookup
 from card_automation_server.windsx.lookup.utils import LookupInfo
-from card_automation_server.workers.events import AcsDatabaseUpdated, AccessCardUpdated, AccessCardPushed, \
-    LocCardUpdated, RawCommServerEvent
+from card_automation_server.workers.events import LocCardsChanged, AccessCardPushed, LocCardUpdated, \
+    RawCommServerEvent, DownloadBacklogExceeded
 from card_automation_server.workers.utils import EventsWorker
 
 # What events does this worker accept? Used for type hinting
 _Events = Union[
-    AcsDatabaseUpdated,
-    AccessCardUpdated,
+    LocCardsChanged,
     LocCardUpdated,
     RawCommServerEvent,
 ]
 
+# How far back we look at pushed LocCards to estimate how fast a location is downloading
+_THROUGHPUT_WINDOW = timedelta(minutes=5)
+
 
 class CardPushedWatcher(EventsWorker[_Events]):
     def __init__(self,
                  config: Config,
-                 lookup_info: LookupInfo):
+                 lookup_info: LookupInfo,
+                 metrics: Optional[Metrics] = None):
         self._logger = config.logger
         self._lookup_info = lookup_info
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._backlog_threshold: int = config.windsx.download_backlog_threshold
         self._loc_cards: dict[int, LocCardUpdated] = {}
+        # LocCards we found pending in the table rather than heard about as they were written. Their timestamp is when
+        # we found them, so they don't count towards card_push_latency_seconds.
+        self._found_loc_card_ids: set[int] = set()
         self._card_ids_to_location_updates: dict[int, set[int]] = {}
+        # Events only tell us that something needs to be queried. The queries themselves happen once the inbound queue
+        # is drained, so a burst of events costs us a single round of queries.
+        self._needs_new_cards: bool = False
+        self._needs_pending_update: bool = False
+        # {location_id -> when each LocCard was seen pushed}, trimmed to _THROUGHPUT_WINDOW
+        self._pushed_times: dict[int, deque[datetime]] = {}
+        self._pending_downloads: dict[int, int] = {}
+        self._locations_over_backlog: set[int] = set()
 
         with self._lookup_info.new_session() as session:
             self._locations = set(session.scalars(
@@ -37,19 +56,80 @@ class CardPushedWatcher(EventsWorker[_Events]):
 
         super().__init__()
 
+    @property
+    def pending_downloads(self) -> dict[int, int]:
+        """
+        :return: {location_id -> number of LocCards waiting to be downloaded to that location}
+        """
+        return dict(self._pending_downloads)
+
+    def download_eta(self, location_id: int) -> Optional[timedelta]:
+        """
+        Estimates how long until every LocCard pending for this location is downloaded, based on how fast LocCards
+        have been pushed to it recently.
+
+        :return: The estimate, or None if nothing has been pushed recently enough to guess.
+        """
+        pending = self._pending_downloads.get(location_id, 0)
+        if pending == 0:
+            return timedelta()
+
+        per_second = self.download_rate(location_id)
+        if per_second is None:
+            return None
+
+        return timedelta(seconds=pending / per_second)
+
+    def download_rate(self, location_id: int) -> Optional[float]:
+        """
+        :return: How many LocCards a second have recently been pushed to this location, or None if nothing has been
+                 pushed recently enough to tell.
+        """
+        pushed_times = list(self._pushed_times.get(location_id, ()))
+        if len(pushed_times) < 2:
+            return None
+
+        elapsed = (pushed_times[-1] - pushed_times[0]).total_seconds()
+        if elapsed <= 0:
+            return None
+
+        return (len(pushed_times) - 1) / elapsed
+
     def _handle_event(self, event: _Events):
+        if isinstance(event, LocCardsChanged):
+            # Anyone could have changed the LocCards, so we need to see what LocCards need updates, in case we don't
+            # yet have them.
+            self._needs_new_cards = True
+            self._needs_pending_update = True
+
         if isinstance(event, LocCardUpdated):
             # Watch the card directly
             self._maybe_watch_loc_card(event)
+            self._needs_pending_update = True
+
+        if isinstance(event, RawCommServerEvent) and event.is_any_event(DownloadCompleteEvent):
+            # A download finishing is the only comm server traffic that can move a LocCard we're watching.
+            self._needs_pending_update = True
+
+    def _post_event(self) -> None:
+        if not self._inbound_event_queue.empty():
+            return  # More events are waiting, we'll query once they've all been handled
+
+        if self._needs_new_cards:
+            self._needs_new_cards = False
+            self._bring_in_new_cards()
 
-        # We need to see what LocCards need updates, in case we don't yet have them.
-        self._bring_in_new_cards()
+        if self._needs_pending_update:
+            self._needs_pending_update = False
 
-        # Go through all the LocCards we're waiting on to be updated
-        self._update_pending_loc_cards()
+            if len(self._loc_cards) > 0:  # If nothing is pending, there's nothing to query
+                # Go through all the LocCards we're waiting on to be updated
+                self._update_pending_loc_cards()
 
-        # If all locations for a card have been updated, we can tell others about it.
-        self._notify_of_card_pushed()
+                # If all locations for a card have been updated, we can tell others about it.
+                self._notify_of_card_pushed()
+
+        self._update_backlog()
 
     def _update_pending_loc_cards(self):
         if len(self._loc_cards) == 0:
@@ -63,6 +143,7 @@ class CardPushedWatcher(EventsWorker[_Events]):
                 ).all()
             }
 
+        now = datetime.now()
         for lc_id, lc_info in self._loc_cards.copy().items():
             card_location_updated = False
             # If it was deleted, then that's an update for a card losing access
@@ -82,18 +163,66 @@ class CardPushedWatcher(EventsWorker[_Events]):
                 self._card_ids_to_location_updates[lc_info.card_id].remove(lc_info.location_id)
 
             del self._loc_cards[lc_id]
+            self._record_push(lc_info, now)
+
+    def _record_push(self, loc_card: LocCardUpdated, pushed_at: datetime):
+        if loc_card.id in self._found_loc_card_ids:
+            self._found_loc_card_ids.discard(loc_card.id)
+        else:
+            latency = max((pushed_at - loc_card.timestamp).total_seconds(), 0)
+            self._metrics.histogram("card_push_latency_seconds", location=loc_card.location_id).observe(latency)
+
+        pushed_times = self._pushed_times.setdefault(loc_card.location_id, deque())
+        pushed_times.append(pushed_at)
+
+    def _update_backlog(self):
+        now = datetime.now()
+        for pushed_times in self._pushed_times.values():
+            while pushed_times and pushed_times[0] < now - _THROUGHPUT_WINDOW:
+                pushed_times.popleft()
+
+        pending: dict[int, int] = {location_id: 0 for location_id in self._locations}
+        for loc_card in self._loc_cards.values():
+            pending[loc_card.location_id] = pending.get(loc_card.location_id, 0) + 1
+        self._pending_downloads = pending
+
+        for location_id, count in pending.items():
+            eta = self.download_eta(location_id)
+            self._metrics.gauge("pending_downloads", location=location_id).set(count)
+            self._metrics.gauge("download_eta_seconds", location=location_id).set(
+                eta.total_seconds() if eta is not None else None
+            )
+
+            if count <= self._backlog_threshold:
+                self._locations_over_backlog.discard(location_id)
+                continue
+
+            if location_id in self._locations_over_backlog:
+                continue  # Already told everyone about it
+
+            self._locations_over_backlog.add(location_id)
+            self._logger.warning(f"Location {location_id} has {count} LocCards waiting to download (ETA {eta})")
+            self.outbound_queue.put(DownloadBacklogExceeded(location_id=location_id, pending=count, eta=eta))
 
     def _notify_of_card_pushed(self):
+        pushed_card_ids: list[int] = []
         for card_id, locations in self._card_ids_to_location_updates.copy().items():
             if len(locations) > 0:
                 self._logger.debug(f"Card {card_id} still waiting on locations {locations}")
                 continue  # Not all locations have been updated yet
 
-            card = AccessCardLookup(self._lookup_info).by_id(card_id)
             del self._card_ids_to_location_updates[card_id]
+            pushed_card_ids.append(card_id)
+
+        if len(pushed_card_ids) == 0:
+            return
 
-            if card is not None:
-                self.outbound_queue.put(AccessCardPushed(card))
+        # Plugins almost always want the person for a pushed card, so load them with the cards in one go. Read from
+        # Access, the mirror may still have the card as it was before whatever was just pushed.
+        with self._lookup_info.bypass_mirror():
+            cards = AccessCardLookup(self._lookup_info).with_people().by_ids(*pushed_card_ids)
+        for card in cards:
+            self.outbound_queue.put(AccessCardPushed(card))
 
     def _bring_in_new_cards(self):
         with self._lookup_info.new_session() as session:
@@ -109,9 +238,9 @@ class CardPushedWatcher(EventsWorker[_Events]):
 
         for loc_card in pending_loc_cards:
             self._logger.debug(f"Found pending LocCard {loc_card.id} (card {loc_card.card_id})")
-            self._maybe_watch_loc_card(loc_card)
+            self._maybe_watch_loc_card(loc_card, found=True)
 
-    def _maybe_watch_loc_card(self, event: LocCardUpdated):
+    def _maybe_watch_loc_card(self, event: LocCardUpdated, found: bool = False):
         if event.id in self._loc_cards:
             return  # No need to add it a second time, we're still waiting for it to be pushed
 
@@ -121,6 +250,8 @@ class CardPushedWatcher(EventsWorker[_Events]):
 
         self._logger.debug(f"Watching LocCard {event.id} (card {event.card_id}, location {event.location_id})")
         self._loc_cards[event.id] = event
+        if found:
+            self._found_loc_card_ids.add(event.id)
 
         if event.card_id not in self._card_ids_to_location_updates:
             self._card_ids_to_location_updates[event.card_id] = set()
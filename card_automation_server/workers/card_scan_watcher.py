@@ -6,7 +6,9 @@ from sqlalchemy.orm import Session
 from card_automation_server.config import Config
 from card_automation_server.plugins.types import CardScan, CommServerEventType
 from card_automation_server.windsx.db.models import EvnLog, NAMES, CARDS
-from card_automation_server.windsx.engines import LogEngine, AcsEngine
+from card_automation_server.windsx.db.scheduler import Priority
+from card_automation_server.windsx.engines import LogEngine
+from card_automation_server.windsx.lookup.utils import LookupInfo
 from card_automation_server.workers.events import LogDatabaseUpdated, CardScanned, RawCommServerEvent
 from card_automation_server.workers.utils import EventsWorker
 
@@ -25,14 +27,14 @@ _card_scan_events = [
 
 class CardScanWatcher(EventsWorker[_Events]):
     def __init__(self,
-                 acs_engine: AcsEngine,
+                 lookup_info: LookupInfo,
                  log_engine: LogEngine,
                  config: Config,
                  ):
         super().__init__()
         self._log = config.logger
+        self._lookup_info = lookup_info
         self._db_log_session = Session(log_engine)
-        self._db_acs_session = Session(acs_engine)
         self._last_timestamp = self._db_log_session.scalar(select(func.max(EvnLog.TimeDate)))
 
     def _handle_event(self, event: _Events):
@@ -85,11 +87,13 @@ class CardScanWatcher(EventsWorker[_Events]):
         device_id = event.data[3]
         card_number = event.data[21]
 
-        name_id = self._db_acs_session.scalar(
-            select(NAMES.ID)
-            .join(CARDS, CARDS.NameID == NAMES.ID)
-            .where(CARDS.Code == float(card_number))
-        )
+        # Someone is standing at the door, this goes ahead of anything else waiting on the database
+        with self._lookup_info.priority(Priority.INTERACTIVE), self._lookup_info.new_session() as session:
+            name_id = session.scalar(
+                select(NAMES.ID)
+                .join(CARDS, CARDS.NameID == NAMES.ID)
+                .where(CARDS.Code == float(card_number))
+            )
 
         self._outbound_event_queue.put(
             CardScanned(
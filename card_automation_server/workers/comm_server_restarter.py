@@ -1,5 +1,4 @@
 import os
-import signal
 import subprocess
 from datetime import datetime, timedelta
 from typing import Optional, Union
@@ -8,6 +7,7 @@ import psutil
 from sentry_sdk import capture_exception
 
 from card_automation_server.config import Config
+from card_automation_server.metrics import Metrics
 from card_automation_server.workers.events import CommServerRestartRequested
 from card_automation_server.workers.utils import EventsWorker
 
@@ -15,49 +15,78 @@ _Events = Union[
     CommServerRestartRequested
 ]
 
+_CS_PROCESS_NAME = 'cs.exe'
+# Only needed when we don't have a handle on the comm server, e.g. it was started by someone else after we looked
+_SCAN_INTERVAL = timedelta(minutes=1)
+# How long we give the comm server to exit after asking it to
+_TERMINATE_TIMEOUT_SECONDS = 10
+# If the comm server keeps dying right after we start it, don't sit in a tight loop restarting it
+_MIN_RESTART_INTERVAL = timedelta(seconds=10)
+
 
 class CommServerRestarter(EventsWorker[_Events]):
-    def __init__(self, config: Config):
+    """
+    Keeps the comm server running. Once we've found or started the comm server we hold on to its process and check on
+    that one process every loop, so if it exits we start it back up right away instead of on the next scan of every
+    process on the machine.
+    """
+
+    def __init__(self, config: Config, metrics: Optional[Metrics] = None):
         super().__init__()
         self._config = config
-        self._next_check_time = datetime.now()
+        self._log = config.logger
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._process: Optional[psutil.Process] = None
+        self._next_scan_time = datetime.now()
+        # When we noticed the comm server wasn't running, so we know how long it was down for
+        self._down_since: Optional[datetime] = None
+        self._last_start: Optional[datetime] = None
 
     def _pre_event(self) -> None:
-        if self._next_check_time < datetime.now():
+        if self._process is not None:
+            if self._is_running(self._process):
+                return
+
+            self._log.warning(f"Comm server (PID {self._process.pid}) exited")
+            self._process = None
+            self._down_since = datetime.now()
+
+            if self._last_start is not None and self._down_since - self._last_start < _MIN_RESTART_INTERVAL:
+                self._next_scan_time = self._last_start + _MIN_RESTART_INTERVAL
+            else:
+                self._start_comm_server()
             return
 
-        process = self._get_cs_process()
+        if self._next_scan_time > datetime.now():
+            return
 
-        if process is None:
+        self._next_scan_time = datetime.now() + _SCAN_INTERVAL
+        self._process = self._find_cs_process()
+
+        if self._process is None:
+            self._down_since = self._down_since or datetime.now()
             self._start_comm_server()
 
-        self._next_check_time = datetime.now() + timedelta(minutes=1)
+    @staticmethod
+    def _is_running(process: psutil.Process) -> bool:
+        try:
+            # is_running also checks the PID wasn't reused by another process
+            return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return False
 
     @staticmethod
-    def _get_cs_process() -> Optional[psutil.Process]:
-        _capture_exception = True
-        while True:
-            try:
-                cs_processes = [p for p in psutil.process_iter() if p.name() == 'cs.exe']
-
-                if len(cs_processes) == 0:
-                    return None
-
-                return cs_processes[0]
-            except psutil.NoSuchProcess:
-                # This can happen if we iterate over a process and check the name, but the process is gone. Rare, but it
-                # happens and it's useless to report it. This technically means we could loop forever without restarting
-                # the comm server and never know, but this issue has happened maybe twice in 4 years and is resolved by
-                # the next loop.
-                continue
-            except BaseException as ex:
-                # This one is a little more dangerous, just in case it's an issue that can happen every single time.
-                # That's why we gate it behind a flag, so we don't have a tight loop that's reporting an exception. In
-                # the entire time this program has been running, the only exception reported was the one above.
-                if _capture_exception:
-                    capture_exception(ex)
-                    _capture_exception = False
-                continue
+    def _find_cs_process() -> Optional[psutil.Process]:
+        try:
+            # Asking for the name up front lets psutil skip processes that disappear while we're iterating
+            for process in psutil.process_iter(['name']):
+                if (process.info['name'] or '').lower() == _CS_PROCESS_NAME:
+                    return process
+        except BaseException as ex:
+            # The next scan will try again, no reason to stop the worker over it
+            capture_exception(ex)
+
+        return None
 
     def _handle_event(self, event: _Events):
         if isinstance(event, CommServerRestartRequested):
@@ -69,12 +98,32 @@ class CommServerRestarter(EventsWorker[_Events]):
         self._start_comm_server()
 
     def _kill_comm_server(self):
-        process = self._get_cs_process()
+        process = self._process or self._find_cs_process()
+        self._process = None
 
         if process is None:
             return
 
-        os.kill(process.pid, signal.SIGTERM)
+        self._down_since = datetime.now()
+
+        try:
+            process.terminate()
+            process.wait(_TERMINATE_TIMEOUT_SECONDS)
+        except psutil.NoSuchProcess:
+            pass  # Already gone
+        except psutil.TimeoutExpired:
+            process.kill()
 
     def _start_comm_server(self):
-        subprocess.Popen(os.path.join(self._config.windsx.root, 'CS.exe'))
+        self._last_start = datetime.now()
+        popen = subprocess.Popen(os.path.join(self._config.windsx.root, 'CS.exe'))
+        try:
+            self._process = psutil.Process(popen.pid)
+        except psutil.NoSuchProcess:
+            self._process = None  # Died already, the next scan will pick it up
+
+        self._metrics.counter("comm_server_restarts").inc()
+        if self._down_since is not None:
+            downtime = datetime.now() - self._down_since
+            self._metrics.histogram("comm_server_downtime_seconds").observe(downtime.total_seconds())
+            self._down_since = None
@@ -0,0 +1,82 @@
+from datetime import timedelta
+from typing import Optional
+
+from card_automation_server.config import Config
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.lookup.download_staging import DownloadStager
+from card_automation_server.workers.card_pushed_watcher import CardPushedWatcher
+from card_automation_server.workers.utils import ThreadedWorker
+
+_WAVE_INTERVAL = timedelta(seconds=15)
+# How many cards go out in a wave when no location has pushed anything recently enough to know how fast it is
+_PROBE_WAVE = 50
+# Waves are never smaller than this, so one slow location can't hold every staged card back
+_MIN_WAVE = 10
+
+
+class DownloadStagingWorker(ThreadedWorker[None]):
+    """
+    Releases cards from the DownloadStager in waves, each about as many LocCards as the slowest location downloads
+    between waves, less what it still has pending. That keeps the comm server's queue short, so a card written directly
+    never waits long behind a bulk change. Locations with downloads pending that aren't getting through (offline or
+    stalled) don't count, and every wave is at least _MIN_WAVE cards, so staged cards always go out eventually.
+
+    One last wave goes out when the worker stops. Writing everything still staged could take longer than we're given to
+    stop, so anything left after that is logged and lost, and the sync that staged it has to run again.
+    """
+
+    def __init__(self,
+                 config: Config,
+                 stager: DownloadStager,
+                 card_pushed_watcher: CardPushedWatcher,
+                 metrics: Optional[Metrics] = None):
+        super().__init__()
+        self._log = config.logger
+        self._stager = stager
+        self._card_pushed_watcher = card_pushed_watcher
+        self._metrics = metrics if metrics is not None else Metrics()
+
+    def wave_size(self) -> int:
+        sizes = []
+        for location_id, pending in self._card_pushed_watcher.pending_downloads.items():
+            per_second = self._card_pushed_watcher.download_rate(location_id)
+            if per_second is None and pending > 0:
+                continue  # Nothing is getting through, it's offline or stalled, so it can't tell us how fast to go
+            capacity = _PROBE_WAVE if per_second is None else int(per_second * _WAVE_INTERVAL.total_seconds())
+            sizes.append(capacity - pending)
+
+        return max(min(sizes, default=_PROBE_WAVE), _MIN_WAVE)
+
+    def _release_wave(self) -> None:
+        if self._stager.staged == 0:
+            return
+
+        size = self.wave_size()
+        self._metrics.gauge("download_staging_wave_size").set(size)
+        self._metrics.gauge("download_staging_oldest_wait_seconds").set(self._stager.oldest_wait().total_seconds())
+        released = self._stager.release(size)
+        self._log.debug(f"Released {released} staged card(s), {self._stager.staged} still staged")
+
+    def _run(self) -> None:
+        while True:
+            if self._keep_running.is_set():
+                break
+
+            try:
+                self._release_wave()
+            except Exception as ex:
+                self._log.exception(ex)
+
+            self._wake_event.wait(_WAVE_INTERVAL.total_seconds())
+            self._wake_event.clear()
+
+        try:
+            if self._stager.staged > 0:
+                released = self._stager.release(self.wave_size())
+                self._log.info(f"Wrote {released} staged card(s) before stopping")
+        except Exception as ex:
+            self._log.exception(ex)
+
+        if self._stager.staged > 0:
+            self._log.warning(f"{self._stager.staged} staged card(s) weren't written before stopping and are lost, run "
+                              f"the sync again to write them")
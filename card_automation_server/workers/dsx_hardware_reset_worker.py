@@ -1,75 +1,252 @@
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Union
+from typing import Union, Optional
 
 import requests
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, or_
 
 from card_automation_server.config import Config
 from card_automation_server.data_signing import DataSigning
-from card_automation_server.windsx.db.models import LOC
-from card_automation_server.windsx.engines import AcsEngine
-from card_automation_server.workers.events import AcsDatabaseUpdated, CommServerRestartRequested
+from card_automation_server.metrics import Metrics
+from card_automation_server.plugins.types import CommServerEventType, DownloadCompleteEvent
+from card_automation_server.windsx.db.models import LOC, LocCards
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.events import AcsTablesChanged, CommServerRestartRequested, LocCardUpdated, \
+    RawCommServerEvent
 from card_automation_server.workers.utils import EventsWorker
 
 _Events = Union[
-    AcsDatabaseUpdated
+    AcsTablesChanged,
+    LocCardUpdated,
+    RawCommServerEvent,
 ]
 
+# Normally a location takes at most 40 seconds to download. If a location has work pending and we haven't seen any
+# progress on it for this long, it's stalled.
+_STALL_TIMEOUT = timedelta(seconds=90)
+# How long we give the comm server after restarting it before we escalate to resetting the hardware
+_COMM_SERVER_RESTART_GRACE = timedelta(minutes=3)
+# Don't reset the hardware more often than this
+_HARDWARE_RESET_COOLDOWN = timedelta(minutes=10)
+# At startup, a location the comm server hasn't talked to (LOC.LastComm) for this long is treated as having lost
+# communication, since we won't have seen the event for it
+_COMMUNICATION_SILENCE = timedelta(minutes=10)
+
+
+@dataclass
+class _LocationDownload:
+    last_progress: datetime
+    pending_loc_cards: int = 0
+    plflag: bool = False
+
+    def progressed(self, now: datetime):
+        self.last_progress = now
+
+
+@dataclass
+class _Escalation:
+    # Set when we've asked the comm server to restart because of a stall, cleared when things start moving again
+    comm_server_restarted_at: Optional[datetime] = None
+    next_allowed_reset: datetime = field(default_factory=datetime.now)
+    # The locations that were stalled when we last reset the hardware
+    reset_locations: set[int] = field(default_factory=set)
+
 
 class DSXHardwareResetWorker(EventsWorker[_Events]):
+    """
+    Watches every enabled location in our location group that has a download pending and nudges things along if the
+    download stalls.
+
+    Progress is judged from the comm server's download events and from the number of LocCards still pending for each
+    location, so a location that's slowly working through a big download isn't mistaken for a stalled one. When a
+    location does stall we first restart the comm server, and only if that doesn't get it moving do we reset all the
+    hardware through the DSX Pi.
+
+    Locations that have lost communication are left alone, since no amount of restarting will get a download to them.
+    We learn that from the comm server's events, from LOC.LastComm at startup, and from a location still being stalled
+    after a hardware reset. Any of them counts as back once the comm server says so or its download moves again.
+    """
+
     def __init__(self,
                  config: Config,
-                 acs_engine: AcsEngine
+                 lookup_info: LookupInfo,
+                 metrics: Optional[Metrics] = None,
                  ):
         super().__init__()
         self._log = config.logger
+        self._lookup_info = lookup_info
+        self._metrics = metrics if metrics is not None else Metrics()
         self._dsx_pi_host = config.dsxpi.host
         self._data_signing = DataSigning(config.dsxpi.secret)
-        self._session = Session(acs_engine)
-        self._location_to_pending_timestamps: dict[int, datetime] = {}
-        self._next_allowed_reset: datetime = datetime.now()
+        self._downloads: dict[int, _LocationDownload] = {}
+        self._communication_lost: set[int] = set()
+        self._escalation = _Escalation()
+        self._needs_sync: bool = False
 
-        # Even if we don't see the AcsDatabaseUpdated event, we're going to manually check. Normally it should only take
-        # max 40 seconds to update, so checking every minute and failing every 3 minute handles all the worst cases.
+        # Even if we don't see any events, we're going to manually check every minute in case we missed something.
         self._call_every(timedelta(minutes=1), self._sync_locations_pending)
 
-    def _post_event(self) -> None:
-        now = datetime.now()
-        three_minutes_ago = now - timedelta(minutes=3)
+    def _pre_run(self) -> None:
+        cutoff = datetime.now() - _COMMUNICATION_SILENCE
+        with self._lookup_info.new_session() as session:
+            silent: set[int] = set(session.scalars(
+                select(LOC.Loc)
+                .where(LOC.LocGrp == self._lookup_info.location_group_id)
+                .where(LOC.Status)
+                .where(or_(LOC.LastComm.is_(None), LOC.LastComm < cutoff))
+            ).all())
 
-        for update_started_timestamp in self._location_to_pending_timestamps.values():
-            if three_minutes_ago > update_started_timestamp and now > self._next_allowed_reset:
-                self._reset()
+        if len(silent) > 0:
+            self._log.info(f"Locations {sorted(silent)} haven't communicated since before {cutoff}, not checking them "
+                           f"for stalled downloads until they do")
+        self._communication_lost |= silent
 
     def _handle_event(self, event: _Events):
-        if isinstance(event, AcsDatabaseUpdated):
+        now = datetime.now()
+
+        if isinstance(event, AcsTablesChanged) and event.tables & {LOC, LocCards}:
+            self._needs_sync = True
+        elif isinstance(event, LocCardUpdated):
+            self._needs_sync = True
+        elif isinstance(event, RawCommServerEvent):
+            self._handle_comm_server_event(event, now)
+
+    def _handle_comm_server_event(self, event: RawCommServerEvent, now: datetime):
+        location_id = event.data[2]
+
+        if event.is_any_event(CommServerEventType.STARTING_INCREMENTAL_DOWNLOAD):
+            self._progressed(location_id, now)
+        elif event.is_any_event(DownloadCompleteEvent):
+            self._progressed(location_id, now)
+            self._needs_sync = True
+        elif event.is_any_event(CommServerEventType.LOCATION_COMMUNICATION_LOSS):
+            self._log.info(f"Location {location_id} lost communication, not checking it for stalled downloads")
+            self._communication_lost.add(location_id)
+        elif event.is_any_event(CommServerEventType.LOCATION_COMMUNICATION_RESTORAL):
+            # The clock starts over, it's going to need some time to catch up
+            self._progressed(location_id, now)
+            self._needs_sync = True
+
+    def _progressed(self, location_id: int, now: datetime):
+        # It's obviously talking to the comm server
+        self._communication_lost.discard(location_id)
+        if download := self._downloads.get(location_id):
+            download.progressed(now)
+
+    def _post_event(self) -> None:
+        if not self._inbound_event_queue.empty():
+            return  # We'll sync once the burst of events is through
+
+        if self._needs_sync:
+            self._needs_sync = False
             self._sync_locations_pending()
 
+        self._check_for_stalls(datetime.now())
+
     def _sync_locations_pending(self):
-        locations_pending: set[int] = set(self._session.scalars(
-            select(LOC.Loc).where(LOC.PlFlag)
-        ).all())
+        location_ids = (
+            select(LOC.Loc)
+            .where(LOC.LocGrp == self._lookup_info.location_group_id)
+            .where(LOC.Status)
+        )
+        with self._lookup_info.new_session() as session:
+            locations_pending: set[int] = set(session.scalars(
+                location_ids.where(LOC.PlFlag)
+            ).all())
+            loc_cards_pending: dict[int, int] = {
+                location_id: count
+                for location_id, count in session.execute(
+                    select(LocCards.Loc, func.count())
+                    .where(LocCards.DlFlag != 0)
+                    .where(LocCards.Loc.in_(location_ids))
+                    .group_by(LocCards.Loc)
+                ).all()
+            }
+
+        now = datetime.now()
+
+        for location_id in list(self._downloads.keys()):
+            # If we aren't downloading anymore, stop watching it
+            if location_id not in locations_pending and loc_cards_pending.get(location_id, 0) == 0:
+                del self._downloads[location_id]
+
+        for location_id in locations_pending | loc_cards_pending.keys():
+            pending_loc_cards = loc_cards_pending.get(location_id, 0)
+            plflag = location_id in locations_pending
+
+            download = self._downloads.get(location_id)
+            if download is None:
+                self._downloads[location_id] = _LocationDownload(
+                    last_progress=now,
+                    pending_loc_cards=pending_loc_cards,
+                    plflag=plflag,
+                )
+                continue
+
+            # Fewer LocCards waiting, or the location parameters went out, means the hardware is taking the download
+            if pending_loc_cards < download.pending_loc_cards or (download.plflag and not plflag):
+                self._progressed(location_id, now)
+
+            download.pending_loc_cards = pending_loc_cards
+            download.plflag = plflag
 
-        for location_id in list(self._location_to_pending_timestamps.keys()):
-            # If we aren't downloading anymore but were watching for this timestamp, stop watching it
-            if location_id not in locations_pending:
-                del self._location_to_pending_timestamps[location_id]
+    def _stalled_locations(self, now: datetime) -> list[int]:
+        return [
+            location_id
+            for location_id, download in self._downloads.items()
+            if location_id not in self._communication_lost and now - download.last_progress > _STALL_TIMEOUT
+        ]
 
-        for location_id in locations_pending:
-            # If we're downloading this location and aren't currently watching for this timestamp, start watching it
-            if location_id not in self._location_to_pending_timestamps:
-                self._location_to_pending_timestamps[location_id] = datetime.now()
+    def _check_for_stalls(self, now: datetime):
+        stalled = self._stalled_locations(now)
+        if len(stalled) == 0:
+            # Everything that's pending is moving, so if we restarted the comm server it did its job
+            self._escalation.comm_server_restarted_at = None
+            self._escalation.reset_locations = set()
+            return
+
+        restarted_at = self._escalation.comm_server_restarted_at
+        if restarted_at is None:
+            self._log.warning(f"Downloads to locations {stalled} have stalled, restarting the comm server")
+            for location_id in stalled:
+                self._metrics.counter("download_stalls", location=location_id).inc()
+            self._escalation.comm_server_restarted_at = now
+            self._restart_comm_server()
+            return
+
+        if now - restarted_at < _COMM_SERVER_RESTART_GRACE or now < self._escalation.next_allowed_reset:
+            return
+
+        # Resetting the hardware didn't help these last time, so they aren't listening. Doing it again won't either.
+        unreachable = [location_id for location_id in stalled if location_id in self._escalation.reset_locations]
+        if len(unreachable) > 0:
+            self._log.warning(f"Downloads to locations {unreachable} are still stalled after resetting the hardware, "
+                              f"treating them as offline until they communicate again")
+            self._communication_lost.update(unreachable)
+            stalled = [location_id for location_id in stalled if location_id not in self._escalation.reset_locations]
+            if len(stalled) == 0:
+                self._escalation.comm_server_restarted_at = None
+                self._escalation.reset_locations = set()
+                return
+
+        self._log.warning(f"Downloads to locations {stalled} are still stalled, resetting the hardware")
+        self._escalation.reset_locations = set(stalled)
+        self._reset()
+        self._escalation.comm_server_restarted_at = now
+        self._restart_comm_server()
+
+    def _restart_comm_server(self):
+        self._metrics.counter("download_stall_recoveries", kind="comm_server").inc()
+        self._outbound_event_queue.put(CommServerRestartRequested())
 
     def _reset(self):
+        self._metrics.counter("download_stall_recoveries", kind="hardware").inc()
+
         # Don't restart again any sooner than 10 minutes from now
-        self._next_allowed_reset = datetime.now() + timedelta(minutes=10)
+        self._escalation.next_allowed_reset = datetime.now() + _HARDWARE_RESET_COOLDOWN
         # Tell the hardware to restart
         signed_payload = self._data_signing.encode(10)
         url = f"{self._dsx_pi_host}/reset/{signed_payload}"
         response = requests.post(url)
 
         response.raise_for_status()
-
-        # Request that the comm server software restart
-        self._outbound_event_queue.put(CommServerRestartRequested())
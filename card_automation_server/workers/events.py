@@ -19,6 +19,32 @@ class AcsDatabaseUpdated(WorkerEvent):
     pass
 
 
+@dataclass(frozen=True)
+class AcsTablesChanged(WorkerEvent):
+    """
+    Fired by AcsChangeDetector after an AcsDatabaseUpdated, with the ORM classes of every table whose contents changed.
+    """
+    tables: frozenset[type]
+
+
+class CardsChanged(WorkerEvent):
+    """
+    CARDS, NAMES or UDF changed.
+    """
+    pass
+
+
+class LocCardsChanged(WorkerEvent):
+    pass
+
+
+class AclDefinitionsChanged(WorkerEvent):
+    """
+    Something that decides what a card has access to changed, i.e. AclGrpName, AclGrpCombo, AclGrp, ACL or DGRP.
+    """
+    pass
+
+
 class LogDatabaseUpdated(WorkerEvent):
     pass
 
@@ -58,10 +84,12 @@ class LocCardUpdated(WorkerEvent):
     def __init__(self,
                  id: int,  # noqa
                  card_id: int,
-                 location_id: int):
+                 location_id: int,
+                 timestamp: Optional[datetime] = None):
         self._id = id
         self._card_id = card_id
         self._location_id = location_id
+        self._timestamp = timestamp if timestamp is not None else datetime.now()
 
     @property
     def id(self) -> int:
@@ -75,6 +103,13 @@ class LocCardUpdated(WorkerEvent):
     def location_id(self) -> int:
         return self._location_id
 
+    @property
+    def timestamp(self) -> datetime:
+        """
+        When the LocCard was written, or when we first saw it pending if someone else wrote it.
+        """
+        return self._timestamp
+
 
 class AccessCardPushed(WorkerEvent):
     """
@@ -89,6 +124,17 @@ class AccessCardPushed(WorkerEvent):
         return self._access_card
 
 
+@dataclass(frozen=True)
+class DownloadBacklogExceeded(WorkerEvent):
+    """
+    This event is fired when the number of LocCards waiting to be downloaded to a location goes over the configured
+    threshold. It won't fire again for that location until the backlog drops back under the threshold.
+    """
+    location_id: int
+    pending: int
+    eta: Optional[timedelta]
+
+
 class DoorState(enum.Enum):
     OPEN = enum.auto()
     SECURE = enum.auto()
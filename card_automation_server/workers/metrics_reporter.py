@@ -0,0 +1,40 @@
+import json
+from datetime import timedelta
+
+from card_automation_server.config import Config
+from card_automation_server.metrics import Metrics
+from card_automation_server.workers.utils import ThreadedWorker
+
+_REPORT_INTERVAL = timedelta(minutes=5)
+
+
+class MetricsReporter(ThreadedWorker[None]):
+    """
+    Periodically writes a snapshot of every metric to the log. The log is shipped to Loki, which makes it the easiest
+    place to look at the metrics without standing up anything else.
+    """
+
+    def __init__(self, config: Config, metrics: Metrics):
+        super().__init__()
+        self._log = config.logger
+        self._metrics = metrics
+
+    def report(self) -> None:
+        snapshot = self._metrics.snapshot()
+        if len(snapshot) == 0:
+            return
+
+        self._log.info(f"Metrics: {json.dumps(snapshot, default=str)}")
+
+    def _run(self) -> None:
+        while True:
+            self._wake_event.wait(_REPORT_INTERVAL.total_seconds())
+            self._wake_event.clear()
+
+            try:
+                self.report()
+            except Exception as ex:
+                self._log.exception(ex)
+
+            if self._keep_running.is_set():
+                break
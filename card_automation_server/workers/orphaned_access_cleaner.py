@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from card_automation_server.config import Config
+from card_automation_server.windsx.lookup.compaction import AccessCompactor
+from card_automation_server.workers.utils import ThreadedWorker
+
+_CLEANUP_INTERVAL = timedelta(days=1)
+
+
+class OrphanedAccessCleaner(ThreadedWorker[None]):
+    def __init__(self, config: Config, compactor: AccessCompactor):
+        super().__init__()
+        self._log = config.logger
+        self._compactor = compactor
+
+    def _run(self) -> None:
+        while True:
+            try:
+                report = self._compactor.compact()
+                if report.deleted > 0:
+                    self._log.info(f"Cleaned up {report.combos} unused combo(s), {report.acls} ACL(s) and "
+                                   f"{report.device_groups} device group(s)")
+            except Exception as ex:
+                self._log.exception(ex)
+
+            if self._keep_running.is_set():
+                break
+
+            self._wake_event.wait(_CLEANUP_INTERVAL.total_seconds())
+            self._wake_event.clear()
@@ -2,13 +2,14 @@ import time
 from typing import Union
 
 from card_automation_server.plugins.interfaces import Plugin, PluginStartup, PluginShutdown, PluginCardScanned, PluginLoop, \
-    PluginCardDataPushed
-from card_automation_server.workers.events import AccessCardPushed, CardScanned
+    PluginCardDataPushed, PluginDownloadBacklogExceeded
+from card_automation_server.workers.events import AccessCardPushed, CardScanned, DownloadBacklogExceeded
 from card_automation_server.workers.utils import EventsWorker
 
 _Events = Union[
     CardScanned,
     AccessCardPushed,
+    DownloadBacklogExceeded,
 ]
 
 
@@ -44,3 +45,6 @@ class PluginWorker(EventsWorker[_Events]):
 
         if isinstance(event, AccessCardPushed) and isinstance(self._plugin, PluginCardDataPushed):
             self._plugin.card_data_pushed(event.access_card)
+
+        if isinstance(event, DownloadBacklogExceeded) and isinstance(self._plugin, PluginDownloadBacklogExceeded):
+            self._plugin.download_backlog_exceeded(event.location_id, event.pending, event.eta)
@@ -0,0 +1,24 @@
+from typing import Union
+
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.events import AcsTablesChanged
+from card_automation_server.workers.utils import EventsWorker
+
+_Events = Union[
+    AcsTablesChanged
+]
+
+
+class ReferenceDataInvalidator(EventsWorker[_Events]):
+    """
+    Our own writes invalidate the reference data cache as they happen, but WinDSX (or anyone else) can change the ACS
+    database too. AcsChangeDetector tells us which tables that touched.
+    """
+
+    def __init__(self, lookup_info: LookupInfo):
+        super().__init__()
+        self._lookup_info = lookup_info
+
+    def _handle_event(self, event: _Events):
+        if isinstance(event, AcsTablesChanged):
+            self._lookup_info.cache.invalidate(*event.tables)
@@ -656,4 +656,8 @@ def resolver(
     if instance := if_resolved_value(request, log_engine):
         resolver.singleton(LogEngine, instance)
 
+    # noinspection PyTestUnpassedFixture
+    if instance := if_resolved_value(request, lookup_info):
+        resolver.singleton(instance)
+
     return resolver
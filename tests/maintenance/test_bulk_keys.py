@@ -0,0 +1,11 @@
+from card_automation_server.maintenance.bulk_keys import benchmark_bulk_keys, scratch_engine
+
+
+class TestBulkKeysBenchmark:
+    def test_every_strategy_finds_every_card(self):
+        results = benchmark_bulk_keys(scratch_engine(500), sizes=(50, 500))
+
+        assert {result.strategy for result in results} == {
+            "fixed IN chunks of 100", "adaptive IN chunks", "temp table",
+        }
+        assert all(result.rows == result.keys for result in results)
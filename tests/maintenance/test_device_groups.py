@@ -0,0 +1,23 @@
+from sqlalchemy.orm import Session
+
+from card_automation_server.maintenance.device_groups import benchmark_device_groups, scratch_engine
+from card_automation_server.windsx.lookup.access_card import device_group_index, device_mask
+
+
+class TestDeviceGroupsBenchmark:
+    def test_strategies_agree(self):
+        results = benchmark_device_groups(sizes=(200,), lookups=10)
+
+        assert {result.strategy for result in results} == {"scan every column", "device mask index"}
+        assert len({result.matched for result in results}) == 1
+        assert results[0].matched >= 5  # Half of them are existing groups
+
+    def test_index_covers_every_group(self):
+        engine, device_sets = scratch_engine(500)
+
+        with Session(engine) as session:
+            index = device_group_index(session, 1)
+
+        for devices in device_sets:
+            # Duplicate device sets keep the first group
+            assert index[device_mask(devices)] == device_sets.index(devices) + 1
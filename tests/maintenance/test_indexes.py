@@ -0,0 +1,52 @@
+from sqlalchemy import Engine
+
+from card_automation_server.maintenance.indexes import ACS_HOT_PREDICATES, LOG_HOT_PREDICATES, HotPredicate, \
+    inspect_indexes, create_missing_indexes, benchmark
+from card_automation_server.windsx.db.models import CARDS, AcsDataBase
+
+
+class TestIndexes:
+    def test_reports_missing_indexes(self, acs_data_engine: Engine):
+        reports = inspect_indexes(acs_data_engine, ACS_HOT_PREDICATES)
+
+        assert [report.predicate for report in reports] == list(ACS_HOT_PREDICATES)
+        assert not any(report.is_covered for report in reports)
+
+    def test_primary_key_counts_as_an_index(self, acs_data_engine: Engine):
+        [report] = inspect_indexes(acs_data_engine, [HotPredicate(CARDS, ("ID",))])
+
+        assert report.is_covered
+
+    def test_creates_missing_indexes(self, acs_data_engine: Engine):
+        created = create_missing_indexes(acs_data_engine, inspect_indexes(acs_data_engine, ACS_HOT_PREDICATES))
+
+        assert created == list(ACS_HOT_PREDICATES)
+        reports = inspect_indexes(acs_data_engine, ACS_HOT_PREDICATES)
+        assert {report.covered_by for report in reports} == {p.index_name for p in ACS_HOT_PREDICATES}
+
+        # Nothing left to create the second time around
+        assert create_missing_indexes(acs_data_engine, reports) == []
+
+    def test_created_indexes_stay_off_the_models(self, acs_data_engine: Engine):
+        create_missing_indexes(acs_data_engine, inspect_indexes(acs_data_engine, ACS_HOT_PREDICATES))
+
+        assert not any(index.name.startswith("IX_CAS_") for index in AcsDataBase.metadata.tables["CARDS"].indexes)
+
+    def test_leading_columns_in_any_order(self, acs_data_engine: Engine):
+        swapped = HotPredicate(ACS_HOT_PREDICATES[2].table, ("Loc", "CardID"))
+        create_missing_indexes(acs_data_engine, inspect_indexes(acs_data_engine, [swapped]))
+
+        [report] = inspect_indexes(acs_data_engine, [ACS_HOT_PREDICATES[2]])
+        assert report.covered_by == swapped.index_name
+
+    def test_log_predicates(self, log_engine: Engine):
+        reports = inspect_indexes(log_engine, LOG_HOT_PREDICATES)
+
+        # TimeDate leads the EvnLog primary key
+        assert all(report.is_covered for report in reports)
+
+    def test_benchmark(self, acs_data_engine: Engine):
+        results = benchmark(acs_data_engine, ACS_HOT_PREDICATES, iterations=3)
+
+        assert HotPredicate(CARDS, ("Code",)) in results
+        assert all(seconds >= 0 for seconds in results.values())
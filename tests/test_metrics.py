@@ -0,0 +1,55 @@
+import pytest
+
+from card_automation_server.metrics import Metrics, Counter, Histogram
+
+
+class TestMetrics:
+    def test_same_name_and_labels_returns_same_metric(self):
+        metrics = Metrics()
+
+        assert metrics.counter("hits", table="CARDS") is metrics.counter("hits", table="CARDS")
+        assert metrics.counter("hits", table="CARDS") is not metrics.counter("hits", table="LOC")
+
+    def test_counter_and_gauge(self):
+        metrics = Metrics()
+
+        counter: Counter = metrics.counter("restarts")
+        counter.inc()
+        counter.inc(2)
+        assert counter.value == 3
+
+        gauge = metrics.gauge("pending", location=1)
+        assert gauge.value is None
+        gauge.set(10)
+        assert gauge.value == 10
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram(buckets=(1, 5, 10))
+        for value in (0.5, 2, 3, 7, 100):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        assert snapshot["count"] == 5
+        assert snapshot["sum"] == 112.5
+        assert snapshot["max"] == 100
+        assert snapshot["buckets"] == {1: 1, 5: 3, 10: 4, "+Inf": 5}
+
+    def test_name_reused_with_different_type(self):
+        metrics = Metrics()
+        metrics.counter("thing")
+
+        with pytest.raises(Exception):
+            metrics.histogram("thing")
+
+    def test_snapshot(self):
+        metrics = Metrics()
+        metrics.counter("restarts").inc()
+        metrics.gauge("pending", location=2).set(4)
+        metrics.gauge("pending", location=1).set(3)
+
+        snapshot = metrics.snapshot()
+        assert snapshot["restarts"] == [{"labels": {}, "value": 1}]
+        assert snapshot["pending"] == [
+            {"labels": {"location": 1}, "value": 3},
+            {"labels": {"location": 2}, "value": 4},
+        ]
@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import Engine, event, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from card_automation_server.maintenance.bulk_keys import scratch_engine
+from card_automation_server.windsx.db import bulk_keys
+from card_automation_server.windsx.db.bulk_keys import execute_in, scalars_in
+from card_automation_server.windsx.db.models import CARDS
+
+
+@pytest.fixture(autouse=True)
+def fresh_chunk_sizes():
+    bulk_keys._chunk_sizes.clear()
+    yield
+    bulk_keys._chunk_sizes.clear()
+
+
+@pytest.fixture(scope="module")
+def cards_engine() -> Engine:
+    return scratch_engine(3000)
+
+
+def _reject_over(engine: Engine, max_parameters: int, message: str = "Query is too complex") -> list[int]:
+    # Pretend to be a database that can't take more than max_parameters in one statement
+    sizes: list[int] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _check(_conn, _cursor, _statement, parameters, _context, _executemany):
+        sizes.append(len(parameters))
+        if len(parameters) > max_parameters:
+            raise sqlite3.OperationalError(message)
+
+    return sizes
+
+
+class TestBulkKeys:
+    def test_finds_every_key(self, cards_engine: Engine):
+        with Session(cards_engine) as session:
+            ids = scalars_in(session, select(CARDS.ID), CARDS.ID, range(1, 2501))
+
+        assert sorted(ids) == list(range(1, 2501))
+
+    def test_rows(self, cards_engine: Engine):
+        with Session(cards_engine) as session:
+            rows = execute_in(session, select(CARDS.ID, CARDS.Code), CARDS.ID, [5, 6])
+
+        assert sorted((row.ID, int(row.Code)) for row in rows) == [(5, 5), (6, 6)]
+
+    def test_duplicates_and_empty(self, cards_engine: Engine):
+        with Session(cards_engine) as session:
+            assert scalars_in(session, select(CARDS.ID), CARDS.ID, [7, 7, 7]) == [7]
+            assert scalars_in(session, select(CARDS.ID), CARDS.ID, []) == []
+
+    def test_chunks_grow(self):
+        engine = scratch_engine(3000)
+        sizes = _reject_over(engine, 10000)
+
+        with Session(engine) as session:
+            scalars_in(session, select(CARDS.ID), CARDS.ID, range(1, 3001))
+
+        assert sizes == [100, 200, 400, 800, 1500]
+
+    def test_chunks_shrink_when_rejected(self):
+        engine = scratch_engine(1000)
+        sizes = _reject_over(engine, 150)
+
+        with Session(engine) as session:
+            ids = scalars_in(session, select(CARDS.ID), CARDS.ID, range(1, 1001))
+
+        assert sorted(ids) == list(range(1, 1001))
+        # 100 worked, 200 didn't, so it settled on 100
+        assert sizes == [100, 200] + [100] * 9
+        assert bulk_keys._chunk_size("sqlite").size == 100
+
+    def test_gives_up_at_the_smallest_chunk(self):
+        engine = scratch_engine(100)
+        _reject_over(engine, 0)
+
+        with Session(engine) as session:
+            with pytest.raises(OperationalError):
+                scalars_in(session, select(CARDS.ID), CARDS.ID, range(1, 101))
+
+        # Nothing worked, so that wasn't about the size
+        assert bulk_keys._chunk_size("sqlite").size == 100
+
+    def test_other_errors_are_not_about_the_size(self):
+        engine = scratch_engine(1000)
+        sizes = _reject_over(engine, 0, "Could not use; file already in use")
+
+        with Session(engine) as session:
+            with pytest.raises(OperationalError):
+                scalars_in(session, select(CARDS.ID), CARDS.ID, range(1, 1001))
+
+        assert sizes == [100]
+        assert bulk_keys._chunk_size("sqlite")._maximum == 2000
@@ -0,0 +1,61 @@
+import threading
+from pathlib import Path
+
+import pytest
+from sqlalchemy import NullPool, QueuePool, create_engine, text
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.engine_factory import EngineFactory
+
+
+class TestEngineFactory:
+    def test_microsoft_access_is_unpooled_by_default(self, tmp_path: Path):
+        pytest.importorskip("pyodbc", exc_type=ImportError)  # Needs the ODBC driver manager to be installed
+        engine = EngineFactory.microsoft_access(tmp_path / "AcsData.mdb")
+
+        assert isinstance(engine.pool, NullPool)
+
+    def test_microsoft_access_pooled(self, tmp_path: Path):
+        pytest.importorskip("pyodbc", exc_type=ImportError)  # Needs the ODBC driver manager to be installed
+        engine = EngineFactory.microsoft_access(tmp_path / "AcsData.mdb", pooled=True, max_connection_lifetime=60)
+
+        assert isinstance(engine.pool, QueuePool)
+        assert engine.pool._pre_ping
+        assert engine.pool._recycle == 60
+
+    def test_pooled_nested_sessions_are_isolated(self, tmp_path: Path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", **EngineFactory.pool_options(60))
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE t (x INTEGER)"))
+
+        with engine.connect() as outer:
+            outer.execute(text("INSERT INTO t VALUES (1)"))
+
+            # Same thread, but its own connection, so rolling it back leaves the outer transaction alone
+            with engine.connect() as inner:
+                assert inner.connection.dbapi_connection is not outer.connection.dbapi_connection
+                inner.rollback()
+
+            outer.commit()
+
+        with engine.connect() as connection:
+            assert connection.scalar(text("SELECT count(*) FROM t")) == 1
+
+    def test_count_connections(self, tmp_path: Path):
+        metrics = Metrics()
+        engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", **EngineFactory.pool_options(60))
+        EngineFactory.count_connections(engine, metrics, "test")
+
+        def _query():
+            for _ in range(3):
+                with engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+
+        _query()
+        thread = threading.Thread(target=_query)
+        thread.start()
+        thread.join()
+
+        # One connection, every other use reuses it
+        assert metrics.counter("db_connects", database="test").value == 1
+        assert metrics.counter("db_connection_reuses", database="test").value == 5
@@ -0,0 +1,160 @@
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import Engine, select, update
+from sqlalchemy.orm import Session
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.engine_factory import EngineFactory
+from card_automation_server.windsx.db.mirror import AcsMirror
+from card_automation_server.windsx.db.models import NAMES, CARDS
+from card_automation_server.windsx.lookup.person import PersonLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from tests.conftest import location_group_id
+
+
+@pytest.fixture
+def mirror(acs_data_engine: Engine) -> AcsMirror:
+    return AcsMirror(acs_data_engine, EngineFactory.in_memory_sqlite())
+
+
+@pytest.fixture
+def mirrored_lookup_info(acs_data_engine: Engine, mirror: AcsMirror) -> LookupInfo:
+    return LookupInfo(
+        acs_engine=acs_data_engine,
+        location_group_id=location_group_id,
+        updated_callback=Mock(),
+        mirror=mirror,
+    )
+
+
+def _rename_in_acs(engine: Engine, name_id: int, first_name: str):
+    # Straight to the database, like WinDSX would, so the mirror doesn't know about it
+    with Session(engine) as session:
+        session.execute(update(NAMES).where(NAMES.ID == name_id).values(FName=first_name))
+        session.commit()
+
+
+class TestAcsMirror:
+    def test_refresh_copies_tables(self, acs_data_engine: Engine, mirror: AcsMirror):
+        assert not mirror.is_current()
+
+        mirror.refresh()
+
+        assert mirror.is_current()
+        with Session(acs_data_engine) as source, mirror.new_session() as copy:
+            assert copy.scalars(select(CARDS.ID).order_by(CARDS.ID)).all() == \
+                   source.scalars(select(CARDS.ID).order_by(CARDS.ID)).all()
+
+    def test_refresh_replaces_rows(self, acs_data_engine: Engine, mirror: AcsMirror):
+        mirror.refresh()
+        _rename_in_acs(acs_data_engine, 101, "Robert")
+
+        mirror.refresh([NAMES])
+
+        with mirror.new_session() as session:
+            assert session.scalar(select(NAMES.FName).where(NAMES.ID == 101)) == "Robert"
+
+    def test_refresh_records_time(self, acs_data_engine: Engine):
+        metrics = Metrics()
+        mirror = AcsMirror(acs_data_engine, EngineFactory.in_memory_sqlite(), metrics=metrics)
+
+        mirror.refresh()
+
+        assert metrics.histogram("mirror_refresh_seconds").count == 1
+
+    def test_partial_refresh_before_full_is_not_current(self, mirror: AcsMirror):
+        mirror.refresh([NAMES])
+
+        assert not mirror.is_current()
+
+    def test_tables_written_during_refresh_stay_dirty(self, acs_data_engine: Engine, mirror: AcsMirror):
+        mirror.refresh()
+        mirror.mark_dirty([NAMES])
+
+        original_connect = acs_data_engine.connect
+
+        def _connect():
+            # Someone writes again while we're copying
+            mirror.mark_dirty([NAMES])
+            return original_connect()
+
+        acs_data_engine.connect = _connect
+        try:
+            mirror.refresh([NAMES])
+        finally:
+            del acs_data_engine.connect
+
+        assert mirror.dirty_tables() == {NAMES}
+
+    def test_tables_written_stay_dirty_until_committed(self, mirror: AcsMirror, mirrored_lookup_info: LookupInfo):
+        mirror.refresh()
+        person_lookup = PersonLookup(mirrored_lookup_info)
+
+        with mirrored_lookup_info.batch():
+            person = person_lookup.by_id(101)
+            person.first_name = "Robert"
+            person.write()
+
+            # Copied before the write was committed, so this copy doesn't have it
+            mirror.refresh(mirror.dirty_tables())
+
+        assert NAMES in mirror.dirty_tables()
+
+    def test_rolled_back_writes_are_forgotten(self, acs_data_engine: Engine, mirror: AcsMirror):
+        with Session(acs_data_engine) as session:
+            mirror.track_writes(session)
+            session.execute(update(NAMES).where(NAMES.ID == 101).values(FName="Robert"))
+            session.rollback()
+
+        mirror.refresh()
+
+        with acs_data_engine.begin():
+            pass
+
+        assert mirror.is_current()
+
+
+class TestMirroredLookups:
+    def test_reads_from_acs_until_synced(self, acs_data_engine: Engine, mirrored_lookup_info: LookupInfo):
+        _rename_in_acs(acs_data_engine, 101, "Robert")
+
+        assert PersonLookup(mirrored_lookup_info).by_id(101).first_name == "Robert"
+
+    def test_reads_from_mirror_once_synced(self,
+                                           acs_data_engine: Engine,
+                                           mirror: AcsMirror,
+                                           mirrored_lookup_info: LookupInfo):
+        mirror.refresh()
+        _rename_in_acs(acs_data_engine, 101, "Robert")
+
+        # The mirror hasn't heard about the change yet
+        assert PersonLookup(mirrored_lookup_info).by_id(101).first_name == "BobThe"
+
+        mirror.refresh([NAMES])
+
+        assert PersonLookup(mirrored_lookup_info).by_id(101).first_name == "Robert"
+
+    def test_bypass_mirror(self, acs_data_engine: Engine, mirror: AcsMirror, mirrored_lookup_info: LookupInfo):
+        mirror.refresh()
+        _rename_in_acs(acs_data_engine, 101, "Robert")
+
+        with mirrored_lookup_info.bypass_mirror():
+            assert PersonLookup(mirrored_lookup_info).by_id(101).first_name == "Robert"
+        assert PersonLookup(mirrored_lookup_info).by_id(101).first_name == "BobThe"
+
+    def test_reads_own_writes(self, mirror: AcsMirror, mirrored_lookup_info: LookupInfo):
+        mirror.refresh()
+        person_lookup = PersonLookup(mirrored_lookup_info)
+
+        person = person_lookup.by_id(101)
+        person.first_name = "Robert"
+        person.write()
+
+        assert NAMES in mirror.dirty_tables()
+        assert person_lookup.by_id(101).first_name == "Robert"
+
+        mirror.refresh(mirror.dirty_tables())
+
+        assert mirror.is_current()
+        assert person_lookup.by_id(101).first_name == "Robert"
@@ -0,0 +1,80 @@
+import logging
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import Engine, text
+from sqlalchemy.exc import OperationalError
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.engine_factory import EngineFactory
+from card_automation_server.windsx.db.query_stats import instrument_queries, normalize_statement
+from card_automation_server.windsx.lookup.person import PersonLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
+
+_CALLER = f"{__name__}.TestQueryStats._select_one"
+
+
+@pytest.fixture
+def engine() -> Engine:
+    return EngineFactory.in_memory_sqlite()
+
+
+class TestQueryStats:
+    @staticmethod
+    def _select_one(engine: Engine):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    def test_queries_are_attributed_to_the_caller(self, engine: Engine):
+        metrics = Metrics()
+        instrument_queries(engine, metrics, "test")
+
+        self._select_one(engine)
+        self._select_one(engine)
+
+        assert metrics.counter("db_queries", database="test", caller=_CALLER).value == 2
+        assert metrics.histogram("db_query_seconds", database="test", caller=_CALLER).count == 2
+        assert metrics.histogram("db_statement_seconds", database="test", statement="SELECT 1").count == 2
+
+    def test_lookups_are_attributed_through_the_session(self, acs_data_engine: Engine, lookup_info: LookupInfo):
+        metrics = Metrics()
+        instrument_queries(acs_data_engine, metrics, "test")
+
+        PersonLookup(lookup_info).by_id(101)
+
+        callers = {entry["labels"]["caller"] for entry in metrics.snapshot()["db_queries"]}
+        assert "card_automation_server.windsx.lookup.person.PersonLookup.by_id" in callers
+
+    def test_slow_queries_are_logged(self, engine: Engine):
+        logger = Mock(spec=logging.Logger)
+        instrument_queries(engine, Metrics(), "test", logger, slow_query_seconds=0)
+
+        self._select_one(engine)
+
+        logger.warning.assert_called_once()
+        assert "SELECT 1" in logger.warning.call_args.args[0]
+        assert _CALLER in logger.warning.call_args.args[0]
+
+    def test_fast_queries_are_not_logged(self, engine: Engine):
+        logger = Mock(spec=logging.Logger)
+        instrument_queries(engine, Metrics(), "test", logger, slow_query_seconds=60)
+
+        self._select_one(engine)
+
+        logger.warning.assert_not_called()
+
+    def test_failed_queries_are_cleaned_up(self, engine: Engine):
+        metrics = Metrics()
+        instrument_queries(engine, metrics, "test")
+
+        with engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM missing"))
+            connection.execute(text("SELECT 1"))
+
+            assert connection.info["_query_stats"] == []
+
+    def test_normalize_statement(self):
+        assert normalize_statement("SELECT *\n  FROM x WHERE id IN (?, ?, ?)") == "SELECT * FROM x WHERE id IN (?, ...)"
+        assert normalize_statement("SELECT * FROM x WHERE id IN (?,?)") == "SELECT * FROM x WHERE id IN (?, ...)"
+        assert normalize_statement("SELECT * FROM x WHERE id = ?") == "SELECT * FROM x WHERE id = ?"
@@ -0,0 +1,149 @@
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import Engine, select
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.models import LOC
+from card_automation_server.windsx.db.scheduler import DbScheduler, Priority, ScheduledSession
+
+
+def _wait_for_waiters(scheduler: DbScheduler, count: int):
+    deadline = time.monotonic() + 2
+    while len(scheduler._waiting) < count:
+        assert time.monotonic() < deadline, "Threads never started waiting"
+        time.sleep(0.01)
+
+
+class TestDbScheduler:
+    def test_higher_priority_goes_first(self):
+        scheduler = DbScheduler()
+        order: list[Priority] = []
+
+        def _work(priority: Priority):
+            with scheduler.priority(priority):
+                scheduler.acquire()
+                order.append(priority)
+                scheduler.release()
+
+        scheduler.acquire()  # Hold the only slot so everyone queues up
+
+        threads = []
+        for priority in (Priority.BULK, Priority.NORMAL, Priority.INTERACTIVE):
+            thread = threading.Thread(target=_work, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            _wait_for_waiters(scheduler, len(threads))
+
+        scheduler.release()
+        for thread in threads:
+            thread.join(2)
+
+        assert order == [Priority.INTERACTIVE, Priority.NORMAL, Priority.BULK]
+
+    def test_same_thread_is_reentrant(self):
+        scheduler = DbScheduler()
+
+        scheduler.acquire()
+        scheduler.acquire()
+        scheduler.release()
+        scheduler.release()
+
+        with pytest.raises(Exception):
+            scheduler.release()
+
+    def test_max_concurrent(self):
+        scheduler = DbScheduler(max_concurrent=2)
+        acquired = threading.Event()
+
+        def _work():
+            scheduler.acquire()
+            acquired.set()
+            scheduler.release()
+
+        scheduler.acquire()
+        thread = threading.Thread(target=_work)
+        thread.start()
+
+        assert acquired.wait(2)
+        thread.join(2)
+        scheduler.release()
+
+    def test_wait_time_is_recorded_per_priority(self):
+        metrics = Metrics()
+        scheduler = DbScheduler(metrics=metrics)
+
+        with scheduler.priority(Priority.BULK):
+            scheduler.acquire()
+            scheduler.release()
+
+        assert metrics.histogram("db_wait_seconds", database="acs", priority="bulk").count == 1
+        assert metrics.histogram("db_wait_seconds", database="acs", priority="normal").count == 0
+
+    def test_session_holds_slot_for_its_transaction(self, acs_data_engine: Engine):
+        scheduler = DbScheduler()
+
+        with ScheduledSession(acs_data_engine, scheduler) as session:
+            assert len(scheduler._active) == 0  # Nothing until the session is used
+
+            session.scalars(select(LOC)).all()
+            assert len(scheduler._active) == 1
+
+            session.commit()
+            assert len(scheduler._active) == 0
+
+            session.scalars(select(LOC)).all()
+            assert len(scheduler._active) == 1
+
+        assert len(scheduler._active) == 0
+
+    def test_no_limit(self):
+        scheduler = DbScheduler(max_concurrent=None)
+        acquired = threading.Event()
+
+        def _work():
+            scheduler.acquire()
+            acquired.set()
+
+        scheduler.acquire()
+        thread = threading.Thread(target=_work)
+        thread.start()
+
+        assert acquired.wait(2)
+        thread.join(2)
+
+    def test_waiting_too_long_warns_and_goes_ahead(self):
+        logger = Mock()
+        scheduler = DbScheduler(wait_timeout_seconds=0.1, logger=logger)
+        acquired = threading.Event()
+
+        def _work():
+            scheduler.acquire()
+            acquired.set()
+
+        scheduler.acquire()  # Never released, like a session someone forgot to close
+        thread = threading.Thread(target=_work)
+        thread.start()
+
+        assert acquired.wait(2)
+        thread.join(2)
+        logger.warning.assert_called_once()
+        assert len(scheduler._waiting) == 0
+
+    def test_session_closed_on_another_thread(self, acs_data_engine: Engine):
+        scheduler = DbScheduler()
+        session = ScheduledSession(acs_data_engine, scheduler)
+        session.scalars(select(LOC)).all()
+
+        thread = threading.Thread(target=session.close)
+        thread.start()
+        thread.join(2)
+
+        assert len(scheduler._active) == 0
+
+        # This thread can still start a new transaction, and gives it back again
+        with ScheduledSession(acs_data_engine, scheduler) as session:
+            session.scalars(select(LOC)).all()
+        assert len(scheduler._active) == 0
@@ -0,0 +1,105 @@
+from unittest.mock import Mock
+
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.models import CARDS, ACL, LocCards
+from card_automation_server.windsx.lookup.access_audit import AccessAuditor, DiscrepancyKind, AccessDiscrepancy
+from card_automation_server.windsx.lookup.access_card import AccessCardLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from tests.conftest import main_location_id, annex_location_id
+
+
+class TestAccessAuditor:
+    def test_finds_fixture_discrepancies(self, lookup_info: LookupInfo):
+        report = AccessAuditor(lookup_info).audit()
+
+        assert report.cards == 7
+        # 2004 was deactivated without taking its access away
+        assert report.card_ids(DiscrepancyKind.STATUS) == {7}
+        # None of the active cards were ever written, and 2002 has a LocCards row without any access
+        assert report.card_ids(DiscrepancyKind.LOC_CARDS) == {1, 2, 4, 5}
+        # Nobody has created the device groups and ACLs Tenant 2 needs
+        assert report.card_ids(DiscrepancyKind.MISSING_ACL) == {3}
+
+    def test_discrepancy_details(self, lookup_info: LookupInfo):
+        report = AccessAuditor(lookup_info).audit()
+
+        assert AccessDiscrepancy(
+            4, 2001, DiscrepancyKind.LOC_CARDS, main_location_id, frozenset({12}), frozenset(),
+        ) in report.discrepancies
+        assert AccessDiscrepancy(
+            5, 2002, DiscrepancyKind.LOC_CARDS, main_location_id, frozenset(), frozenset({11}),
+        ) in report.discrepancies
+        assert AccessDiscrepancy(
+            1, 3000, DiscrepancyKind.LOC_CARDS, annex_location_id, frozenset({0}), frozenset(),
+        ) in report.discrepancies
+
+    def test_written_cards_are_consistent(self, lookup_info: LookupInfo, access_card_lookup: AccessCardLookup):
+        access_card_lookup.write_many([
+            access_card_lookup.by_card_number(card_number) for card_number in (3000, 200, 2000, 2001, 2002, 2003)
+        ])
+
+        report = AccessAuditor(lookup_info).audit()
+
+        assert report.card_ids() == {7}
+
+    def test_repair(self, lookup_info: LookupInfo, acs_data_session: Session, acs_updated_callback: Mock):
+        auditor = AccessAuditor(lookup_info)
+
+        assert auditor.repair(auditor.audit()) == 6
+        assert auditor.audit().discrepancies == ()
+
+        card = acs_data_session.scalar(select(CARDS).where(CARDS.ID == 7))
+        assert card.Status
+        acs_updated_callback.assert_called()
+
+    def test_temporary_access_is_active(self, lookup_info: LookupInfo, acs_data_session: Session):
+        # 2002 has no access of its own, but is running on 2000's for now
+        card = acs_data_session.scalar(select(CARDS).where(CARDS.ID == 5))
+        card.TempAclGrpComboID = acs_data_session.scalar(select(CARDS.AclGrpComboID).where(CARDS.ID == 3))
+        card.Status = True
+        acs_data_session.commit()
+
+        report = AccessAuditor(lookup_info).audit()
+
+        assert 5 not in report.card_ids()
+
+    def test_repair_nothing(self, lookup_info: LookupInfo, acs_updated_callback: Mock):
+        auditor = AccessAuditor(lookup_info)
+        auditor.repair(auditor.audit())
+        acs_updated_callback.reset_mock()
+
+        assert auditor.repair(auditor.audit()) == 0
+        acs_updated_callback.assert_not_called()
+
+    def test_deleted_acl_is_missing(self,
+                                    lookup_info: LookupInfo,
+                                    access_card_lookup: AccessCardLookup,
+                                    acs_data_session: Session):
+        access_card_lookup.by_card_number(2001).write()
+        acs_data_session.execute(delete(ACL).where(ACL.Acl == 12))
+        acs_data_session.commit()
+
+        report = AccessAuditor(lookup_info).audit()
+
+        assert AccessDiscrepancy(
+            4, 2001, DiscrepancyKind.MISSING_ACL, main_location_id, None, frozenset({12}),
+        ) in report.discrepancies
+
+    def test_extra_loc_cards_acl(self,
+                                 lookup_info: LookupInfo,
+                                 access_card_lookup: AccessCardLookup,
+                                 acs_data_session: Session):
+        access_card_lookup.by_card_number(2001).write()
+        row = acs_data_session.scalar(
+            select(LocCards).where(LocCards.CardID == 4).where(LocCards.Loc == main_location_id)
+        )
+        row.Acl1 = 11
+        acs_data_session.commit()
+
+        report = AccessAuditor(lookup_info).audit()
+
+        assert AccessDiscrepancy(
+            4, 2001, DiscrepancyKind.LOC_CARDS, main_location_id, frozenset({12}), frozenset({11, 12}),
+        ) in report.discrepancies
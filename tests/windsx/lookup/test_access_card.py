@@ -3,11 +3,12 @@ from typing import Optional, Sequence, Union
 from unittest.mock import Mock, call, patch
 
 import pytest
-from sqlalchemy import select
+from sqlalchemy import select, event, Engine, delete
 from sqlalchemy.orm import Session, InstrumentedAttribute, Mapped
 
-from card_automation_server.windsx.db.models import CARDS, DGRP, ACL, LocCards, LOC
+from card_automation_server.windsx.db.models import CARDS, DGRP, ACL, LocCards, LOC, AclGrp, AclGrpCombo
 from card_automation_server.windsx.lookup.access_card import AccessCardLookup, AccessCard, InvalidPersonForAccessCard, ACTIVE_STOP_DATE
+from card_automation_server.windsx.lookup.acl_group_combo import AclGroupNameNotInDatabase
 from card_automation_server.windsx.lookup.person import Person, PersonLookup
 from card_automation_server.windsx.lookup.utils import LookupInfo
 from card_automation_server.workers.events import LocCardUpdated
@@ -121,6 +122,26 @@ class TestAccessCardLookup:
         # If this count is wrong, did you add or remove a card in the test fixture for this location group?
         assert len(access_card_lookup.all()) == 7
 
+    def test_iter_all_reads_a_page_at_a_time(self, access_card_lookup: AccessCardLookup, acs_data_engine: Engine):
+        statements: list[str] = []
+
+        @event.listens_for(acs_data_engine, "before_cursor_execute")
+        def _record(_conn, _cursor, statement, _parameters, _context, _executemany):
+            statements.append(statement)
+
+        try:
+            cards = access_card_lookup.iter_all(page_size=3)
+            first = next(cards)
+            pages_read = sum('FROM "CARDS"' in statement for statement in statements)
+            rest = list(cards)
+        finally:
+            event.remove(acs_data_engine, "before_cursor_execute", _record)
+
+        assert pages_read == 1
+        assert [card.card_number for card in [first, *rest]] == [3000, 200, 2000, 2001, 2002, 2003, 2004]
+        assert sum('FROM "CARDS"' in statement for statement in statements) == 3
+        assert {card.access for card in [first, *rest]} == {card.access for card in access_card_lookup.all()}
+
     def test_with_people_eager_loads_persons(self, access_card_lookup: AccessCardLookup):
         cards = access_card_lookup.with_people().by_card_numbers(3000, 200)
 
@@ -188,6 +209,29 @@ class TestAccessCardLookup:
         # Card 1001 exists but belongs to bad_location_group, so we treat it as not found
         assert access_card_lookup.by_id(1001) is None
 
+    def test_by_ids_returns_multiple_cards(self, access_card_lookup: AccessCardLookup):
+        cards = access_card_lookup.by_ids(1, 2, 5)
+
+        card_map = {c.id: c for c in cards}
+        assert set(card_map.keys()) == {1, 2, 5}
+        assert card_map[1].card_number == 3000
+        assert card_map[1].access == frozenset({_acl_name_master_access_level})
+        assert card_map[5].access == frozenset()
+
+    def test_by_ids_skips_missing_and_bad_location_group(self, access_card_lookup: AccessCardLookup):
+        cards = access_card_lookup.by_ids(1, 1001, 99999)
+
+        assert len(cards) == 1
+        assert cards[0].id == 1
+
+    def test_by_ids_with_people_eager_loads_persons(self, access_card_lookup: AccessCardLookup):
+        cards = access_card_lookup.with_people().by_ids(1, 2)
+
+        with patch('card_automation_server.windsx.lookup.access_card.PersonLookup', side_effect=Exception("should not be called")):
+            card_map = {c.id: c for c in cards}
+            assert card_map[1].person.id == 101
+            assert card_map[2].person.id == 110
+
 
 class TestAccessCardWrite:
     today = datetime.combine(date.today(), datetime.min.time())
@@ -775,3 +819,311 @@ class TestAccessCardWrite:
 
         with pytest.raises(InvalidPersonForAccessCard):
             access_card.write()
+
+
+class TestAccessCardWriteMany:
+    def _new_cards(self, access_card_lookup: AccessCardLookup, person: Person, *card_numbers: int) -> list[AccessCard]:
+        cards = []
+        for card_number in card_numbers:
+            card = access_card_lookup.new(card_number)
+            card.person = person
+            cards.append(card.with_access(_acl_name_main_building_access, _acl_name_tenant_3_access))
+        return cards
+
+    def test_writes_every_card(self,
+                               acs_updated_callback: Mock,
+                               access_card_lookup: AccessCardLookup,
+                               person_lookup: PersonLookup,
+                               db_helper: DbHelper):
+        person: Person = person_lookup.by_name("JaneThe", "BuildingManager").find()[0]
+        cards = self._new_cards(access_card_lookup, person, 9001, 9002, 9003)
+
+        access_card_lookup.write_many(cards)
+
+        assert all(card.in_db for card in cards)
+        for card in access_card_lookup.by_card_numbers(9001, 9002, 9003):
+            assert card.active
+            assert card.access == frozenset({_acl_name_main_building_access, _acl_name_tenant_3_access})
+
+        # The same new set of access levels is one combo shared by every card
+        assert len({db_helper.card_by_id(card.id).AclGrpComboID for card in cards}) == 1
+
+        loc_card_updates = [
+            c.args[0] for c in acs_updated_callback.call_args_list if isinstance(c.args[0], LocCardUpdated)
+        ]
+        assert {(u.card_id, u.location_id) for u in loc_card_updates} == {
+            (card.id, location_id) for card in cards for location_id in (main_location_id, annex_location_id)
+        }
+        assert acs_updated_callback.call_args_list[-3:] == [call(card) for card in cards]
+
+    def test_matches_writing_one_at_a_time(self,
+                                           access_card_lookup: AccessCardLookup,
+                                           person_lookup: PersonLookup,
+                                           db_helper: DbHelper):
+        person: Person = person_lookup.by_name("JaneThe", "BuildingManager").find()[0]
+        [single] = self._new_cards(access_card_lookup, person, 9001)
+        single.write()
+        many = self._new_cards(access_card_lookup, person, 9002, 9003)
+
+        access_card_lookup.write_many(many)
+
+        for location_id in (main_location_id, annex_location_id):
+            expected = db_helper.loc_cards(single.id, location_id, LocCards.Acl)
+            for card in many:
+                loc_cards = db_helper.loc_cards(card.id, location_id, LocCards.Acl)
+                assert (loc_cards.Acl, loc_cards.Acl1, loc_cards.Acl2, loc_cards.Acl3, loc_cards.Acl4) == \
+                       (expected.Acl, expected.Acl1, expected.Acl2, expected.Acl3, expected.Acl4)
+
+    def test_resolves_access_once_per_combo(self,
+                                            access_card_lookup: AccessCardLookup,
+                                            person_lookup: PersonLookup):
+        person: Person = person_lookup.by_name("JaneThe", "BuildingManager").find()[0]
+        cards = self._new_cards(access_card_lookup, person, 9001, 9002, 9003, 9004)
+
+        with patch("card_automation_server.windsx.lookup.access_card._ComboAccessResolver._resolve",
+                   autospec=True, side_effect=lambda resolver, combo_id: {}) as resolve:
+            access_card_lookup.write_many(cards)
+
+        assert resolve.call_count == 1
+
+    def test_combo_deleted_before_write_is_written_again(self,
+                                                         access_card_lookup: AccessCardLookup,
+                                                         person_lookup: PersonLookup,
+                                                         lookup_info: LookupInfo,
+                                                         acs_data_session: Session,
+                                                         db_helper: DbHelper):
+        person: Person = person_lookup.by_name("JaneThe", "BuildingManager").find()[0]
+        [first] = self._new_cards(access_card_lookup, person, 9001)
+        first.write()
+        [second] = self._new_cards(access_card_lookup, person, 9002)
+        combo_id = db_helper.card_by_id(first.id).AclGrpComboID
+
+        # The first card is gone before the second is written, so the compactor deletes the combo as an orphan
+        acs_data_session.execute(delete(CARDS).where(CARDS.ID == first.id))
+        acs_data_session.execute(delete(AclGrpCombo).where(AclGrpCombo.ComboID == combo_id))
+        acs_data_session.commit()
+        lookup_info.invalidate(AclGrpCombo)
+
+        second.write()
+
+        new_combo_id = db_helper.card_by_id(second.id).AclGrpComboID
+        assert new_combo_id != combo_id
+        assert acs_data_session.scalars(
+            select(AclGrpCombo).where(AclGrpCombo.ComboID == new_combo_id)
+        ).all() != []
+        assert access_card_lookup.by_card_number(9002).access == frozenset(
+            {_acl_name_main_building_access, _acl_name_tenant_3_access}
+        )
+
+    def test_looks_people_up_together(self, access_card_lookup: AccessCardLookup, person_lookup: PersonLookup):
+        person: Person = person_lookup.by_name("JaneThe", "BuildingManager").find()[0]
+        cards = self._new_cards(access_card_lookup, person, 9001, 9002, 9003)
+        for card in cards:
+            card.person = person.id  # Only the ID, like a card that was looked up without its person
+
+        with patch.object(PersonLookup, "by_id") as by_id, \
+                patch.object(PersonLookup, "by_ids", autospec=True, side_effect=PersonLookup.by_ids) as by_ids:
+            access_card_lookup.write_many(cards)
+
+        by_id.assert_not_called()
+        assert by_ids.call_count == 1
+        assert all(card.in_db for card in cards)
+
+    def test_bad_person_writes_nothing(self,
+                                       acs_updated_callback: Mock,
+                                       access_card_lookup: AccessCardLookup,
+                                       person_lookup: PersonLookup):
+        person: Person = person_lookup.by_name("JaneThe", "BuildingManager").find()[0]
+        cards = self._new_cards(access_card_lookup, person, 9001, 9002)
+        cards[1].person = 5555  # This ID doesn't exist
+
+        with pytest.raises(InvalidPersonForAccessCard):
+            access_card_lookup.write_many(cards)
+
+        assert not any(card.in_db for card in cards)
+        assert access_card_lookup.by_card_numbers(9001, 9002) == []
+        acs_updated_callback.assert_not_called()
+
+    def test_empty(self, acs_updated_callback: Mock, access_card_lookup: AccessCardLookup):
+        access_card_lookup.write_many([])
+
+        acs_updated_callback.assert_not_called()
+
+
+class TestAccessCardSearch:
+    @staticmethod
+    def _card_numbers(cards: list[AccessCard]) -> set[int]:
+        return {card.card_number for card in cards}
+
+    def test_no_criteria_is_everything(self, access_card_lookup: AccessCardLookup):
+        assert self._card_numbers(access_card_lookup.search().find()) == {3000, 200, 2000, 2001, 2002, 2003, 2004}
+
+    def test_active(self, access_card_lookup: AccessCardLookup):
+        assert self._card_numbers(access_card_lookup.search().active().find()) == {3000, 200, 2000, 2001}
+        assert self._card_numbers(access_card_lookup.search().inactive().find()) == {2002, 2003, 2004}
+
+    def test_having_access(self, access_card_lookup: AccessCardLookup):
+        search = access_card_lookup.search().having_access(_acl_name_main_building_access)
+        assert self._card_numbers(search.find()) == {2000, 2001, 2004}
+
+        search = access_card_lookup.search().having_access(_acl_name_main_building_access, _acl_name_tenant_2_access)
+        assert self._card_numbers(search.find()) == {2000}
+
+    def test_unknown_access_name(self, access_card_lookup: AccessCardLookup):
+        with pytest.raises(AclGroupNameNotInDatabase):
+            access_card_lookup.search().having_access("Not a real access level")
+
+    def test_combined(self, access_card_lookup: AccessCardLookup):
+        cards = access_card_lookup.search().active().having_access(_acl_name_main_building_access).find()
+
+        assert self._card_numbers(cards) == {2000, 2001}
+        assert {card.access for card in cards} == {
+            frozenset({_acl_name_main_building_access}),
+            frozenset({_acl_name_main_building_access, _acl_name_tenant_2_access}),
+        }
+
+    def test_person_and_company(self, access_card_lookup: AccessCardLookup):
+        assert self._card_numbers(access_card_lookup.search().for_company(4).find()) == {2000, 2001, 2002, 2004}
+        assert self._card_numbers(
+            access_card_lookup.search().for_person("Best", "Employee").for_company(4).active().find()
+        ) == {2001}
+        assert self._card_numbers(access_card_lookup.search().for_person(last_name="Key").find()) == {200}
+
+    def test_combo_ids(self, access_card_lookup: AccessCardLookup):
+        assert self._card_numbers(access_card_lookup.search().with_combo_ids(100, 104).find()) == {3000, 200, 2000}
+        assert access_card_lookup.search().with_combo_ids().find() == []
+
+    def test_count(self, access_card_lookup: AccessCardLookup):
+        assert access_card_lookup.search().active().count() == 4
+        assert access_card_lookup.search().for_company(4).having_access(_acl_name_tenant_2_access).count() == 1
+        assert access_card_lookup.search().with_combo_ids().count() == 0
+
+    def test_one_query(self, access_card_lookup: AccessCardLookup, acs_data_engine: Engine):
+        statements: list[str] = []
+
+        @event.listens_for(acs_data_engine, "before_cursor_execute")
+        def _count(_conn, _cursor, statement, _parameters, _context, _executemany):
+            statements.append(statement)
+
+        try:
+            access_card_lookup.search().active().having_access(_acl_name_tenant_2_access).for_company(4).find()
+        finally:
+            event.remove(acs_data_engine, "before_cursor_execute", _count)
+
+        card_queries = [statement for statement in statements if 'FROM "CARDS"' in statement]
+        assert len(card_queries) == 1
+
+    def test_iter_find(self, access_card_lookup: AccessCardLookup):
+        cards = list(access_card_lookup.search().having_access(_acl_name_main_building_access).iter_find(page_size=2))
+
+        assert [card.card_number for card in cards] == [2000, 2001, 2004]
+        assert list(access_card_lookup.search().with_combo_ids().iter_find()) == []
+
+    def test_people_are_loaded_with_people(self, access_card_lookup: AccessCardLookup):
+        cards = access_card_lookup.with_people().search().for_person("ToBe", "Fired").find()
+
+        assert [card.person.last_name for card in cards] == ["Fired"]
+
+
+class TestComboAccessCache:
+    def _write_new_card(self, access_card_lookup: AccessCardLookup, person: Person, card_number: int, *access: str):
+        card = access_card_lookup.new(card_number)
+        card.person = person
+        card.with_access(*access).write()
+        return card
+
+    def test_seen_combo_only_touches_cards_and_loc_cards(self,
+                                                         acs_data_engine: Engine,
+                                                         access_card_lookup: AccessCardLookup,
+                                                         person_lookup: PersonLookup):
+        person: Person = person_lookup.by_name("JaneThe", "BuildingManager").find()[0]
+        first = self._write_new_card(access_card_lookup, person, 9001, _acl_name_tenant_3_access)
+        # The first write added ACL and DGRP rows, so the second one works it out again and caches it
+        self._write_new_card(access_card_lookup, person, 9002, _acl_name_tenant_3_access)
+
+        card = access_card_lookup.by_id(first.id)
+        card.person = person
+        statements: list[str] = []
+
+        def _record(_conn, _cursor, statement: str, *_):
+            statements.append(statement)
+
+        event.listen(acs_data_engine, "before_cursor_execute", _record)
+        try:
+            card.write()
+        finally:
+            event.remove(acs_data_engine, "before_cursor_execute", _record)
+
+        tables = " ".join(statements)
+        for table in ('"AclGrp"', '"DGRP"', '"ACL"', '"AclGrpCombo"'):
+            assert table not in tables
+
+    def test_changed_acl_groups_are_picked_up(self,
+                                              lookup_info: LookupInfo,
+                                              access_card_lookup: AccessCardLookup,
+                                              person_lookup: PersonLookup):
+        person: Person = person_lookup.by_name("JaneThe", "BuildingManager").find()[0]
+        self._write_new_card(access_card_lookup, person, 9001, _acl_name_main_building_access)
+
+        with patch("card_automation_server.windsx.lookup.access_card._ComboAccessResolver._resolve",
+                   autospec=True, return_value={}) as resolve:
+            self._write_new_card(access_card_lookup, person, 9002, _acl_name_main_building_access)
+            resolve.assert_not_called()
+
+            # What the ACS change detector does when someone edits an access level in WinDSX
+            lookup_info.cache.invalidate(AclGrp)
+            self._write_new_card(access_card_lookup, person, 9003, _acl_name_main_building_access)
+            resolve.assert_called_once()
+
+
+class TestRecomputeAccess:
+    _main_building_name_id = 2
+    _tenant_2_name_id = 4
+
+    def _loc_cards_acls(self, session: Session, card_id: int, location_id: int) -> Optional[tuple]:
+        row = session.scalar(select(LocCards).where(LocCards.CardID == card_id).where(LocCards.Loc == location_id))
+        return None if row is None else (row.Acl, row.Acl1, row.Acl2, row.Acl3, row.Acl4, row.DlFlag)
+
+    def test_nothing_changed(self, access_card_lookup: AccessCardLookup, acs_updated_callback: Mock):
+        access_card_lookup.by_card_number(2000).write()
+        acs_updated_callback.reset_mock()
+
+        assert access_card_lookup.recompute_access([self._tenant_2_name_id]) == 0
+        acs_updated_callback.assert_not_called()
+
+    def test_new_door_updates_cards_with_that_access_level(self,
+                                                           access_card_lookup: AccessCardLookup,
+                                                           acs_data_session: Session,
+                                                           acs_updated_callback: Mock):
+        access_card_lookup.by_card_number(2000).write()  # Main Building Access and Tenant 2
+        before = self._loc_cards_acls(acs_data_session, 3, main_location_id)
+        acs_updated_callback.reset_mock()
+
+        acs_data_session.add(AclGrp(ID=50, AclGrpNameID=self._main_building_name_id, Loc=main_location_id, Dev=5, Tz1=1))
+        acs_data_session.commit()
+
+        # 2000, 2001 and 2004 all have Main Building Access
+        assert access_card_lookup.recompute_access([self._main_building_name_id]) == 3
+
+        acs_data_session.expire_all()
+        assert self._loc_cards_acls(acs_data_session, 3, main_location_id) != before
+        updated = {c.args[0].card_id for c in acs_updated_callback.call_args_list}
+        assert updated == {3, 4, 7}
+
+    def test_removed_location_takes_access_away(self,
+                                                access_card_lookup: AccessCardLookup,
+                                                acs_data_session: Session):
+        access_card_lookup.by_card_number(2000).write()
+        assert self._loc_cards_acls(acs_data_session, 3, annex_location_id)[5] == 1
+
+        # Tenant 2 no longer has the annex door
+        acs_data_session.execute(delete(AclGrp).where(AclGrp.ID == 10))
+        acs_data_session.commit()
+
+        assert access_card_lookup.recompute_access([self._tenant_2_name_id]) == 1
+
+        acs_data_session.expire_all()
+        assert self._loc_cards_acls(acs_data_session, 3, annex_location_id) == (-1, -1, -1, -1, -1, 2)
+
+    def test_unused_access_level(self, access_card_lookup: AccessCardLookup):
+        assert access_card_lookup.recompute_access([999]) == 0
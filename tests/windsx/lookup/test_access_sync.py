@@ -0,0 +1,150 @@
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.models import NAMES, UDF
+from card_automation_server.windsx.lookup.access_card import AccessCardLookup, InvalidPersonForAccessCard
+from card_automation_server.windsx.lookup.access_sync import AccessSync, DesiredCard
+from card_automation_server.windsx.lookup.acl_group_combo import AclGroupNameNotInDatabase
+from card_automation_server.windsx.lookup.download_staging import DownloadStager
+from card_automation_server.windsx.lookup.utils import LookupInfo
+
+_master_access_level = "Master Access Level"
+_main_building_access = "Main Building Access"
+_tenant_2 = "Tenant 2"
+_tenant_3 = "Tenant 3"
+
+
+@pytest.fixture
+def access_sync(lookup_info: LookupInfo) -> AccessSync:
+    return AccessSync(lookup_info)
+
+
+def _current_state() -> dict[int, DesiredCard]:
+    # Every card in the test location group, as it already is
+    return {
+        3000: DesiredCard(101, frozenset({_master_access_level})),
+        200: DesiredCard(110, frozenset({_master_access_level})),
+        2000: DesiredCard(402, frozenset({_main_building_access, _tenant_2})),
+        2001: DesiredCard(401, frozenset({_main_building_access})),
+        2002: DesiredCard(403),
+        2003: DesiredCard(303),
+    }
+
+
+class TestAccessSync:
+    def test_nothing_changed(self, access_sync: AccessSync, acs_updated_callback: Mock):
+        report = access_sync.apply(_current_state())
+
+        assert report.changed == 0
+        assert report.unchanged == 6
+        acs_updated_callback.assert_not_called()
+
+    def test_only_changed_cards_are_written(self,
+                                            access_sync: AccessSync,
+                                            access_card_lookup: AccessCardLookup,
+                                            acs_updated_callback: Mock):
+        desired = _current_state()
+        desired[2001] = DesiredCard(401, frozenset({_main_building_access, _tenant_3}))
+        desired["0009999"] = DesiredCard(103, frozenset({_tenant_3}))
+
+        report = access_sync.apply(desired)
+
+        assert report.created == (9999,)
+        assert report.updated == (2001,)
+        assert report.deactivated == ()
+        assert report.unchanged == 5
+
+        written = {c.args[0].card_number for c in acs_updated_callback.call_args_list if hasattr(c.args[0], "card_number")}
+        assert written == {2001, 9999}
+
+        new_card = access_card_lookup.by_card_number(9999)
+        assert new_card.name_id == 103
+        assert new_card.active
+        assert new_card.access == frozenset({_tenant_3})
+        assert access_card_lookup.by_card_number(2001).access == frozenset({_main_building_access, _tenant_3})
+
+    def test_status_that_disagrees_with_access_is_fixed(self,
+                                                        access_sync: AccessSync,
+                                                        access_card_lookup: AccessCardLookup):
+        # 2004 has Main Building Access, but isn't active
+        report = access_sync.apply({2004: DesiredCard(401, frozenset({_main_building_access}))})
+
+        assert report.updated == (2004,)
+        assert access_card_lookup.by_card_number(2004).active
+
+    def test_deactivate_missing(self, access_sync: AccessSync, access_card_lookup: AccessCardLookup):
+        desired = _current_state()
+        del desired[2000]
+
+        report = access_sync.apply(desired, deactivate_missing=True)
+
+        # 2004 has access even though it's inactive, so that gets taken away too
+        assert sorted(report.deactivated) == [2000, 2004]
+        card = access_card_lookup.by_card_number(2000)
+        assert not card.active
+        assert card.access == frozenset()
+
+    def test_deactivate_card_whose_person_is_gone(self,
+                                                  access_sync: AccessSync,
+                                                  access_card_lookup: AccessCardLookup,
+                                                  acs_data_session: Session):
+        acs_data_session.execute(delete(UDF).where(UDF.NameID == 402))
+        acs_data_session.execute(delete(NAMES).where(NAMES.ID == 402))
+        acs_data_session.commit()
+        desired = _current_state()
+        del desired[2000]
+
+        report = access_sync.apply(desired, deactivate_missing=True)
+
+        assert sorted(report.deactivated) == [2000, 2004]
+        assert access_card_lookup.by_card_number(2000).access == frozenset()
+
+    def test_missing_cards_are_left_alone_by_default(self, access_sync: AccessSync):
+        report = access_sync.apply({3000: DesiredCard(101, frozenset({_master_access_level}))})
+
+        assert report.deactivated == ()
+
+    def test_dry_run(self, access_sync: AccessSync, acs_updated_callback: Mock, access_card_lookup: AccessCardLookup):
+        report = access_sync.apply({9999: DesiredCard(103, frozenset({_tenant_3}))}, dry_run=True)
+
+        assert report.created == (9999,)
+        acs_updated_callback.assert_not_called()
+        assert access_card_lookup.by_card_number(9999) is None
+
+    def test_unknown_access_name_writes_nothing(self, access_sync: AccessSync, acs_updated_callback: Mock):
+        with pytest.raises(AclGroupNameNotInDatabase):
+            access_sync.apply({
+                9998: DesiredCard(103, frozenset({_tenant_3})),
+                9999: DesiredCard(103, frozenset({"Not A Real Access Level"})),
+            })
+
+        acs_updated_callback.assert_not_called()
+
+    def test_unknown_person_writes_nothing(self, access_sync: AccessSync, acs_updated_callback: Mock):
+        with pytest.raises(InvalidPersonForAccessCard):
+            access_sync.apply({
+                9998: DesiredCard(103, frozenset({_tenant_3})),
+                9999: DesiredCard(5555, frozenset({_tenant_3})),
+            })
+
+        acs_updated_callback.assert_not_called()
+
+    def test_staged(self,
+                    lookup_info: LookupInfo,
+                    access_card_lookup: AccessCardLookup,
+                    acs_updated_callback: Mock):
+        stager = DownloadStager(lookup_info)
+        desired = _current_state()
+        desired[2001] = DesiredCard(401, frozenset({_main_building_access, _tenant_3}))
+
+        report = AccessSync(lookup_info, stager).apply(desired)
+
+        assert report.updated == (2001,)
+        assert stager.staged == 1
+        acs_updated_callback.assert_not_called()
+
+        stager.release()
+        assert access_card_lookup.by_card_number(2001).access == frozenset({_main_building_access, _tenant_3})
@@ -2,12 +2,13 @@ from typing import List
 from unittest.mock import Mock
 
 import pytest
-from sqlalchemy import Engine, select
+from sqlalchemy import Engine, select, event
 from sqlalchemy.orm import Session
 
 from card_automation_server.windsx.db.models import AclGrpCombo
 from card_automation_server.windsx.lookup.acl_group_combo import AclGroupComboSet, AclGroupNameNotInCombo, \
     AclGroupNameNotInDatabase, AclGroupComboLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
 from tests.conftest import acs_data_engine
 
 # These names are in the AclGrpName table
@@ -177,6 +178,50 @@ class TestAclGroupComboLookup:
         assert not acl_group_combo.in_db
 
 
+class TestComboIndex:
+    def test_duplicate_combo_resolves_to_lowest_id(self,
+                                                    acs_data_session: Session,
+                                                    lookup_info: LookupInfo,
+                                                    acl_group_combo_lookup: AclGroupComboLookup):
+        # Another "Main Building" + "Tenant 1" combo, with its rows out of order and interleaved with 102's
+        acs_data_session.add_all([
+            AclGrpCombo(ID=120, AclGrpNameID=3, ComboID=90, LocGrp=lookup_info.location_group_id),
+            AclGrpCombo(ID=121, AclGrpNameID=2, ComboID=90, LocGrp=lookup_info.location_group_id),
+        ])
+        acs_data_session.commit()
+
+        combo = acl_group_combo_lookup.by_names(_tenant_1, _main_building_access)
+
+        assert combo.id == 90
+
+    def test_resolving_names_reuses_the_index(self,
+                                              acs_data_engine: Engine,
+                                              acl_group_combo_lookup: AclGroupComboLookup):
+        acl_group_combo_lookup.by_names(_main_building_access)
+
+        statements: list[str] = []
+
+        def _record(_conn, _cursor, statement: str, *_):
+            statements.append(statement)
+
+        event.listen(acs_data_engine, "before_cursor_execute", _record)
+        try:
+            combo = acl_group_combo_lookup.by_names(_main_building_access).with_names(_tenant_2).without_names(_tenant_2)
+        finally:
+            event.remove(acs_data_engine, "before_cursor_execute", _record)
+
+        assert combo.id == 101
+        assert statements == []
+
+    def test_written_combo_is_found_by_names(self, acl_group_combo_lookup: AclGroupComboLookup):
+        assert not acl_group_combo_lookup.by_names(_tenant_1, _tenant_2).in_db
+
+        written = acl_group_combo_lookup.by_names(_tenant_1, _tenant_2)
+        written.write()
+
+        assert acl_group_combo_lookup.by_names(_tenant_2, _tenant_1).id == written.id
+
+
 class TestAclGroupComboWrite:
     def test_writing_non_existent_acl_combo_to_db(self,
                                                   acl_group_combo_lookup: AclGroupComboLookup,
@@ -0,0 +1,115 @@
+from unittest.mock import Mock
+
+import pytest
+from sqlalchemy import Engine, event, select
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.models import LOC, NAMES
+from card_automation_server.windsx.lookup.person import PersonLookup
+from card_automation_server.windsx.lookup.timezone import TimezoneLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from tests.conftest import main_location_id, annex_location_id
+
+
+class TestBatch:
+    def test_writes_share_one_transaction(self, lookup_info: LookupInfo, timezone_lookup: TimezoneLookup):
+        with lookup_info.batch():
+            first = timezone_lookup.new()
+            first.name = "First"
+            first.write()
+
+            second = timezone_lookup.new()
+            second.name = "Second"
+            second.write()
+
+        # The second write saw the first one's number was taken, even though it wasn't committed yet
+        assert (first.tz_number, second.tz_number) == (4, 5)
+        assert {tz.name for tz in timezone_lookup.all()} >= {"First", "Second"}
+
+    def test_callbacks_wait_for_commit(self,
+                                       lookup_info: LookupInfo,
+                                       person_lookup: PersonLookup,
+                                       acs_updated_callback: Mock):
+        with lookup_info.batch():
+            person = person_lookup.by_id(101)
+            person.first_name = "Robert"
+            person.write()
+
+            acs_updated_callback.assert_not_called()
+            assert person_lookup.by_id(101).first_name == "Robert"
+
+        acs_updated_callback.assert_called_once_with(person)
+
+    def test_rolls_back_on_error(self,
+                                 lookup_info: LookupInfo,
+                                 person_lookup: PersonLookup,
+                                 acs_updated_callback: Mock,
+                                 acs_data_engine: Engine):
+        with pytest.raises(RuntimeError):
+            with lookup_info.batch():
+                person = person_lookup.by_id(101)
+                person.first_name = "Robert"
+                person.write()
+                raise RuntimeError("Something went wrong")
+
+        acs_updated_callback.assert_not_called()
+        with Session(acs_data_engine) as session:
+            assert session.scalar(select(NAMES.FName).where(NAMES.ID == 101)) == "BobThe"
+
+    def test_nested_batches_join_the_outer_one(self,
+                                               lookup_info: LookupInfo,
+                                               person_lookup: PersonLookup,
+                                               acs_updated_callback: Mock):
+        with lookup_info.batch():
+            with lookup_info.batch():
+                person = person_lookup.by_id(101)
+                person.first_name = "Robert"
+                person.write()
+
+            acs_updated_callback.assert_not_called()
+
+        acs_updated_callback.assert_called_once_with(person)
+
+    def test_locations_flagged_once(self,
+                                    lookup_info: LookupInfo,
+                                    timezone_lookup: TimezoneLookup,
+                                    acs_data_engine: Engine,
+                                    acs_data_session: Session):
+        loc_updates: list[str] = []
+
+        def _count(_conn, _cursor, statement: str, *_):
+            if statement.startswith("UPDATE \"LOC\"") or statement.startswith("UPDATE LOC"):
+                loc_updates.append(statement)
+
+        event.listen(acs_data_engine, "before_cursor_execute", _count)
+        try:
+            with lookup_info.batch():
+                for name in ("First", "Second", "Third"):
+                    tz = timezone_lookup.new()
+                    tz.name = name
+                    tz.write()
+        finally:
+            event.remove(acs_data_engine, "before_cursor_execute", _count)
+
+        assert len(loc_updates) == 1
+        for location in acs_data_session.scalars(select(LOC).where(LOC.Loc.in_([main_location_id, annex_location_id]))):
+            acs_data_session.refresh(location)
+            assert location.PlFlag
+            assert location.TzCs == 0
+            assert location.DlFlag == 1
+
+    def test_invalidated_tables_dropped_again_on_rollback(self, lookup_info: LookupInfo):
+        loads: list[int] = []
+
+        def _load() -> int:
+            loads.append(1)
+            return len(loads)
+
+        with pytest.raises(RuntimeError):
+            with lookup_info.batch():
+                lookup_info.invalidate(LOC)
+                # Cached from inside the transaction that's about to be rolled back
+                assert lookup_info.cache.get("test", [LOC], _load) == 1
+                raise RuntimeError("Something went wrong")
+
+        assert lookup_info.cache.get("test", [LOC], _load) == 2
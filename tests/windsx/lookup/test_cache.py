@@ -0,0 +1,93 @@
+from unittest.mock import Mock
+
+from sqlalchemy.orm import Session
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.db.models import LOC, DEV, HOL
+from card_automation_server.windsx.lookup.acl_group_combo import AclGroupComboLookup
+from card_automation_server.windsx.lookup.cache import ReferenceDataCache, invalidates, tables_written_by
+from card_automation_server.windsx.lookup.door_lookup import DoorLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.events import AcsTablesChanged
+from card_automation_server.workers.reference_data_invalidator import ReferenceDataInvalidator
+from tests.conftest import main_location_id
+
+
+class TestReferenceDataCache:
+    def test_loads_once(self):
+        metrics = Metrics()
+        cache = ReferenceDataCache(metrics)
+        loader = Mock(return_value=(1, 2))
+
+        assert cache.get("locations", [LOC], loader) == (1, 2)
+        assert cache.get("locations", [LOC], loader) == (1, 2)
+
+        loader.assert_called_once()
+        assert metrics.counter("reference_cache_misses", key="locations").value == 1
+        assert metrics.counter("reference_cache_hits", key="locations").value == 1
+
+    def test_invalidate_only_drops_entries_using_the_table(self):
+        cache = ReferenceDataCache()
+        locations = Mock(return_value=(1, 2))
+        doors = Mock(return_value=(3,))
+        cache.get("locations", [LOC], locations)
+        cache.get("doors", [DEV, LOC], doors)
+
+        cache.invalidate(DEV)
+        cache.get("locations", [LOC], locations)
+        cache.get("doors", [DEV, LOC], doors)
+        assert locations.call_count == 1
+        assert doors.call_count == 2
+
+        cache.invalidate_all()
+        cache.get("locations", [LOC], locations)
+        assert locations.call_count == 2
+
+    def test_load_racing_an_invalidation_is_not_kept(self):
+        cache = ReferenceDataCache()
+
+        def _loader():
+            cache.invalidate(LOC)  # Someone wrote while we were loading
+            return (1,)
+
+        assert cache.get("locations", [LOC], _loader) == (1,)
+        loader = Mock(return_value=(1, 2))
+        assert cache.get("locations", [LOC], loader) == (1, 2)
+
+    def test_invalidates_decorator(self):
+        @invalidates(HOL)
+        class _Written:
+            pass
+
+        class _Subclass(_Written):
+            pass
+
+        assert tables_written_by(_Written()) == (HOL,)
+        assert tables_written_by(_Subclass()) == (HOL,)
+        assert tables_written_by(object()) == ()
+
+
+class TestLookupInfoCache:
+    def test_location_ids(self, lookup_info: LookupInfo):
+        assert main_location_id in lookup_info.location_ids()
+
+    def test_our_writes_invalidate(self, lookup_info: LookupInfo, acs_updated_callback: Mock):
+        combos = AclGroupComboLookup(lookup_info)
+        combo = combos.by_names("Tenant 1", "Tenant 2")
+        assert not combo.in_db
+
+        combo.write()
+        acs_updated_callback.assert_called_once_with(combo)
+
+        # The new combo is found, even though the combos were cached before it was written
+        assert combos.by_names("Tenant 1", "Tenant 2").id == combo.id
+
+    def test_database_updates_invalidate(self, lookup_info: LookupInfo, acs_data_session: Session):
+        assert DoorLookup(lookup_info).by_device_info(main_location_id, 99) is None
+
+        acs_data_session.add(DEV(ID=99, Loc=main_location_id, Device=99, Name='New Door'))
+        acs_data_session.commit()
+        assert DoorLookup(lookup_info).by_device_info(main_location_id, 99) is None  # Still cached
+
+        ReferenceDataInvalidator(lookup_info)._handle_event(AcsTablesChanged(tables=frozenset({DEV})))
+        assert DoorLookup(lookup_info).by_device_info(main_location_id, 99).name == 'New Door'
@@ -0,0 +1,80 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.models import AclGrpCombo, ACL, DGRP, LOC, LocCards, CARDS, AclName
+from card_automation_server.windsx.lookup.access_card import AccessCardLookup
+from card_automation_server.windsx.lookup.compaction import AccessCompactor, CompactionReport
+from card_automation_server.windsx.lookup.person import PersonLookup
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from tests.conftest import main_location_id, annex_location_id, bad_location_group
+
+
+class TestAccessCompactor:
+    def test_deletes_orphans(self, lookup_info: LookupInfo, acs_data_session: Session):
+        report = AccessCompactor(lookup_info).compact()
+
+        # Combos 102, 106, 108, 109, 110 and 201 aren't on any card
+        assert report == CompactionReport(combos=6, acls=1, device_groups=3)
+        assert set(acs_data_session.scalars(
+            select(AclGrpCombo.ComboID).where(AclGrpCombo.LocGrp == lookup_info.location_group_id)
+        ).all()) == {100, 101, 104}
+        # ACL 10 had no LocCards, and so DGrp 2 was only used by an orphan
+        assert set(acs_data_session.scalars(select(ACL.Acl)).all()) == {11, 12}
+        assert set(acs_data_session.scalars(select(DGRP.DGrp)).all()) == {1, 3}
+
+    def test_other_location_groups_are_left_alone(self, lookup_info: LookupInfo, acs_data_session: Session):
+        AccessCompactor(lookup_info).compact()
+
+        assert set(acs_data_session.scalars(
+            select(AclGrpCombo.ComboID).where(AclGrpCombo.LocGrp == bad_location_group)
+        ).all()) == {200, 202}
+
+    def test_flags_locations_for_download(self, lookup_info: LookupInfo, acs_data_session: Session):
+        AccessCompactor(lookup_info).compact()
+
+        main_building = acs_data_session.get(LOC, main_location_id)
+        assert main_building.PlFlag
+        assert main_building.AclCs == 0
+        assert main_building.DGrpCs == 0
+        assert main_building.DlFlag == 2
+
+        annex = acs_data_session.get(LOC, annex_location_id)
+        assert annex.PlFlag
+        assert annex.DGrpCs == 0
+
+    def test_small_batches(self, lookup_info: LookupInfo):
+        report = AccessCompactor(lookup_info, batch_size=2).compact()
+
+        assert report == CompactionReport(combos=6, acls=1, device_groups=3)
+
+    def test_nothing_left_the_second_time(self, lookup_info: LookupInfo):
+        AccessCompactor(lookup_info).compact()
+
+        assert AccessCompactor(lookup_info).compact().deleted == 0
+
+    def test_cards_still_written_after(self,
+                                       lookup_info: LookupInfo,
+                                       access_card_lookup: AccessCardLookup,
+                                       person_lookup: PersonLookup,
+                                       acs_data_session: Session):
+        AccessCompactor(lookup_info).compact()
+
+        # Needs the Tenant 1 combo and device group that were just deleted
+        card = access_card_lookup.new(9999)
+        card.person = person_lookup.by_id(103)
+        card.with_access("Tenant 1").write()
+
+        assert card.access == frozenset({"Tenant 1"})
+        assert acs_data_session.scalars(select(LocCards).where(LocCards.CardID == card.id)).all()
+
+    def test_temporary_access_and_acl_names_are_in_use(self, lookup_info: LookupInfo, acs_data_session: Session):
+        acs_data_session.get(CARDS, 5).TempAclGrpComboID = 102
+        acs_data_session.add(AclName(ID=1, Loc=main_location_id, Acl=10, Name="Lobby", AclGrpComboID=106))
+        acs_data_session.commit()
+
+        report = AccessCompactor(lookup_info).compact()
+
+        # 102 is someone's temporary access and 106 is on the AclName, ACL 10 has a name, so DGrp 2 is still used
+        assert report == CompactionReport(combos=4, acls=0, device_groups=2)
+        assert {102, 106} <= set(acs_data_session.scalars(select(AclGrpCombo.ComboID)).all())
+        assert 10 in set(acs_data_session.scalars(select(ACL.Acl)).all())
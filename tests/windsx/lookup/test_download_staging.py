@@ -0,0 +1,97 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.windsx.lookup.access_card import AccessCardLookup
+from card_automation_server.windsx.lookup.download_staging import DownloadStager
+from card_automation_server.windsx.lookup.utils import LookupInfo
+
+_tenant_3 = "Tenant 3"
+
+
+def _written(acs_updated_callback: Mock) -> list[int]:
+    return [c.args[0].card_number for c in acs_updated_callback.call_args_list if hasattr(c.args[0], "card_number")]
+
+
+class TestDownloadStager:
+    def test_nothing_written_until_released(self,
+                                            lookup_info: LookupInfo,
+                                            access_card_lookup: AccessCardLookup,
+                                            acs_updated_callback: Mock):
+        metrics = Metrics()
+        stager = DownloadStager(lookup_info, metrics)
+        stager.stage(*(access_card_lookup.by_card_number(n).with_access(_tenant_3) for n in (2000, 2001, 2002)))
+
+        assert stager.staged == 3
+        assert metrics.gauge("download_staging_backlog").value == 3
+        acs_updated_callback.assert_not_called()
+
+        assert stager.release(2) == 2
+        assert _written(acs_updated_callback) == [2000, 2001]
+        assert stager.staged == 1
+        assert metrics.histogram("download_staging_wait_seconds").count == 2
+
+        assert stager.release() == 1
+        assert stager.release() == 0
+        assert _tenant_3 in access_card_lookup.by_card_number(2002).access
+        assert metrics.gauge("download_staging_backlog").value == 0
+
+    def test_restaging_keeps_its_place(self, lookup_info: LookupInfo, access_card_lookup: AccessCardLookup):
+        stager = DownloadStager(lookup_info)
+        stager.stage(access_card_lookup.by_card_number(2000), access_card_lookup.by_card_number(2001))
+        stager.stage(access_card_lookup.by_card_number(2000).with_access(_tenant_3))
+
+        assert stager.staged == 2
+        stager.release(1)
+        assert _tenant_3 in access_card_lookup.by_card_number(2000).access
+
+    def test_write_now_jumps_the_queue(self,
+                                       lookup_info: LookupInfo,
+                                       access_card_lookup: AccessCardLookup,
+                                       acs_updated_callback: Mock):
+        stager = DownloadStager(lookup_info)
+        stager.stage(access_card_lookup.by_card_number(2001).with_access(_tenant_3))
+
+        card = access_card_lookup.by_card_number(2001)
+        stager.write_now(card.without_access(*card.access))
+
+        assert stager.staged == 0
+        assert _written(acs_updated_callback) == [2001]
+        # The staged copy was dropped, so it can't give the access back later
+        stager.release()
+        assert access_card_lookup.by_card_number(2001).access == frozenset()
+
+    def test_any_write_drops_the_staged_copy(self, lookup_info: LookupInfo, access_card_lookup: AccessCardLookup):
+        stager = DownloadStager(lookup_info)
+        stager.stage(access_card_lookup.by_card_number(2001).with_access(_tenant_3))
+
+        card = access_card_lookup.by_card_number(2001)
+        card.without_access(*card.access).write()
+
+        assert stager.staged == 0
+
+    def test_restaged_during_a_wave_is_kept(self, lookup_info: LookupInfo, access_card_lookup: AccessCardLookup):
+        stager = DownloadStager(lookup_info)
+        stager.stage(access_card_lookup.by_card_number(2000))
+        write_many = AccessCardLookup.write_many
+
+        def _restage(lookup: AccessCardLookup, cards: list):
+            stager.stage(access_card_lookup.by_card_number(2000).with_access(_tenant_3))
+            write_many(lookup, cards)
+
+        with patch.object(AccessCardLookup, "write_many", _restage):
+            stager.release()
+
+        assert stager.staged == 1
+
+    def test_failed_wave_is_put_back(self, lookup_info: LookupInfo, access_card_lookup: AccessCardLookup):
+        stager = DownloadStager(lookup_info)
+        stager.stage(access_card_lookup.by_card_number(2000), access_card_lookup.by_card_number(2001))
+
+        with patch.object(AccessCardLookup, "write_many", side_effect=RuntimeError("Database is locked")):
+            with pytest.raises(RuntimeError):
+                stager.release()
+
+        assert stager.staged == 2
+        assert stager.release() == 2
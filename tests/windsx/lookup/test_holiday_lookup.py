@@ -32,6 +32,12 @@ class TestHolidayLookup:
         dates = {h.date for h in holidays}
         assert dates == {date(2026, 7, 4), date(2026, 12, 25)}
 
+    def test_iter_all_matches_all(self, holiday_lookup: HolidayLookup):
+        holidays = list(holiday_lookup.iter_all(page_size=1))
+
+        assert [h.date for h in holidays] == [date(2026, 7, 4), date(2026, 12, 25)]
+        assert [(h.name, h.slot) for h in holidays] == [(h.name, h.slot) for h in holiday_lookup.all()]
+
     def test_by_date_returns_holiday_with_expected_fields(self, holiday_lookup: HolidayLookup):
         holiday = holiday_lookup.by_date(date(2026, 12, 25))
 
@@ -167,6 +167,18 @@ class TestPersonLookup:
         person = people[0]
         self._assert_ray_securitay(person)
 
+    def test_iter_find_everyone(self, person_lookup: PersonLookup):
+        people = list(person_lookup.iter_find(page_size=3))
+
+        assert [p.id for p in people] == sorted(p.id for p in person_lookup.find())
+        self._assert_bob_the_building_manager([p for p in people if p.id == 101][0])
+
+    def test_iter_find_with_criteria(self, person_lookup: PersonLookup):
+        people = list(person_lookup.by_udf("ID").iter_find(page_size=2))
+
+        assert [p.id for p in people] == [101, 110, 201]
+        assert list(person_lookup.by_udf("ID", "No one").iter_find()) == []
+
     def test_lookup_by_invalid_id(self, person_lookup: PersonLookup):
         assert person_lookup.by_id(5555) is None
 
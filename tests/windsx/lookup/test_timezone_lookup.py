@@ -26,6 +26,12 @@ class TestTimezoneLookup:
         tz_numbers = {tz.tz_number for tz in timezones}
         assert tz_numbers == {1, 2, 3}
 
+    def test_iter_all_matches_all(self, timezone_lookup: TimezoneLookup):
+        timezones = list(timezone_lookup.iter_all(page_size=2))
+
+        assert [tz.tz_number for tz in timezones] == [1, 2, 3]
+        assert [tz.name for tz in timezones] == [tz.name for tz in timezone_lookup.all()]
+
     def test_by_tz_returns_timezone_with_expected_fields(self, timezone_lookup: TimezoneLookup):
         tz = timezone_lookup.by_tz(2)
 
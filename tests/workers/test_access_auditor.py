@@ -0,0 +1,81 @@
+import time
+from datetime import timedelta
+from unittest.mock import Mock, call, patch
+
+from card_automation_server.windsx.lookup.access_audit import AccessAuditReport, AccessDiscrepancy, DiscrepancyKind
+from card_automation_server.workers.access_auditor import AccessAuditWorker
+
+_report = AccessAuditReport(cards=10, discrepancies=(
+    AccessDiscrepancy(4, 2001, DiscrepancyKind.LOC_CARDS, 3, frozenset({12}), frozenset()),
+    AccessDiscrepancy(7, 2004, DiscrepancyKind.STATUS),
+))
+
+
+def _run(config: Mock, auditor: Mock):
+    worker = AccessAuditWorker(config, auditor)
+    with patch("card_automation_server.workers.access_auditor._AUDIT_INTERVAL", timedelta(milliseconds=10)):
+        worker.start()
+        deadline = time.monotonic() + 2
+        while not auditor.audit.called:
+            assert time.monotonic() < deadline, "Never audited"
+            time.sleep(0.01)
+        worker.stop(2)
+
+
+class TestAccessAuditWorker:
+    def test_logs_discrepancies(self):
+        config = Mock()
+        config.windsx.repair_access_discrepancies = False
+        auditor = Mock()
+        auditor.audit.return_value = _report
+
+        _run(config, auditor)
+
+        config.logger.warning.assert_has_calls([
+            call("Access audit of 10 card(s) found 2 out of step (1 status, 1 loc_cards)"),
+            call("Card 2001: loc_cards at location 3, expected [12], found []"),
+            call("Card 2004: status"),
+        ])
+        auditor.repair.assert_not_called()
+
+    def test_repairs_when_configured(self):
+        config = Mock()
+        config.windsx.repair_access_discrepancies = True
+        auditor = Mock()
+        auditor.audit.return_value = _report
+        auditor.repair.return_value = 2
+
+        _run(config, auditor)
+
+        auditor.repair.assert_called_with(_report)
+        config.logger.info.assert_called_with("Repaired 2 card(s)")
+
+    def test_consistent_is_quiet(self):
+        config = Mock()
+        config.windsx.repair_access_discrepancies = True
+        auditor = Mock()
+        auditor.audit.return_value = AccessAuditReport(cards=10, discrepancies=())
+
+        _run(config, auditor)
+
+        config.logger.warning.assert_not_called()
+        auditor.repair.assert_not_called()
+
+    def test_errors_are_logged(self):
+        config = Mock()
+        auditor = Mock()
+        error = RuntimeError("Database is locked")
+        auditor.audit.side_effect = error
+
+        _run(config, auditor)
+
+        config.logger.exception.assert_called_with(error)
+
+    def test_does_not_audit_at_startup(self):
+        auditor = Mock()
+        worker = AccessAuditWorker(Mock(), auditor)
+
+        worker.start()
+        worker.stop(2)
+
+        auditor.audit.assert_not_called()
@@ -0,0 +1,125 @@
+import logging
+from unittest.mock import Mock, call
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.models import AclGrp, AclGrpName
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.access_recomputer import AccessRecomputer
+from card_automation_server.workers.events import AclDefinitionsChanged, AcsDatabaseUpdated
+from tests.conftest import main_location_id
+
+
+@pytest.fixture
+def access_card_lookup() -> Mock:
+    access_card_lookup = Mock()
+    access_card_lookup.recompute_access.return_value = 0
+    return access_card_lookup
+
+
+@pytest.fixture
+def recomputer(lookup_info: LookupInfo, access_card_lookup: Mock) -> AccessRecomputer:
+    config = Mock()
+    config.logger = logging.getLogger("test_access_recomputer")
+
+    # Driven by hand, it's never started
+    recomputer = AccessRecomputer(config, lookup_info, access_card_lookup)
+    recomputer._pre_run()
+    return recomputer
+
+
+def _definitions_changed(recomputer: AccessRecomputer):
+    recomputer._handle_event(AclDefinitionsChanged())
+    recomputer._post_event()
+
+
+class TestAccessRecomputer:
+    def test_nothing_changed(self, recomputer: AccessRecomputer, access_card_lookup: Mock):
+        _definitions_changed(recomputer)
+
+        access_card_lookup.recompute_access.assert_not_called()
+
+    def test_changed_access_level(self,
+                                  recomputer: AccessRecomputer,
+                                  access_card_lookup: Mock,
+                                  acs_data_session: Session):
+        # Tenant 1 gets another door
+        acs_data_session.add(AclGrp(ID=50, AclGrpNameID=3, Loc=main_location_id, Dev=5, Tz1=1))
+        acs_data_session.commit()
+
+        _definitions_changed(recomputer)
+
+        access_card_lookup.recompute_access.assert_called_once_with(frozenset({3}))
+
+    def test_changed_timezone(self,
+                              recomputer: AccessRecomputer,
+                              access_card_lookup: Mock,
+                              acs_data_session: Session):
+        acs_data_session.execute(update(AclGrp).where(AclGrp.ID == 6).values(Tz1=1))
+        acs_data_session.commit()
+
+        _definitions_changed(recomputer)
+
+        access_card_lookup.recompute_access.assert_called_once_with(frozenset({4}))
+
+    def test_made_master(self,
+                         recomputer: AccessRecomputer,
+                         access_card_lookup: Mock,
+                         acs_data_session: Session):
+        acs_data_session.execute(update(AclGrpName).where(AclGrpName.ID == 5).values(IsMaster=True))
+        acs_data_session.commit()
+
+        _definitions_changed(recomputer)
+
+        access_card_lookup.recompute_access.assert_called_once_with(frozenset({5}))
+
+    def test_only_recomputes_once(self,
+                                  recomputer: AccessRecomputer,
+                                  access_card_lookup: Mock,
+                                  acs_data_session: Session):
+        acs_data_session.add(AclGrp(ID=50, AclGrpNameID=3, Loc=main_location_id, Dev=5, Tz1=1))
+        acs_data_session.commit()
+
+        _definitions_changed(recomputer)
+        _definitions_changed(recomputer)
+
+        access_card_lookup.recompute_access.assert_called_once()
+
+    def test_failed_recompute_is_retried(self,
+                                         recomputer: AccessRecomputer,
+                                         access_card_lookup: Mock,
+                                         acs_data_session: Session):
+        acs_data_session.add(AclGrp(ID=50, AclGrpNameID=3, Loc=main_location_id, Dev=5, Tz1=1))
+        acs_data_session.commit()
+        access_card_lookup.recompute_access.side_effect = [Exception("Database is locked"), 1]
+
+        _definitions_changed(recomputer)
+        _definitions_changed(recomputer)
+
+        assert access_card_lookup.recompute_access.call_args_list == [call(frozenset({3}))] * 2
+
+    def test_checked_on_any_database_update(self,
+                                            recomputer: AccessRecomputer,
+                                            access_card_lookup: Mock,
+                                            acs_data_session: Session):
+        # An in-place edit the change detector might not report
+        acs_data_session.execute(update(AclGrp).where(AclGrp.ID == 6).values(Tz1=1))
+        acs_data_session.commit()
+
+        recomputer._handle_event(AcsDatabaseUpdated())
+        recomputer._post_event()
+
+        access_card_lookup.recompute_access.assert_called_once_with(frozenset({4}))
+
+    def test_checked_on_a_timer(self,
+                                recomputer: AccessRecomputer,
+                                access_card_lookup: Mock,
+                                acs_data_session: Session):
+        acs_data_session.execute(update(AclGrp).where(AclGrp.ID == 6).values(Tz1=1))
+        acs_data_session.commit()
+
+        recomputer._call_after_time[0].callback()
+
+        access_card_lookup.recompute_access.assert_called_once_with(frozenset({4}))
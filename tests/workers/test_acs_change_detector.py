@@ -0,0 +1,91 @@
+import logging
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy.orm import Session
+
+from card_automation_server.windsx.db.models import LocCards, LOC, DEV, AclGrpName
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.acs_change_detector import AcsChangeDetector
+from card_automation_server.workers.events import AcsDatabaseUpdated, AcsTablesChanged, LocCardsChanged, \
+    AclDefinitionsChanged, WorkerEvent
+from tests.conftest import main_location_id, location_group_id
+
+
+@pytest.fixture
+def change_detector(lookup_info: LookupInfo) -> AcsChangeDetector:
+    config = Mock()
+    config.logger = logging.getLogger("test_acs_change_detector")
+
+    # Driven by hand, it's never started
+    detector = AcsChangeDetector(config, lookup_info)
+    detector._pre_run()
+    return detector
+
+
+def _detect(detector: AcsChangeDetector) -> list[WorkerEvent]:
+    detector._handle_event(AcsDatabaseUpdated())
+    detector._post_event()
+
+    events = []
+    while not detector.outbound_queue.empty():
+        events.append(detector.outbound_queue.get())
+    return events
+
+
+class TestAcsChangeDetector:
+    def test_nothing_changed(self, change_detector: AcsChangeDetector):
+        assert _detect(change_detector) == []
+
+    def test_loc_cards_dl_flag(self, change_detector: AcsChangeDetector, acs_data_session: Session):
+        loc_card = acs_data_session.get(LocCards, 900)
+        loc_card.DlFlag = 1
+        acs_data_session.commit()
+
+        events = _detect(change_detector)
+
+        assert events[0] == AcsTablesChanged(tables=frozenset({LocCards}))
+        assert [type(e) for e in events[1:]] == [LocCardsChanged]
+
+        # Only reported once
+        assert _detect(change_detector) == []
+
+    def test_location_needs_download(self, change_detector: AcsChangeDetector, acs_data_session: Session):
+        location = acs_data_session.get(LOC, main_location_id)
+        location.PlFlag = True
+        acs_data_session.commit()
+
+        assert _detect(change_detector) == [AcsTablesChanged(tables=frozenset({LOC}))]
+
+    def test_new_rows(self, change_detector: AcsChangeDetector, acs_data_session: Session):
+        acs_data_session.add(DEV(ID=99, Loc=main_location_id, Device=99, Name='New Door'))
+        acs_data_session.add(AclGrpName(ID=99, LocGrp=location_group_id, Name='New Group'))
+        acs_data_session.commit()
+
+        events = _detect(change_detector)
+
+        assert events[0] == AcsTablesChanged(tables=frozenset({DEV, AclGrpName}))
+        assert [type(e) for e in events[1:]] == [AclDefinitionsChanged]
+
+    def test_edits_in_place(self, change_detector: AcsChangeDetector, acs_data_session: Session):
+        acs_data_session.get(AclGrpName, 2).Name = 'Main Building (Renamed)'
+        acs_data_session.commit()
+
+        events = _detect(change_detector)
+
+        assert events[0] == AcsTablesChanged(tables=frozenset({AclGrpName}))
+        assert [type(e) for e in events[1:]] == [AclDefinitionsChanged]
+        assert _detect(change_detector) == []
+
+    def test_failed_check_is_retried(self, change_detector: AcsChangeDetector, acs_data_session: Session):
+        acs_data_session.get(LOC, main_location_id).PlFlag = True
+        acs_data_session.commit()
+
+        change_detector._log = Mock()
+        with patch.object(change_detector, "_take_fingerprints", side_effect=Exception("Database is locked")):
+            assert _detect(change_detector) == []
+        change_detector._log.exception.assert_called_once()
+
+        # Nothing new came in, the next loop tries again by itself
+        change_detector._post_event()
+        assert change_detector.outbound_queue.get_nowait() == AcsTablesChanged(tables=frozenset({LOC}))
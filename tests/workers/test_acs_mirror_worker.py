@@ -0,0 +1,77 @@
+import logging
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy import Engine
+
+from card_automation_server.windsx.db.engine_factory import EngineFactory
+from card_automation_server.windsx.db.mirror import AcsMirror
+from card_automation_server.windsx.db.models import NAMES, CARDS, LocGrp
+from card_automation_server.workers.acs_mirror_worker import AcsMirrorWorker
+from card_automation_server.workers.events import AcsTablesChanged
+
+
+@pytest.fixture
+def mirror(acs_data_engine: Engine) -> AcsMirror:
+    return AcsMirror(acs_data_engine, EngineFactory.in_memory_sqlite())
+
+
+@pytest.fixture
+def mirror_worker(mirror: AcsMirror) -> AcsMirrorWorker:
+    config = Mock()
+    config.logger = logging.getLogger("test_acs_mirror_worker")
+
+    # Driven by hand, it's never started
+    return AcsMirrorWorker(config, mirror)
+
+
+class TestAcsMirrorWorker:
+    def test_full_refresh_on_start(self, mirror: AcsMirror, mirror_worker: AcsMirrorWorker):
+        mirror_worker._pre_run()
+
+        assert mirror.is_current()
+
+    def test_failed_start_retries(self, mirror: AcsMirror, mirror_worker: AcsMirrorWorker):
+        with patch.object(mirror, "refresh", side_effect=Exception("Database is locked")):
+            mirror_worker._pre_run()
+
+        assert not mirror.is_current()
+
+        mirror_worker._post_event()
+
+        assert mirror.is_current()
+
+    def test_refreshes_changed_tables(self, mirror: AcsMirror, mirror_worker: AcsMirrorWorker):
+        mirror_worker._pre_run()
+
+        with patch.object(mirror, "refresh") as refresh:
+            # LocGrp isn't mirrored, nothing reads it
+            mirror_worker._handle_event(AcsTablesChanged(frozenset({NAMES, LocGrp})))
+            mirror_worker._post_event()
+
+        refresh.assert_called_once_with({NAMES})
+
+    def test_waits_for_writes_to_settle(self, mirror: AcsMirror, mirror_worker: AcsMirrorWorker):
+        mirror_worker._pre_run()
+        mirror.mark_dirty([CARDS])
+
+        with patch.object(mirror, "refresh") as refresh:
+            mirror_worker._post_event()
+            refresh.assert_not_called()
+
+            with patch.object(mirror, "seconds_since_last_write", return_value=60):
+                mirror_worker._post_event()
+
+        refresh.assert_called_once_with({CARDS})
+
+    def test_refreshes_everything_periodically(self, mirror: AcsMirror, mirror_worker: AcsMirrorWorker):
+        mirror_worker._pre_run()
+
+        with patch.object(mirror, "refresh") as refresh:
+            mirror_worker._post_event()
+            refresh.assert_not_called()
+
+            mirror_worker._call_after_time[0].callback()
+            mirror_worker._post_event()
+
+        refresh.assert_called_once_with(None)
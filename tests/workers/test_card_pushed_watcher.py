@@ -1,16 +1,20 @@
+from datetime import timedelta
 from typing import Generator, Protocol
+from unittest.mock import patch
 
 import pytest
 from sqlalchemy import select, Engine
 from sqlalchemy.orm import Session
 
 from card_automation_server.config import Config
+from card_automation_server.metrics import Metrics
+from card_automation_server.plugins.types import CommServerEventType
 from card_automation_server.windsx.db.models import LocCards
 from card_automation_server.windsx.lookup.access_card import AccessCardLookup
 from card_automation_server.windsx.lookup.utils import LookupInfo
 from card_automation_server.workers.card_pushed_watcher import CardPushedWatcher
-from card_automation_server.workers.events import AcsDatabaseUpdated, AccessCardUpdated, AccessCardPushed, \
-    LocCardUpdated
+from card_automation_server.workers.events import LocCardsChanged, AccessCardUpdated, AccessCardPushed, \
+    LocCardUpdated, RawCommServerMessage, RawCommServerEvent, DownloadBacklogExceeded
 from tests.conftest import acs_data_session, main_location_id, bad_main_location_id
 
 
@@ -28,6 +32,11 @@ def card_pushed_watcher(
     worker.stop(timeout=3)
 
 
+def _raw_comm_server_event(event_type: int) -> RawCommServerEvent:
+    # Only the event type matters to this worker, everything else is filler.
+    return RawCommServerMessage.parse(f"1 48 {main_location_id} 0 -1 0 {event_type} 0 0 1 2025 1 2 3 4 5").event
+
+
 class EmptyCallable(Protocol):
     def __call__(self, timeout: int = ..., /) -> bool:
         pass
@@ -54,7 +63,7 @@ class TestCardPushedWatcher:
         assert card_pushed_watcher.outbound_queue.empty()
 
         # Just to get an initial lay of the land, worker shouldn't do anything with this
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         assert outbound_event_queue_empty()
 
@@ -79,7 +88,7 @@ class TestCardPushedWatcher:
         acs_data_session.commit()
 
         # The card has been updated, but not written to the hardware yet
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         assert outbound_event_queue_empty()
 
@@ -90,7 +99,7 @@ class TestCardPushedWatcher:
         acs_data_session.commit()
 
         # The card has been written to the hardware
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         assert not outbound_event_queue_empty()
 
@@ -127,7 +136,7 @@ class TestCardPushedWatcher:
         acs_data_session.commit()
 
         # The card has been updated, but not written to the hardware yet
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         assert outbound_event_queue_empty()
 
@@ -137,7 +146,7 @@ class TestCardPushedWatcher:
         acs_data_session.commit()
 
         # The card has been written to the hardware
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         assert not outbound_event_queue_empty()
 
@@ -183,7 +192,7 @@ class TestCardPushedWatcher:
         acs_data_session.commit()
 
         # The card has been written to the hardware
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         assert not outbound_event_queue_empty()
 
@@ -228,7 +237,7 @@ class TestCardPushedWatcher:
         acs_data_session.commit()
 
         # The card has been written to the hardware
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         assert not outbound_event_queue_empty()
 
@@ -241,7 +250,7 @@ class TestCardPushedWatcher:
         assert event.access_card.card_number == 2002
 
         # What happens if we get a second database updated event
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         # We should get no new events
         assert outbound_event_queue_empty()
@@ -277,7 +286,129 @@ class TestCardPushedWatcher:
         acs_data_session.commit()
 
         # The card has been written to the hardware
-        card_pushed_watcher.event(AcsDatabaseUpdated())
+        card_pushed_watcher.event(LocCardsChanged())
 
         assert card_pushed_watcher.outbound_queue.qsize() == 0
         assert outbound_event_queue_empty()
+
+    @pytest.mark.long
+    def test_download_complete_event_notifies_without_database_update(self,
+                                                                      acs_data_session: Session,
+                                                                      card_pushed_watcher: CardPushedWatcher,
+                                                                      outbound_event_queue_empty: EmptyCallable):
+        loc_cards: LocCards = acs_data_session.scalar(
+            select(LocCards).where(LocCards.ID == 900)
+        )
+        loc_cards.DlFlag = 1
+        acs_data_session.add(loc_cards)
+        acs_data_session.commit()
+
+        card_pushed_watcher.event(LocCardUpdated(
+            id=900,
+            card_id=5,
+            location_id=main_location_id
+        ))
+
+        assert outbound_event_queue_empty()
+
+        acs_data_session.refresh(loc_cards)
+        loc_cards.DlFlag = 0
+        acs_data_session.add(loc_cards)
+        acs_data_session.commit()
+
+        # Access granted has nothing to do with downloads, so the worker shouldn't re-query for it
+        card_pushed_watcher.event(_raw_comm_server_event(CommServerEventType.ACCESS_GRANTED))
+
+        assert outbound_event_queue_empty()
+
+        card_pushed_watcher.event(_raw_comm_server_event(CommServerEventType.BROADCAST_DOWNLOAD_COMPLETE))
+
+        assert not outbound_event_queue_empty()
+
+        card_pushed_watcher.stop(3)
+
+        assert card_pushed_watcher.outbound_queue.qsize() == 1
+
+        event: AccessCardPushed = card_pushed_watcher.outbound_queue.get()
+        assert isinstance(event, AccessCardPushed)
+        assert event.access_card.id == 5
+
+    @pytest.mark.long
+    def test_bursts_of_events_are_coalesced(self,
+                                            card_pushed_watcher: CardPushedWatcher,
+                                            outbound_event_queue_empty: EmptyCallable):
+        with patch.object(card_pushed_watcher, "_bring_in_new_cards") as bring_in_new_cards:
+            # Stop the worker from picking events up until they're all queued
+            with card_pushed_watcher._inbound_event_queue.mutex:  # noqa
+                for _ in range(10):
+                    card_pushed_watcher._inbound_event_queue.queue.append(LocCardsChanged())  # noqa
+                    card_pushed_watcher._inbound_event_queue.unfinished_tasks += 1  # noqa
+            card_pushed_watcher._wake_event.set()  # noqa
+
+            assert outbound_event_queue_empty()
+
+        assert bring_in_new_cards.call_count == 1
+
+    def test_push_latency_and_backlog_are_tracked(self,
+                                                  app_config: Config,
+                                                  acs_data_engine: Engine,
+                                                  lookup_info: LookupInfo,
+                                                  acs_data_session: Session):
+        app_config.windsx.download_backlog_threshold = 0
+        metrics = Metrics()
+        # Driven by hand so we know exactly when each event has been processed
+        worker = CardPushedWatcher(app_config, lookup_info, metrics)
+
+        loc_cards: LocCards = acs_data_session.scalar(
+            select(LocCards).where(LocCards.ID == 900)
+        )
+        loc_cards.DlFlag = 1
+        acs_data_session.commit()
+
+        worker._handle_event(LocCardUpdated(id=900, card_id=5, location_id=main_location_id))
+        worker._post_event()
+
+        assert worker.pending_downloads[main_location_id] == 1
+        assert worker.download_eta(main_location_id) is None  # Nothing pushed yet to estimate from
+        assert worker.download_rate(main_location_id) is None
+        assert metrics.gauge("pending_downloads", location=main_location_id).value == 1
+
+        backlog = worker.outbound_queue.get_nowait()
+        assert isinstance(backlog, DownloadBacklogExceeded)
+        assert backlog.location_id == main_location_id
+        assert backlog.pending == 1
+
+        loc_cards.DlFlag = 0
+        acs_data_session.commit()
+        worker._handle_event(LocCardsChanged())
+        worker._post_event()
+
+        assert isinstance(worker.outbound_queue.get_nowait(), AccessCardPushed)
+        assert worker.pending_downloads[main_location_id] == 0
+        assert worker.download_eta(main_location_id) == timedelta()
+        assert metrics.histogram("card_push_latency_seconds", location=main_location_id).count == 1
+        assert worker.outbound_queue.empty()  # Backlog event isn't repeated
+
+    def test_latency_only_counts_loc_cards_we_heard_written(self,
+                                                            app_config: Config,
+                                                            lookup_info: LookupInfo,
+                                                            acs_data_session: Session):
+        metrics = Metrics()
+        worker = CardPushedWatcher(app_config, lookup_info, metrics)
+
+        loc_cards: LocCards = acs_data_session.scalar(select(LocCards).where(LocCards.ID == 900))
+        loc_cards.DlFlag = 1
+        acs_data_session.commit()
+
+        # Someone else wrote it, we only found it pending, so we don't know how long it's been waiting
+        worker._handle_event(LocCardsChanged())
+        worker._post_event()
+        assert worker.pending_downloads[main_location_id] == 1
+
+        loc_cards.DlFlag = 0
+        acs_data_session.commit()
+        worker._handle_event(LocCardsChanged())
+        worker._post_event()
+
+        assert worker.pending_downloads[main_location_id] == 0
+        assert metrics.histogram("card_push_latency_seconds", location=main_location_id).count == 0
@@ -8,6 +8,7 @@ from card_automation_server.config import Config
 from ioc import Resolver
 from card_automation_server.plugins.types import CommServerEventType
 from card_automation_server.windsx.db.models import EvnLog
+from card_automation_server.windsx.lookup.utils import LookupInfo
 from card_automation_server.workers.card_scan_watcher import CardScanWatcher
 from card_automation_server.workers.events import CardScanned, LogDatabaseUpdated, RawCommServerEvent, \
     RawCommServerMessage
@@ -20,7 +21,8 @@ def card_scan_watcher(
         # These aren't used directly, but are type hinted for the resolver's sake
         app_config: Config,
         acs_data_engine: Engine,
-        log_engine: Engine
+        log_engine: Engine,
+        lookup_info: LookupInfo,
 ):
     watcher = resolver.singleton(CardScanWatcher)
 
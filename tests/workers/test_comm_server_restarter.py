@@ -0,0 +1,117 @@
+import logging
+from unittest.mock import Mock, patch, MagicMock
+
+import psutil
+import pytest
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.workers.comm_server_restarter import CommServerRestarter
+from card_automation_server.workers.events import CommServerRestartRequested
+
+
+def _process(name: str = 'CS.exe', pid: int = 100) -> MagicMock:
+    process = MagicMock(psutil.Process)
+    process.pid = pid
+    process.info = {'name': name}
+    process.is_running.return_value = True
+    process.status.return_value = psutil.STATUS_RUNNING
+    return process
+
+
+@pytest.fixture
+def metrics() -> Metrics:
+    return Metrics()
+
+
+@pytest.fixture
+def restarter(metrics: Metrics) -> CommServerRestarter:
+    config = Mock()
+    config.logger = logging.getLogger("test_comm_server_restarter")
+    config.windsx.root = "C:\\WinDSX"
+
+    # The worker is driven by hand, it's never started
+    return CommServerRestarter(config, metrics)
+
+
+@pytest.fixture
+def psutil_mock():
+    with patch("card_automation_server.workers.comm_server_restarter.psutil") as mock:
+        mock.NoSuchProcess = psutil.NoSuchProcess
+        mock.TimeoutExpired = psutil.TimeoutExpired
+        mock.STATUS_ZOMBIE = psutil.STATUS_ZOMBIE
+        yield mock
+
+
+@pytest.fixture
+def popen_mock():
+    with patch("card_automation_server.workers.comm_server_restarter.subprocess.Popen") as mock:
+        mock.return_value.pid = 200
+        yield mock
+
+
+class TestCommServerRestarter:
+    def test_finds_running_comm_server_case_insensitive(self,
+                                                        restarter: CommServerRestarter,
+                                                        psutil_mock: MagicMock,
+                                                        popen_mock: MagicMock):
+        cs = _process(name='CS.EXE')
+        psutil_mock.process_iter.return_value = [_process(name='explorer.exe', pid=1), cs]
+
+        restarter._pre_event()
+
+        assert restarter._process is cs
+        popen_mock.assert_not_called()
+
+    def test_watches_the_handle_instead_of_scanning(self,
+                                                    restarter: CommServerRestarter,
+                                                    psutil_mock: MagicMock,
+                                                    popen_mock: MagicMock):
+        psutil_mock.process_iter.return_value = [_process()]
+
+        for _ in range(5):
+            restarter._pre_event()
+
+        assert psutil_mock.process_iter.call_count == 1
+        popen_mock.assert_not_called()
+
+    def test_exit_is_restarted_immediately(self,
+                                           restarter: CommServerRestarter,
+                                           psutil_mock: MagicMock,
+                                           popen_mock: MagicMock,
+                                           metrics: Metrics):
+        cs = _process()
+        psutil_mock.process_iter.return_value = [cs]
+        restarter._pre_event()
+
+        cs.is_running.return_value = False
+        restarter._pre_event()
+
+        popen_mock.assert_called_once()
+        psutil_mock.Process.assert_called_once_with(200)
+        assert restarter._process is psutil_mock.Process.return_value
+        assert metrics.counter("comm_server_restarts").value == 1
+        assert metrics.histogram("comm_server_downtime_seconds").count == 1
+
+    def test_starts_comm_server_when_not_running(self,
+                                                 restarter: CommServerRestarter,
+                                                 psutil_mock: MagicMock,
+                                                 popen_mock: MagicMock):
+        psutil_mock.process_iter.return_value = [_process(name='explorer.exe')]
+
+        restarter._pre_event()
+
+        popen_mock.assert_called_once()
+
+    def test_restart_request_terminates_tracked_process(self,
+                                                        restarter: CommServerRestarter,
+                                                        psutil_mock: MagicMock,
+                                                        popen_mock: MagicMock):
+        cs = _process()
+        psutil_mock.process_iter.return_value = [cs]
+        restarter._pre_event()
+
+        restarter._handle_event(CommServerRestartRequested())
+
+        cs.terminate.assert_called_once()
+        cs.wait.assert_called_once()
+        popen_mock.assert_called_once()
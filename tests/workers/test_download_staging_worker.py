@@ -0,0 +1,67 @@
+from unittest.mock import Mock
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.workers.download_staging_worker import DownloadStagingWorker
+
+
+def _watcher(pending: dict[int, int], rates: dict[int, float]) -> Mock:
+    watcher = Mock()
+    watcher.pending_downloads = pending
+    watcher.download_rate.side_effect = rates.get
+    return watcher
+
+
+class TestDownloadStagingWorker:
+    def test_probes_without_a_rate(self):
+        worker = DownloadStagingWorker(Mock(), Mock(), _watcher({1: 0, 2: 0}, {}))
+
+        assert worker.wave_size() == 50
+
+    def test_stalled_locations_are_skipped(self):
+        # Location 2 has a backlog and nothing has got through to it recently
+        worker = DownloadStagingWorker(Mock(), Mock(), _watcher({1: 0, 2: 5000}, {1: 4.0}))
+
+        assert worker.wave_size() == 60
+
+    def test_sized_to_the_slowest_location(self):
+        # 15 second waves, location 2 does 2 a second and still has 10 pending
+        worker = DownloadStagingWorker(Mock(), Mock(), _watcher({1: 0, 2: 10}, {1: 10.0, 2: 2.0}))
+
+        assert worker.wave_size() == 20
+
+    def test_backlog_still_gets_the_smallest_wave(self):
+        worker = DownloadStagingWorker(Mock(), Mock(), _watcher({1: 500}, {1: 1.0}))
+
+        assert worker.wave_size() == 10
+
+    def test_releases_waves_and_one_more_on_stop(self):
+        config = Mock()
+        stager = Mock()
+        stager.staged = 100
+        stager.release.return_value = 30
+        metrics = Metrics()
+
+        worker = DownloadStagingWorker(config, stager, _watcher({1: 0}, {1: 2.0}), metrics)
+        worker._release_wave()
+
+        stager.release.assert_called_with(30)
+        assert metrics.gauge("download_staging_wave_size").value == 30
+
+        stager.release.reset_mock()
+        worker._keep_running.set()  # Stopping before the thread gets to a regular wave
+        worker.start()
+        worker.stop(2)
+
+        stager.release.assert_called_once_with(30)
+        config.logger.info.assert_called_with("Wrote 30 staged card(s) before stopping")
+        config.logger.warning.assert_called_with(
+            "100 staged card(s) weren't written before stopping and are lost, run the sync again to write them"
+        )
+
+    def test_nothing_staged(self):
+        stager = Mock()
+        stager.staged = 0
+
+        DownloadStagingWorker(Mock(), stager, _watcher({1: 0}, {}))._release_wave()
+
+        stager.release.assert_not_called()
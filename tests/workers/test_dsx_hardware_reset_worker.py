@@ -0,0 +1,189 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Generator
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from card_automation_server.metrics import Metrics
+from card_automation_server.plugins.types import CommServerEventType
+from card_automation_server.windsx.db.models import LocCards, LOC
+from card_automation_server.windsx.lookup.utils import LookupInfo
+from card_automation_server.workers.dsx_hardware_reset_worker import DSXHardwareResetWorker
+from card_automation_server.workers.events import CommServerRestartRequested, RawCommServerMessage, \
+    RawCommServerEvent
+from tests.conftest import main_location_id, bad_main_location_id
+
+
+@pytest.fixture
+def metrics() -> Metrics:
+    return Metrics()
+
+
+@pytest.fixture
+def reset_worker(lookup_info: LookupInfo, metrics: Metrics) -> Generator[DSXHardwareResetWorker, None, None]:
+    config = Mock()
+    config.logger = logging.getLogger("test_dsx_hardware_reset_worker")
+    config.dsxpi.host = "http://dsxpi"
+    config.dsxpi.secret = "secret"
+
+    # The worker is driven by hand, it's never started
+    yield DSXHardwareResetWorker(config, lookup_info, metrics)
+
+
+@pytest.fixture
+def pending_loc_cards(acs_data_session: Session) -> None:
+    for loc_card in acs_data_session.scalars(select(LocCards).where(LocCards.ID.in_([900, 901]))):
+        loc_card.DlFlag = 1
+    acs_data_session.commit()
+
+
+def _raw_comm_server_event(event_type: int, location_id: int = main_location_id) -> RawCommServerEvent:
+    return RawCommServerMessage.parse(f"1 48 {location_id} 0 -1 0 {event_type} 0 0 1 2025 1 2 3 4 5").event
+
+
+def _restarts_requested(worker: DSXHardwareResetWorker) -> int:
+    count = 0
+    while not worker.outbound_queue.empty():
+        assert isinstance(worker.outbound_queue.get(), CommServerRestartRequested)
+        count += 1
+    return count
+
+
+class TestDSXHardwareResetWorker:
+    def test_nothing_pending_does_nothing(self, reset_worker: DSXHardwareResetWorker):
+        reset_worker._sync_locations_pending()
+        reset_worker._check_for_stalls(datetime.now() + timedelta(hours=1))
+
+        assert _restarts_requested(reset_worker) == 0
+
+    def test_slow_progress_is_not_a_stall(self,
+                                          reset_worker: DSXHardwareResetWorker,
+                                          pending_loc_cards: None,
+                                          acs_data_session: Session):
+        reset_worker._sync_locations_pending()
+
+        # One of the two LocCards went out, so the location is still moving
+        loc_card = acs_data_session.get(LocCards, 900)
+        loc_card.DlFlag = 0
+        acs_data_session.commit()
+
+        reset_worker._sync_locations_pending()
+        reset_worker._check_for_stalls(datetime.now() + timedelta(seconds=60))
+
+        assert _restarts_requested(reset_worker) == 0
+
+    def test_download_events_count_as_progress(self,
+                                               reset_worker: DSXHardwareResetWorker,
+                                               pending_loc_cards: None):
+        reset_worker._sync_locations_pending()
+
+        later = datetime.now() + timedelta(seconds=80)
+        with patch("card_automation_server.workers.dsx_hardware_reset_worker.datetime") as mock_datetime:
+            mock_datetime.now.return_value = later
+            reset_worker._handle_event(_raw_comm_server_event(CommServerEventType.STARTING_INCREMENTAL_DOWNLOAD))
+
+        reset_worker._check_for_stalls(later + timedelta(seconds=60))
+
+        assert _restarts_requested(reset_worker) == 0
+
+    def test_stall_restarts_comm_server_before_resetting_hardware(self,
+                                                                  reset_worker: DSXHardwareResetWorker,
+                                                                  pending_loc_cards: None,
+                                                                  metrics: Metrics):
+        reset_worker._sync_locations_pending()
+        now = datetime.now()
+
+        with patch("card_automation_server.workers.dsx_hardware_reset_worker.requests") as mock_requests:
+            # First we only ask for the comm server to restart
+            reset_worker._check_for_stalls(now + timedelta(minutes=2))
+            assert _restarts_requested(reset_worker) == 1
+            mock_requests.post.assert_not_called()
+
+            # It gets some time to sort itself out
+            reset_worker._check_for_stalls(now + timedelta(minutes=3))
+            assert _restarts_requested(reset_worker) == 0
+            mock_requests.post.assert_not_called()
+
+            # Still stuck, so now the hardware gets reset
+            reset_worker._check_for_stalls(now + timedelta(minutes=6))
+            assert _restarts_requested(reset_worker) == 1
+            mock_requests.post.assert_called_once()
+
+        assert metrics.counter("download_stalls", location=main_location_id).value == 1
+        assert metrics.counter("download_stall_recoveries", kind="comm_server").value == 2
+        assert metrics.counter("download_stall_recoveries", kind="hardware").value == 1
+
+    def test_location_without_communication_is_not_stalled(self,
+                                                           reset_worker: DSXHardwareResetWorker,
+                                                           pending_loc_cards: None):
+        reset_worker._sync_locations_pending()
+        reset_worker._handle_event(_raw_comm_server_event(CommServerEventType.LOCATION_COMMUNICATION_LOSS))
+
+        reset_worker._check_for_stalls(datetime.now() + timedelta(minutes=5))
+        assert _restarts_requested(reset_worker) == 0
+
+        reset_worker._handle_event(_raw_comm_server_event(CommServerEventType.LOCATION_COMMUNICATION_RESTORAL))
+        reset_worker._check_for_stalls(datetime.now() + timedelta(minutes=5))
+        assert _restarts_requested(reset_worker) == 1
+
+    def test_other_location_groups_are_ignored(self, reset_worker: DSXHardwareResetWorker, acs_data_session: Session):
+        acs_data_session.get(LOC, bad_main_location_id).PlFlag = True
+        acs_data_session.commit()
+
+        reset_worker._sync_locations_pending()
+        reset_worker._check_for_stalls(datetime.now() + timedelta(minutes=5))
+
+        assert _restarts_requested(reset_worker) == 0
+
+    def test_silent_location_at_startup_is_not_stalled(self,
+                                                       reset_worker: DSXHardwareResetWorker,
+                                                       pending_loc_cards: None):
+        # The test locations have never communicated
+        reset_worker._pre_run()
+        reset_worker._sync_locations_pending()
+
+        reset_worker._check_for_stalls(datetime.now() + timedelta(minutes=5))
+        assert _restarts_requested(reset_worker) == 0
+
+        reset_worker._handle_event(_raw_comm_server_event(CommServerEventType.LOCATION_COMMUNICATION_RESTORAL))
+        reset_worker._check_for_stalls(datetime.now() + timedelta(minutes=5))
+        assert _restarts_requested(reset_worker) == 1
+
+    def test_communicating_location_at_startup_is_checked(self,
+                                                          reset_worker: DSXHardwareResetWorker,
+                                                          pending_loc_cards: None,
+                                                          acs_data_session: Session):
+        acs_data_session.get(LOC, main_location_id).LastComm = datetime.now()
+        acs_data_session.commit()
+
+        reset_worker._pre_run()
+        reset_worker._sync_locations_pending()
+        reset_worker._check_for_stalls(datetime.now() + timedelta(minutes=5))
+
+        assert _restarts_requested(reset_worker) == 1
+
+    def test_stops_escalating_when_reset_does_not_help(self,
+                                                       reset_worker: DSXHardwareResetWorker,
+                                                       pending_loc_cards: None):
+        reset_worker._sync_locations_pending()
+        now = datetime.now()
+
+        with patch("card_automation_server.workers.dsx_hardware_reset_worker.requests") as mock_requests:
+            reset_worker._check_for_stalls(now + timedelta(minutes=2))
+            reset_worker._check_for_stalls(now + timedelta(minutes=6))
+            assert _restarts_requested(reset_worker) == 2
+            mock_requests.post.assert_called_once()
+
+            # Still stuck long after the reset, so it's treated as offline instead of being reset forever
+            reset_worker._check_for_stalls(now + timedelta(minutes=20))
+            reset_worker._check_for_stalls(now + timedelta(minutes=40))
+            assert _restarts_requested(reset_worker) == 0
+            mock_requests.post.assert_called_once()
+
+        # Until it starts moving again
+        reset_worker._handle_event(_raw_comm_server_event(CommServerEventType.STARTING_INCREMENTAL_DOWNLOAD))
+        reset_worker._check_for_stalls(datetime.now() + timedelta(minutes=5))
+        assert _restarts_requested(reset_worker) == 1
@@ -0,0 +1,41 @@
+from unittest.mock import Mock
+
+from card_automation_server.windsx.lookup.compaction import CompactionReport
+from card_automation_server.workers.orphaned_access_cleaner import OrphanedAccessCleaner
+
+
+class TestOrphanedAccessCleaner:
+    def test_compacts_and_logs(self):
+        config = Mock()
+        compactor = Mock()
+        compactor.compact.return_value = CompactionReport(combos=2, acls=1, device_groups=1)
+
+        worker = OrphanedAccessCleaner(config, compactor)
+        worker.start()
+        worker.stop(2)
+
+        compactor.compact.assert_called()
+        config.logger.info.assert_called_with("Cleaned up 2 unused combo(s), 1 ACL(s) and 1 device group(s)")
+
+    def test_nothing_to_clean_is_quiet(self):
+        config = Mock()
+        compactor = Mock()
+        compactor.compact.return_value = CompactionReport()
+
+        worker = OrphanedAccessCleaner(config, compactor)
+        worker.start()
+        worker.stop(2)
+
+        config.logger.info.assert_not_called()
+
+    def test_errors_are_logged(self):
+        config = Mock()
+        compactor = Mock()
+        error = RuntimeError("Database is locked")
+        compactor.compact.side_effect = error
+
+        worker = OrphanedAccessCleaner(config, compactor)
+        worker.start()
+        worker.stop(2)
+
+        config.logger.exception.assert_called_with(error)
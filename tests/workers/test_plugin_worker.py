@@ -1,15 +1,15 @@
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 
 import pytest
 
 from card_automation_server.plugins.interfaces import PluginStartup, PluginShutdown, PluginCardScanned, PluginLoop, \
-    PluginCardDataPushed
+    PluginCardDataPushed, PluginDownloadBacklogExceeded
 from card_automation_server.plugins.types import CardScan, CommServerEventType
 from card_automation_server.windsx.lookup.access_card import AccessCard, AccessCardLookup
-from card_automation_server.workers.events import AccessCardPushed, CardScanned
+from card_automation_server.workers.events import AccessCardPushed, CardScanned, DownloadBacklogExceeded
 from tests.conftest import PluginWorkerFactory, main_location_id
 
 
@@ -104,6 +104,24 @@ class TestPluginWorker:
         assert plugin.called.wait(1)
         assert plugin.access_card is access_card
 
+    def test_download_backlog_exceeded(self, plugin_worker_factory: PluginWorkerFactory):
+        class _Backlog(HasAssertableFlag, PluginDownloadBacklogExceeded):
+            def __init__(self):
+                super().__init__()
+                self.backlog: Optional[tuple[int, int, Optional[timedelta]]] = None
+
+            def download_backlog_exceeded(self, location_id: int, pending: int, eta: Optional[timedelta]) -> None:
+                self.called.set()
+                self.backlog = (location_id, pending, eta)
+
+        plugin = _Backlog()
+        worker = plugin_worker_factory(plugin)
+
+        worker.event(DownloadBacklogExceeded(location_id=main_location_id, pending=600, eta=timedelta(minutes=5)))
+
+        assert plugin.called.wait(1)
+        assert plugin.backlog == (main_location_id, 600, timedelta(minutes=5))
+
     @pytest.mark.long  # This test takes ~7 seconds if successful, ~15 worst case if unsuccessful.
     def test_loop_timing(self, plugin_worker_factory: PluginWorkerFactory):
         class _Loop(HasAssertableFlag, PluginLoop):